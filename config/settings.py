@@ -109,5 +109,67 @@ else:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
     DEFAULT_FROM_EMAIL = 'PCOD GirlCare <onboarding@resend.dev>'
 
+# Batched delivery (tracker.mailer): messages per SMTP session, and reconnect-and-retry
+# attempts per message on transient SMTP errors.
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', '50'))
+EMAIL_SEND_RETRIES = int(os.environ.get('EMAIL_SEND_RETRIES', '2'))
+# Provider quota in messages/second shared by all sender threads (default 0 = unlimited; set it
+# to your plan's quota, see REMINDERS.md), and the backoff retry list for transient failures:
+# retries per message and base delay in seconds.
+EMAIL_RATE_LIMIT = float(os.environ.get('EMAIL_RATE_LIMIT', '0'))
+EMAIL_RETRY_ATTEMPTS = int(os.environ.get('EMAIL_RETRY_ATTEMPTS', '3'))
+EMAIL_RETRY_BACKOFF = float(os.environ.get('EMAIL_RETRY_BACKOFF', '2'))
+
+# Scheduled reminders: a reminder may still be sent up to this many minutes after the
+# user's chosen local time (covers cron/daemon intervals and retries of failed sends).
+REMINDER_GRACE_MINUTES = int(os.environ.get('REMINDER_GRACE_MINUTES', '60'))
+# prune_reminder_logs keeps this many days of ReminderLog rows.
+REMINDER_LOG_RETENTION_DAYS = int(os.environ.get('REMINDER_LOG_RETENTION_DAYS', '30'))
+
 # Gemini API for AI Diet Agent (key in .env as GEMINI_API_KEY)
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+# Seconds to wait for one model reply, and pooled keep-alive connections to the API per process.
+GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '90'))
+GEMINI_MAX_CONNECTIONS = int(os.environ.get('GEMINI_MAX_CONNECTIONS', '20'))
+# Estimated input-token budget per AI endpoint; longer conversations are compacted to fit
+# (tracker.prompts). Endpoints not listed use 4000.
+GEMINI_PROMPT_BUDGETS = {
+    'pcod_support_chat': int(os.environ.get('GEMINI_BUDGET_SUPPORT_CHAT', '3000')),
+    'diet_planner_chat': int(os.environ.get('GEMINI_BUDGET_DIET_CHAT', '3500')),
+    'diet_plan_generate': int(os.environ.get('GEMINI_BUDGET_DIET_PLAN', '3000')),
+}
+# Model circuit breaker: seconds a model is skipped after a 429/5xx/network error (doubled per
+# consecutive failure, capped), and after a 404 (model not available for this key).
+GEMINI_MODEL_COOLDOWN = int(os.environ.get('GEMINI_MODEL_COOLDOWN', '30'))
+GEMINI_MODEL_MAX_COOLDOWN = int(os.environ.get('GEMINI_MODEL_MAX_COOLDOWN', '600'))
+GEMINI_MODEL_404_COOLDOWN = int(os.environ.get('GEMINI_MODEL_404_COOLDOWN', '3600'))
+# Identical concurrent AI calls share one upstream call within a process. Set to 1 to also
+# coalesce across worker processes through the database; a waiter takes over a call whose
+# leader has not finished after GEMINI_SINGLE_FLIGHT_STALE seconds.
+GEMINI_SINGLE_FLIGHT_SHARED = os.environ.get('GEMINI_SINGLE_FLIGHT_SHARED', '0') == '1'
+GEMINI_SINGLE_FLIGHT_STALE = int(os.environ.get('GEMINI_SINGLE_FLIGHT_STALE', '300'))
+# "Generate my diet plan" runs as a background job: worker threads per process, and seconds
+# after which a job that never finished (e.g. its process restarted) is reported as failed.
+DIET_PLAN_JOB_WORKERS = int(os.environ.get('DIET_PLAN_JOB_WORKERS', '4'))
+DIET_PLAN_JOB_TIMEOUT = int(os.environ.get('DIET_PLAN_JOB_TIMEOUT', '300'))
+# Shared cache of recipe / order-options replies (AIResponseCache): seconds an entry lives,
+# and table size above which the least recently used entries are evicted.
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', str(7 * 24 * 3600)))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '5000'))
+# Per-user AI quotas (token buckets, tracker.quotas): requests allowed in a burst, and tokens
+# refilled per hour. Chat turns and plan generation have separate budgets; burst 0 = no limit.
+AI_QUOTAS = {
+    'chat': {
+        'burst': int(os.environ.get('AI_QUOTA_CHAT_BURST', '20')),
+        'per_hour': int(os.environ.get('AI_QUOTA_CHAT_PER_HOUR', '60')),
+    },
+    'plan': {
+        'burst': int(os.environ.get('AI_QUOTA_PLAN_BURST', '3')),
+        'per_hour': int(os.environ.get('AI_QUOTA_PLAN_PER_HOUR', '6')),
+    },
+}
+# Per-user page cache (tracker.page_cache) for the dashboard, insights, wellness and cycle
+# tracker: seconds an entry lives, and the CACHES alias holding them. Without CACHES this is
+# per-process memory; a shared backend (Redis, Memcached) lets worker processes share entries.
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', '3600'))
+PAGE_CACHE_ALIAS = os.environ.get('PAGE_CACHE_ALIAS', 'default')
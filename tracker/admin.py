@@ -2,7 +2,12 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.utils import timezone
-from .models import DailyLog, DietDayLog, NotificationPreference, ReminderLog
+from .ai_cache import stats as ai_cache_stats
+from .models import (
+    AIQuotaBucket, AIResponseCache, DailyLog, DietDayLog, DietPlanJob, EmailOutbox, NotificationPreference,
+    ReminderLog,
+)
+from .quotas import quota, tokens_left, top_consumers
 
 
 @admin.register(DailyLog)
@@ -22,36 +27,109 @@ class DailyLogAdmin(admin.ModelAdmin):
 
 @admin.register(DietDayLog)
 class DietDayLogAdmin(admin.ModelAdmin):
-    list_display = ('user', 'date', 'has_plan')
+    list_display = ('user', 'date', 'has_plan', 'has_pending_plan')
     list_filter = ('date',)
     search_fields = ('user__username',)
     date_hierarchy = 'date'
     ordering = ('-date',)
-    readonly_fields = ('plan', 'note', 'checked')
+    readonly_fields = ('plan', 'note', 'checked', 'pending_plan', 'pending_generated_at')
 
     def has_plan(self, obj):
         return obj.plan is not None
     has_plan.boolean = True
     has_plan.short_description = 'AI plan'
 
+    def has_pending_plan(self, obj):
+        return obj.pending_plan is not None
+    has_pending_plan.boolean = True
+    has_pending_plan.short_description = 'Pre-generated'
+
 
 @admin.register(NotificationPreference)
 class NotificationPreferenceAdmin(admin.ModelAdmin):
     list_display = (
         'user', 'events_workshops', 'health_tips', 'app_updates',
         'breakfast_reminder', 'water_reminder', 'stretch_reminder', 'daily_log_reminder',
+        'time_zone', 'next_due_at',
     )
     search_fields = ('user__username', 'user__email')
+    readonly_fields = ('next_due_at',)
 
 
 @admin.register(ReminderLog)
 class ReminderLogAdmin(admin.ModelAdmin):
-    list_display = ('user', 'date', 'reminder_type')
-    list_filter = ('reminder_type', 'date')
+    list_display = ('user', 'date', 'reminders_sent')
+    list_filter = ('date',)
     search_fields = ('user__username',)
     date_hierarchy = 'date'
     ordering = ('-date',)
 
+    def reminders_sent(self, obj):
+        return ', '.join(obj.sent_types()) or '–'
+    reminders_sent.short_description = 'Reminders sent'
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('to_email', 'subject')
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    readonly_fields = ('claimed_by', 'claimed_at', 'sent_at', 'last_error')
+
+
+@admin.register(DietPlanJob)
+class DietPlanJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'status', 'created_at', 'started_at', 'finished_at', 'imported_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__username',)
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    readonly_fields = ('id', 'created_at', 'started_at', 'finished_at', 'imported_at')
+
+
+@admin.register(AIResponseCache)
+class AIResponseCacheAdmin(admin.ModelAdmin):
+    """Cached recipe / order-options replies, with hit and miss totals per endpoint above the list."""
+    list_display = ('dish_name', 'endpoint', 'price_range', 'hits', 'misses', 'last_used_at', 'expires_at')
+    list_filter = ('endpoint',)
+    search_fields = ('dish_name', 'description')
+    ordering = ('-last_used_at',)
+    readonly_fields = ('key', 'hits', 'misses', 'created_at', 'last_used_at')
+    change_list_template = 'admin/tracker/airesponsecache/change_list_with_stats.html'
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['cache_stats'] = ai_cache_stats()
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(AIQuotaBucket)
+class AIQuotaBucketAdmin(admin.ModelAdmin):
+    """Per-user AI quota buckets, with today's top consumers above the list."""
+    list_display = ('user', 'endpoint', 'tokens_now', 'allowed', 'denied', 'day', 'last_denied_at')
+    list_filter = ('endpoint', 'day')
+    search_fields = ('user__username',)
+    ordering = ('-day', '-allowed')
+    readonly_fields = ('tokens', 'updated_at', 'day', 'allowed', 'denied', 'last_denied_at')
+    actions = ['refill']
+    change_list_template = 'admin/tracker/aiquotabucket/change_list_with_top_consumers.html'
+
+    def tokens_now(self, obj):
+        return f'{tokens_left(obj):.1f} / {quota(obj.endpoint)[0]}'
+    tokens_now.short_description = 'Tokens left'
+
+    @admin.action(description='Refill selected buckets')
+    def refill(self, request, queryset):
+        for bucket in queryset:
+            AIQuotaBucket.objects.filter(pk=bucket.pk).update(tokens=quota(bucket.endpoint)[0], updated_at=timezone.now())
+        self.message_user(request, f'Refilled {queryset.count()} bucket(s).')
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['top_consumers'] = top_consumers()
+        return super().changelist_view(request, extra_context=extra_context)
 
 # Unregister default User admin so we can add "new users today" tracking
 admin.site.unregister(User)
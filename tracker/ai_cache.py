@@ -0,0 +1,119 @@
+"""
+Shared cache of AI replies for generate_recipe and find_order_options.
+
+Many users ask about the same dishes, so a cached reply is returned without a
+model call. An entry is keyed on the endpoint plus the normalized request
+(case-folded, whitespace-collapsed dish name, description and price range) and
+the rest of the prompt context (the system instruction). A prompt that carries
+per-user details, such as the user's food preferences, must pass them in the
+context, so one user's reply is never served to another. It
+lives for AI_CACHE_TTL seconds. The table is capped at AI_CACHE_MAX_ENTRIES
+rows, and the least recently used entries are evicted first. Entries are rows
+of AIResponseCache, so every app process shares them. Hits and misses are
+counted per entry and totalled in the admin.
+"""
+import hashlib
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import AIResponseCache
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def normalize(text):
+    return " ".join((text or "").casefold().split())
+
+
+def cache_key(endpoint, dish_name, description="", price_range="", context=""):
+    raw = "\x1f".join([
+        endpoint, normalize(dish_name), normalize(description), normalize(price_range), normalize(context),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached(key):
+    """The cached reply for key (counting a hit), or None if it is missing or expired."""
+    now = timezone.now()
+    if not AIResponseCache.objects.filter(key=key, expires_at__gt=now).update(hits=F("hits") + 1, last_used_at=now):
+        return None
+    return AIResponseCache.objects.filter(key=key).values_list("response", flat=True).first()
+
+
+def store(endpoint, key, dish_name, description, price_range, response):
+    """Save a freshly generated reply (counting a miss), then evict expired and least recently used entries."""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=getattr(settings, "AI_CACHE_TTL", DEFAULT_TTL))
+    updated = AIResponseCache.objects.filter(key=key).update(
+        response=response, misses=F("misses") + 1, expires_at=expires_at, last_used_at=now,
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                AIResponseCache.objects.create(
+                    key=key,
+                    endpoint=endpoint,
+                    dish_name=dish_name[:255],
+                    description=description,
+                    price_range=price_range,
+                    response=response,
+                    misses=1,
+                    expires_at=expires_at,
+                    last_used_at=now,
+                )
+        except IntegrityError:
+            # Another process cached the same request in the meantime
+            pass
+    evict(now)
+
+
+def evict(now=None):
+    """Delete expired entries and everything beyond AI_CACHE_MAX_ENTRIES, least recently used first."""
+    now = now or timezone.now()
+    AIResponseCache.objects.filter(expires_at__lte=now).delete()
+    max_entries = getattr(settings, "AI_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)
+    overflow = list(
+        AIResponseCache.objects.order_by("-last_used_at").values_list("pk", flat=True)[max_entries:]
+    )
+    if overflow:
+        AIResponseCache.objects.filter(pk__in=overflow).delete()
+
+
+async def cached_reply(endpoint, dish_name, description, price_range, generate, context=""):
+    """
+    Return (reply_text, None) from the cache, or await generate() -> (reply_text, error)
+    and cache the reply if it succeeded. Errors are never cached. context is everything
+    else the prompt depends on; requests with a different context never share a reply.
+    """
+    key = cache_key(endpoint, dish_name, description, price_range, context)
+    cached = await sync_to_async(get_cached)(key)
+    if cached is not None:
+        return cached, None
+    reply_text, err = await generate()
+    if not err and reply_text:
+        await sync_to_async(store)(endpoint, key, dish_name, description, price_range, reply_text)
+    return reply_text, err
+
+
+def stats():
+    """Per-endpoint totals for the admin: {endpoint: {entries, hits, misses, hit_rate}}."""
+    totals = {}
+    rows = AIResponseCache.objects.values("endpoint").annotate(entries=Count("pk"), hits=Sum("hits"), misses=Sum("misses"))
+    labels = dict(AIResponseCache.ENDPOINT_CHOICES)
+    for row in rows:
+        hits = row["hits"] or 0
+        misses = row["misses"] or 0
+        totals[row["endpoint"]] = {
+            "label": labels.get(row["endpoint"], row["endpoint"]),
+            "entries": row["entries"],
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(100 * hits / (hits + misses), 1) if hits + misses else None,
+        }
+    return totals
@@ -5,3 +5,6 @@ class TrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracker'
     verbose_name = 'PCOD GirlCare Tracker'
+
+    def ready(self):
+        from . import signals  # noqa: F401
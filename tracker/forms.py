@@ -1,6 +1,10 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
+from django.template import loader
 from django.contrib.auth.models import User
+from .mailer import enqueue_email
 from .models import DailyLog, NotificationPreference
 
 # Low / Mid / High dropdown choices; stored as 1, 5, 10 in DB for charts/compatibility
@@ -20,8 +24,53 @@ WELLNESS_CHOICES = [
 ]
 
 
+SYMPTOM_FIELDS = ('acne_level', 'fatigue_level', 'bloating_level', 'sleep_quality', 'mood')
+
+
+def wellness_to_choice(val):
+    """Map a stored wellness score (0–100) to its Good / Average / Bad choice."""
+    if val is None:
+        return None
+    if val <= 33:
+        return 25
+    if val <= 66:
+        return 50
+    return 75
+
+
+def symptom_to_choice(val):
+    """Map a stored symptom / mood value (1–10) to its Low / Mid / High choice."""
+    if val is None:
+        return None
+    if val <= 3:
+        return 1
+    if val <= 7:
+        return 5
+    return 10
+
+
+def choice_field(choices):
+    """Dropdown stored as an int; an empty selection is None."""
+    return forms.TypedChoiceField(
+        choices=choices,
+        coerce=int,
+        required=False,
+        empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+
 class DailyLogForm(forms.ModelForm):
     """Log or update today's metrics – always saved for current user."""
+    # Wellness: dropdown Good / Average / Bad (stored as 75, 50, 25)
+    wellness_score = choice_field(WELLNESS_CHOICES)
+    # Symptom and mood fields: dropdown with Select / Low / Mid / High (stored as 1, 5, 10)
+    acne_level = choice_field(SYMPTOM_CHOICES)
+    fatigue_level = choice_field(SYMPTOM_CHOICES)
+    bloating_level = choice_field(SYMPTOM_CHOICES)
+    sleep_quality = choice_field(SYMPTOM_CHOICES)
+    mood = choice_field(SYMPTOM_CHOICES)
+
     class Meta:
         model = DailyLog
         fields = [
@@ -38,66 +87,16 @@ class DailyLogForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Wellness: dropdown Good / Average / Bad (stored as 75, 50, 25)
-        def coerce_wellness(x):
-            if x is None or x == '':
-                return None
-            return int(x)
-
-        def wellness_to_choice(val):
-            if val is None:
-                return None
-            if val <= 33:
-                return 25
-            if val <= 66:
-                return 50
-            return 75
-
-        self.fields['wellness_score'] = forms.TypedChoiceField(
-            choices=WELLNESS_CHOICES,
-            coerce=coerce_wellness,
-            required=False,
-            empty_value=None,
-            widget=forms.Select(attrs={'class': 'form-select'}),
-        )
-        if self.instance and getattr(self.instance, 'wellness_score') is not None:
-            self.fields['wellness_score'].initial = wellness_to_choice(
-                getattr(self.instance, 'wellness_score')
-            )
-
-        # Symptom and mood fields: dropdown with Select / Low / Mid / High (stored as 1, 5, 10)
-        def coerce_symptom(x):
-            if x is None or x == '':
-                return None
-            return int(x)
-
-        def bin_to_choice(val):
-            if val is None:
-                return None
-            if val <= 3:
-                return 1
-            if val <= 7:
-                return 5
-            return 10
-
-        for name in ('acne_level', 'fatigue_level', 'bloating_level', 'sleep_quality', 'mood'):
-            self.fields[name] = forms.TypedChoiceField(
-                choices=SYMPTOM_CHOICES,
-                coerce=coerce_symptom,
-                required=False,
-                empty_value=None,
-                widget=forms.Select(attrs={'class': 'form-select'}),
-            )
-            if self.instance and getattr(self.instance, name) is not None:
-                self.fields[name].initial = bin_to_choice(getattr(self.instance, name))
+        # Preselect the dropdown option a stored value falls into (e.g. mood 7 -> Mid)
+        if self.instance.pk is not None:
+            self.initial['wellness_score'] = wellness_to_choice(self.instance.wellness_score)
+            for name in SYMPTOM_FIELDS:
+                self.initial[name] = symptom_to_choice(getattr(self.instance, name))
 
     def clean(self):
         """Ensure empty string is always None for numeric choice fields so the model gets NULL."""
         data = super().clean()
-        for name in (
-            'wellness_score', 'acne_level', 'fatigue_level',
-            'bloating_level', 'sleep_quality', 'mood',
-        ):
+        for name in ('wellness_score', *SYMPTOM_FIELDS):
             if name in data and data[name] == '':
                 data[name] = None
         return data
@@ -139,13 +138,14 @@ class SignUpForm(UserCreationForm):
 
 
 class NotificationPreferenceForm(forms.ModelForm):
-    """Notification toggles – only for logged-in user."""
+    """Notification toggles and reminder times – only for logged-in user."""
 
     class Meta:
         model = NotificationPreference
         fields = (
             'events_workshops', 'health_tips', 'app_updates',
             'breakfast_reminder', 'water_reminder', 'stretch_reminder', 'daily_log_reminder',
+            'time_zone', 'breakfast_time', 'water_time', 'stretch_time', 'daily_log_time',
         )
         widgets = {
             'events_workshops': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
@@ -155,4 +155,32 @@ class NotificationPreferenceForm(forms.ModelForm):
             'water_reminder': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'stretch_reminder': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'daily_log_reminder': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'time_zone': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Asia/Kolkata'}),
+            'breakfast_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}, format='%H:%M'),
+            'water_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}, format='%H:%M'),
+            'stretch_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}, format='%H:%M'),
+            'daily_log_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}, format='%H:%M'),
         }
+
+    def clean_time_zone(self):
+        name = (self.cleaned_data.get('time_zone') or '').strip()
+        try:
+            ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise forms.ValidationError('Enter a valid timezone name, e.g. Asia/Kolkata.')
+        return name
+
+
+class OutboxPasswordResetForm(PasswordResetForm):
+    """Password reset form that queues the email in EmailOutbox instead of sending it in the request."""
+
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        # Email subject *must not* contain newlines
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = ''
+        if html_email_template_name is not None:
+            html_body = loader.render_to_string(html_email_template_name, context)
+        enqueue_email(to_email, subject, body, html_body=html_body, from_email=from_email)
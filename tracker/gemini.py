@@ -0,0 +1,407 @@
+"""
+Gemini client for the AI Diet Agent, recipe and ordering endpoints.
+
+Requests go through pooled httpx clients that keep TLS connections to the API
+alive between calls, instead of urllib opening a new TCP + TLS connection per
+request (and per fallback model). There is one client per process for sync
+callers (call_gemini) and one per event loop for the async views
+(acall_gemini), closed when its loop shuts down. Served through
+config/asgi.py, the async client is shared by every request and a slow
+generation costs a suspended coroutine instead of a blocked worker thread.
+
+astream_gemini() uses the streamGenerateContent endpoint (server-sent events)
+and yields the reply chunk by chunk as the model generates it.
+
+model_health is a per-process circuit breaker over GEMINI_MODELS. Models that
+answer 404 (not available for the key), 429 or 5xx, time out or cannot be
+reached are put on cooldown and skipped, so a dead model no longer costs a
+round-trip on every request, and the call falls through to the next model. The
+live models are tried healthiest and fastest first, by an EWMA of their latency.
+
+Identical concurrent calls are coalesced into one upstream call
+(tracker.single_flight).
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+
+from .prompts import build_prompt
+from .single_flight import ashared_call, flights, request_fingerprint, shared_call
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+# Order of preference until latencies are known; ordering at call time comes from model_health.
+GEMINI_MODELS = ("gemini-2.5-flash", "gemini-3-flash-preview", "gemini-2.0-flash", "gemini-1.5-flash")
+# Statuses after which the next model is tried (and this one put on cooldown)
+FALLTHROUGH_STATUSES = {404, 429, 500, 502, 503, 504}
+
+DEFAULT_TIMEOUT = 90
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MODEL_COOLDOWN = 30
+DEFAULT_MODEL_MAX_COOLDOWN = 600
+DEFAULT_MODEL_404_COOLDOWN = 3600
+LATENCY_EWMA_ALPHA = 0.3
+
+_sync_client = None
+_sync_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class GeminiError(Exception):
+    """A streamed Gemini call failed; str(exc) is the message for the user."""
+
+
+def _timeout():
+    return httpx.Timeout(getattr(settings, "GEMINI_TIMEOUT", DEFAULT_TIMEOUT), connect=10)
+
+
+def _limits():
+    max_connections = getattr(settings, "GEMINI_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def sync_client():
+    """The process-wide pooled httpx.Client (thread-safe)."""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_client_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(timeout=_timeout(), limits=_limits())
+    return _sync_client
+
+
+async def _close_at_loop_shutdown(client):
+    """Parked at its yield; the loop's shutdown_asyncgens() (asyncio.run, ASGI servers) closes it."""
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def async_client():
+    """
+    The pooled httpx.AsyncClient for the running event loop (connections cannot cross loops).
+    The client is closed when its loop shuts down. Under ASGI that is the server's one long-lived
+    loop; under WSGI, async_to_sync runs every async view on a new loop, so the client lives for
+    one request and its sockets are closed as soon as the view returns.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        closer = _close_at_loop_shutdown(client)
+        # The loop only tracks async generators weakly; keep the closer alive with the client
+        _async_clients[loop] = entry = (client, closer)
+        await closer.__anext__()
+    return entry[0]
+
+
+def _request_payload(user_message, system_instruction, history, max_output_tokens, endpoint=None):
+    return {
+        "contents": [{"parts": [{"text": build_prompt(user_message, system_instruction, history, endpoint)}]}],
+        "generationConfig": {"temperature": 0.7, "maxOutputTokens": max_output_tokens},
+    }
+
+
+def _check_key(api_key):
+    """(key, None) or (None, error_message) if the key is missing."""
+    if not api_key or not api_key.strip():
+        logger.error("Gemini API key is missing or empty. Check GEMINI_API_KEY in environment/.env.")
+        return None, "AI is not configured. Add GEMINI_API_KEY to your .env file."
+    return api_key.strip(), None
+
+
+def _part_texts(data):
+    """Text parts of a generateContent response (or of one streamed chunk), in order."""
+    for c in data.get("candidates", []):
+        for p in c.get("content", {}).get("parts", []):
+            if "text" in p:
+                yield p["text"]
+
+
+class ModelHealth:
+    """Observed outcomes and latency of one model in this process."""
+
+    def __init__(self, name, rank):
+        self.name = name
+        self.rank = rank
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency_ewma = None
+        self.last_status = None
+        self.cooldown_until = 0.0
+
+    def sort_key(self):
+        latency = self.latency_ewma if self.latency_ewma is not None else float("inf")
+        return (self.consecutive_failures, latency, self.rank)
+
+    def as_dict(self, now):
+        return {
+            "model": self.name,
+            "available": now >= self.cooldown_until,
+            "cooldown_seconds": max(0, round(self.cooldown_until - now, 1)),
+            "latency_ewma_ms": round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_status": self.last_status,
+        }
+
+
+class ModelRegistry:
+    """
+    Per-process circuit breaker and latency tracker for the Gemini models.
+
+    A 404 puts a model on cooldown for GEMINI_MODEL_404_COOLDOWN seconds. A 429, a 5xx
+    or a network error puts it on cooldown for GEMINI_MODEL_COOLDOWN seconds, doubled per
+    consecutive failure up to GEMINI_MODEL_MAX_COOLDOWN. candidates() returns the models
+    not on cooldown, fewest consecutive failures then lowest latency EWMA first. When
+    every model is on cooldown, the one recovering soonest is tried (half-open).
+    """
+
+    def __init__(self, models, alpha=LATENCY_EWMA_ALPHA):
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.models = {name: ModelHealth(name, rank) for rank, name in enumerate(dict.fromkeys(models))}
+
+    def candidates(self):
+        now = time.monotonic()
+        with self.lock:
+            live = [h for h in self.models.values() if now >= h.cooldown_until]
+            if not live:
+                return [min(self.models.values(), key=lambda h: h.cooldown_until).name]
+            return [h.name for h in sorted(live, key=ModelHealth.sort_key)]
+
+    def record_success(self, model, latency=None):
+        with self.lock:
+            health = self.models[model]
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.cooldown_until = 0.0
+            health.last_status = 200
+            if latency is not None:
+                if health.latency_ewma is None:
+                    health.latency_ewma = latency
+                else:
+                    health.latency_ewma = self.alpha * latency + (1 - self.alpha) * health.latency_ewma
+
+    def record_failure(self, model, status=None):
+        """status is the HTTP status, or None for a network error / timeout."""
+        if status == 404:
+            cooldown = getattr(settings, "GEMINI_MODEL_404_COOLDOWN", DEFAULT_MODEL_404_COOLDOWN)
+        else:
+            base = getattr(settings, "GEMINI_MODEL_COOLDOWN", DEFAULT_MODEL_COOLDOWN)
+            cap = getattr(settings, "GEMINI_MODEL_MAX_COOLDOWN", DEFAULT_MODEL_MAX_COOLDOWN)
+        with self.lock:
+            health = self.models[model]
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_status = status
+            if status != 404:
+                cooldown = min(cap, base * 2 ** (health.consecutive_failures - 1))
+            health.cooldown_until = time.monotonic() + cooldown
+        logger.warning("Gemini model %s on cooldown for %ss after status %s", model, cooldown, status or "error")
+
+    def snapshot(self):
+        """State of every model, in the order candidates() would try the live ones."""
+        now = time.monotonic()
+        with self.lock:
+            ordered = sorted(self.models.values(), key=lambda h: (now < h.cooldown_until,) + h.sort_key())
+            return {"pid": os.getpid(), "models": [h.as_dict(now) for h in ordered]}
+
+
+model_health = ModelRegistry(GEMINI_MODELS)
+
+
+def _handle_response(model, response, latency=None):
+    """
+    Interpret one model's HTTP response and record the outcome in model_health.
+    Returns (done, reply_text, error_message); done is False when the next model should be tried.
+    """
+    if response.status_code != 200:
+        err_snippet = response.text[:400] if response.text else response.reason_phrase
+        logger.error("Gemini HTTPError for model %s (status %s): %s", model, response.status_code, err_snippet)
+        if response.status_code in FALLTHROUGH_STATUSES:
+            model_health.record_failure(model, response.status_code)
+            if response.status_code == 404:
+                return False, None, None
+            return False, None, f"API error ({response.status_code}): {err_snippet}"
+        return True, None, f"API error ({response.status_code}): {err_snippet}"
+    model_health.record_success(model, latency)
+    try:
+        data = response.json()
+    except ValueError as e:
+        logger.error("Gemini model %s returned invalid JSON: %s", model, e)
+        return True, None, str(e)
+    logger.debug("Gemini model %s responded successfully", model)
+    text = next(_part_texts(data), None)
+    if text is not None:
+        return True, text.strip(), None
+    logger.error("Gemini model %s returned no text candidates.", model)
+    return True, None, "No reply from the model."
+
+
+def _no_model_error(tried, last_err=None):
+    """(None, error_message) once every candidate model has failed; last_err is the last non-404 error."""
+    logger.error(
+        "API error: no supported Gemini model responded successfully. Tried models: %s.",
+        ", ".join(tried),
+    )
+    if last_err:
+        return None, last_err
+    return None, "API error: no supported model found. Try gemini-2.0-flash or gemini-1.5-flash in Google AI Studio."
+
+
+def _network_error(exc):
+    """Error message for a timeout or connection failure (some httpx errors have no message)."""
+    return f"Network error talking to the AI: {str(exc) or type(exc).__name__}"
+
+
+def call_gemini(user_message, system_instruction, api_key, history=None, max_output_tokens=1024, endpoint=None):
+    """
+    Call Gemini generateContent API. Returns (reply_text, error_message).
+    endpoint names the caller for its prompt token budget (tracker.prompts).
+    """
+    key, err = _check_key(api_key)
+    if err:
+        return None, err
+    payload = _request_payload(user_message, system_instruction, history, max_output_tokens, endpoint)
+    fingerprint = request_fingerprint(payload)
+    return flights.do(fingerprint, lambda: shared_call(fingerprint, lambda: _call_models(key, payload)))
+
+
+def _call_models(key, payload):
+    client = sync_client()
+    tried = model_health.candidates()
+    last_err = None
+    for model in tried:
+        try:
+            logger.debug("Calling Gemini model %s", model)
+            started = time.monotonic()
+            response = client.post(f"{GEMINI_API_BASE}/{model}:generateContent", params={"key": key}, json=payload)
+        except httpx.TransportError as e:
+            # Timeout or connection failure: cool the model down and try the next one
+            model_health.record_failure(model)
+            logger.warning("Network error calling Gemini model %s: %r", model, e)
+            last_err = _network_error(e)
+            continue
+        except Exception as e:
+            model_health.record_failure(model)
+            logger.exception("Error calling Gemini model %s: %s", model, e)
+            return None, str(e)
+        done, reply_text, err = _handle_response(model, response, time.monotonic() - started)
+        if done:
+            return reply_text, err
+        last_err = err or last_err
+    return _no_model_error(tried, last_err)
+
+
+async def acall_gemini(user_message, system_instruction, api_key, history=None, max_output_tokens=1024, endpoint=None):
+    """Async call_gemini() for async views. Returns (reply_text, error_message)."""
+    key, err = _check_key(api_key)
+    if err:
+        return None, err
+    payload = _request_payload(user_message, system_instruction, history, max_output_tokens, endpoint)
+    fingerprint = request_fingerprint(payload)
+    return await flights.ado(fingerprint, lambda: ashared_call(fingerprint, lambda: _acall_models(key, payload)))
+
+
+async def _acall_models(key, payload):
+    client = await async_client()
+    tried = model_health.candidates()
+    last_err = None
+    for model in tried:
+        try:
+            logger.debug("Calling Gemini model %s", model)
+            started = time.monotonic()
+            response = await client.post(f"{GEMINI_API_BASE}/{model}:generateContent", params={"key": key}, json=payload)
+        except httpx.TransportError as e:
+            # Timeout or connection failure: cool the model down and try the next one
+            model_health.record_failure(model)
+            logger.warning("Network error calling Gemini model %s: %r", model, e)
+            last_err = _network_error(e)
+            continue
+        except Exception as e:
+            model_health.record_failure(model)
+            logger.exception("Error calling Gemini model %s: %s", model, e)
+            return None, str(e)
+        done, reply_text, err = _handle_response(model, response, time.monotonic() - started)
+        if done:
+            return reply_text, err
+        last_err = err or last_err
+    return _no_model_error(tried, last_err)
+
+
+async def astream_gemini(user_message, system_instruction, api_key, history=None, max_output_tokens=1024, endpoint=None):
+    """
+    Stream a reply from the streamGenerateContent API (alt=sse).
+    Async generator of text chunks; raises GeminiError if no model could answer.
+    Falls through to the next model like acall_gemini() until the first chunk is sent.
+    """
+    key, err = _check_key(api_key)
+    if err:
+        raise GeminiError(err)
+    payload = _request_payload(user_message, system_instruction, history, max_output_tokens, endpoint)
+    client = await async_client()
+    tried = model_health.candidates()
+    last_err = None
+    for model in tried:
+        got_text = False
+        try:
+            logger.debug("Streaming from Gemini model %s", model)
+            async with client.stream(
+                "POST",
+                f"{GEMINI_API_BASE}/{model}:streamGenerateContent",
+                params={"key": key, "alt": "sse"},
+                json=payload,
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    done, _, err = _handle_response(model, response)
+                    if not done:
+                        last_err = err or last_err
+                        continue
+                    raise GeminiError(err)
+                # Latency EWMA is kept for complete replies only; a stream is recorded as a success
+                model_health.record_success(model)
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        data = json.loads(line[len("data:"):])
+                    except ValueError:
+                        logger.warning("Skipping malformed stream event from Gemini model %s", model)
+                        continue
+                    for text in _part_texts(data):
+                        if text:
+                            got_text = True
+                            yield text
+                if not got_text:
+                    logger.error("Gemini model %s streamed no text candidates.", model)
+                    raise GeminiError("No reply from the model.")
+                return
+        except GeminiError:
+            raise
+        except httpx.TransportError as e:
+            model_health.record_failure(model)
+            logger.warning("Network error streaming from Gemini model %s: %r", model, e)
+            if got_text:
+                # Part of the reply was already sent; it cannot be restarted on another model
+                raise GeminiError(_network_error(e)) from e
+            last_err = _network_error(e)
+            continue
+        except Exception as e:
+            model_health.record_failure(model)
+            logger.exception("Error streaming from Gemini model %s: %s", model, e)
+            raise GeminiError(str(e)) from e
+    _, err = _no_model_error(tried, last_err)
+    raise GeminiError(err)
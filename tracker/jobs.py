@@ -0,0 +1,54 @@
+"""
+Background worker pool for slow AI work (diet plan generation).
+
+A view submits a job and returns at once. The work runs on a per-process
+ThreadPoolExecutor of DIET_PLAN_JOB_WORKERS threads and stores its outcome in
+the database, so the request never waits on the model. If a process dies
+while a job runs, the row is left active; callers treat an active job older
+than DIET_PLAN_JOB_TIMEOUT seconds as failed.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 300
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'DIET_PLAN_JOB_WORKERS', DEFAULT_WORKERS),
+                    thread_name_prefix='diet-plan-job',
+                )
+    return _executor
+
+
+def job_timeout():
+    return getattr(settings, 'DIET_PLAN_JOB_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _run(fn, args):
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception('Background job %s%r failed', fn.__name__, args)
+    finally:
+        # Worker threads own their DB connections; don't leave them open between jobs
+        close_old_connections()
+
+
+def submit(fn, *args):
+    """Run fn(*args) on the worker pool. fn records its own outcome; exceptions are logged."""
+    return executor().submit(_run, fn, args)
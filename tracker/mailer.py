@@ -0,0 +1,306 @@
+"""
+Batched email delivery over a reused SMTP connection.
+
+Django's send_mail() opens a new connection (TCP + TLS + AUTH) for every call.
+BatchMailer keeps one connection open across many messages, reconnects after
+every EMAIL_BATCH_SIZE messages (providers cap messages per session) and after
+transient failures, and reports success per message so callers only record
+mail that actually went out.
+
+ParallelMailer fans messages out over a thread pool (one BatchMailer, and so
+one SMTP connection, per thread) under a shared TokenBucket rate limit, and
+re-sends transient failures with exponential backoff instead of dropping them.
+
+Mail triggered by web requests is not sent here directly: enqueue_email() writes
+an EmailOutbox row and `manage.py deliver_outbox` delivers it.
+"""
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_SEND_RETRIES = 2
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 2.0
+
+
+def is_transient(exc):
+    """True if a failed send may succeed on a fresh connection (dropped session, 4xx reply, socket error)."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(exc, smtplib.SMTPConnectError):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, OSError)
+
+
+def notification_message(user, subject, body_plain):
+    """Build an EmailMessage addressed ONLY to user.email, or None if the user has no email."""
+    email = (getattr(user, 'email', None) or '').strip()
+    if not email:
+        return None
+    # from_email=None uses DEFAULT_FROM_EMAIL
+    return EmailMessage(subject=subject, body=body_plain, from_email=None, to=[email])
+
+
+def enqueue_email(to_email, subject, body, html_body='', from_email=None):
+    """Queue one email for deliver_outbox. Returns the EmailOutbox row."""
+    return EmailOutbox.objects.create(
+        to_email=to_email.strip(),
+        from_email=from_email or '',
+        subject=subject,
+        body=body,
+        html_body=html_body or '',
+    )
+
+
+def outbox_message(entry):
+    """Build the EmailMessage for an EmailOutbox row."""
+    message = EmailMultiAlternatives(
+        subject=entry.subject,
+        body=entry.body,
+        from_email=entry.from_email or None,
+        to=[entry.to_email],
+    )
+    if entry.html_body:
+        message.attach_alternative(entry.html_body, 'text/html')
+    return message
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`.
+    acquire() blocks until a token is available. rate <= 0 means unlimited.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate or 0)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def email_rate_limiter(rate=None):
+    """TokenBucket for the provider quota (EMAIL_RATE_LIMIT messages/second unless rate is given)."""
+    if rate is None:
+        rate = getattr(settings, 'EMAIL_RATE_LIMIT', 0)
+    return TokenBucket(rate)
+
+
+class BatchMailer:
+    """
+    Send many messages over one SMTP session.
+
+        with BatchMailer() as mailer:
+            results = mailer.send_many(messages)  # [True, False, ...]
+
+    batch_size: messages per session before reconnecting (EMAIL_BATCH_SIZE).
+    max_retries: reconnect-and-retry attempts per message on transient errors (EMAIL_SEND_RETRIES).
+    rate_limiter: optional TokenBucket; one token is taken per send attempt.
+    After send(), last_error holds the exception of a failed send (None on success).
+    """
+
+    def __init__(self, batch_size=None, max_retries=None, rate_limiter=None):
+        self.batch_size = max(1, batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        if max_retries is None:
+            max_retries = getattr(settings, 'EMAIL_SEND_RETRIES', DEFAULT_SEND_RETRIES)
+        self.max_retries = max(0, max_retries)
+        self.rate_limiter = rate_limiter
+        self.last_error = None
+        self.connection = None
+        self.sent_in_session = 0
+        self.reconnects = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def open(self):
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+            self.connection.open()
+            self.sent_in_session = 0
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def reconnect(self):
+        self.close()
+        self.reconnects += 1
+        self.open()
+
+    def send(self, message):
+        """Send one message on the shared connection. Returns True if it was accepted."""
+        attempt = 0
+        self.last_error = None
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                if self.connection is None:
+                    self.open()
+                elif self.sent_in_session >= self.batch_size:
+                    self.reconnect()
+                sent = self.connection.send_messages([message])
+                self.sent_in_session += 1
+                return bool(sent)
+            except Exception as exc:
+                if attempt < self.max_retries and is_transient(exc):
+                    attempt += 1
+                    logger.warning(
+                        "Transient SMTP error sending to %s (attempt %s/%s): %s",
+                        ", ".join(message.to), attempt, self.max_retries, exc,
+                    )
+                    self.close()
+                    self.reconnects += 1
+                    continue
+                logger.error("Failed to send email to %s: %s", ", ".join(message.to), exc)
+                self.last_error = exc
+                return False
+
+    def send_many(self, messages):
+        """Send messages in order. Returns a list of bools, one per message."""
+        return [self.send(message) for message in messages]
+
+
+class ParallelMailer:
+    """
+    Send messages from a pool of `workers` threads sharing one rate limiter.
+
+        with ParallelMailer(workers=4, rate_limiter=email_rate_limiter()) as mailer:
+            results = mailer.send_many(messages)  # [True, False, ...]
+
+    Each thread owns a BatchMailer (SMTP connections are not thread-safe).
+    Messages that fail with a transient error go on a retry list and are re-sent
+    after backoff * 2**n seconds, up to retry_attempts more times
+    (EMAIL_RETRY_ATTEMPTS, EMAIL_RETRY_BACKOFF). Permanent failures are not retried.
+    """
+
+    def __init__(self, workers=1, rate_limiter=None, batch_size=None, retry_attempts=None, backoff=None):
+        self.workers = max(1, workers)
+        self.rate_limiter = rate_limiter
+        self.batch_size = batch_size
+        if retry_attempts is None:
+            retry_attempts = getattr(settings, 'EMAIL_RETRY_ATTEMPTS', DEFAULT_RETRY_ATTEMPTS)
+        self.retry_attempts = max(0, retry_attempts)
+        if backoff is None:
+            backoff = getattr(settings, 'EMAIL_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF)
+        self.backoff = backoff
+        self.retried = 0
+        self.local = threading.local()
+        self.mailers = []
+        self.mailers_lock = threading.Lock()
+        self.pool = None
+
+    def __enter__(self):
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mailer')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        with self.mailers_lock:
+            for mailer in self.mailers:
+                mailer.close()
+            self.mailers = []
+
+    def thread_mailer(self):
+        mailer = getattr(self.local, 'mailer', None)
+        if mailer is None:
+            mailer = BatchMailer(batch_size=self.batch_size, rate_limiter=self.rate_limiter)
+            self.local.mailer = mailer
+            with self.mailers_lock:
+                self.mailers.append(mailer)
+        return mailer
+
+    def deliver(self, message):
+        """Runs in a worker thread. Returns (ok, retryable)."""
+        mailer = self.thread_mailer()
+        ok = mailer.send(message)
+        return ok, (not ok and mailer.last_error is not None and is_transient(mailer.last_error))
+
+    def send_many(self, messages):
+        """Send messages concurrently. Returns a list of bools in the same order as messages."""
+        if self.pool is None:
+            raise RuntimeError('ParallelMailer must be used as a context manager.')
+        results = [False] * len(messages)
+        pending = list(range(len(messages)))
+        attempt = 0
+        while pending:
+            retry = []
+            outcomes = self.pool.map(self.deliver, [messages[i] for i in pending])
+            for index, (ok, retryable) in zip(pending, outcomes):
+                results[index] = ok
+                if retryable:
+                    retry.append(index)
+            if not retry or attempt >= self.retry_attempts:
+                break
+            delay = self.backoff * (2 ** attempt)
+            attempt += 1
+            self.retried += len(retry)
+            logger.warning("Retrying %s email(s) in %.1fs (retry %s/%s)", len(retry), delay, attempt, self.retry_attempts)
+            time.sleep(delay)
+            pending = retry
+        return results
+
+
+def enqueue_notification(user, subject, body_plain):
+    """Queue an email ONLY to user.email for deliver_outbox. Returns 1 if queued, 0 if the user has no email."""
+    email = (getattr(user, 'email', None) or '').strip()
+    if not email:
+        return 0
+    enqueue_email(email, subject, body_plain)
+    return 1
+
+
+def send_notification_email(user, notification_type, subject, body_plain, mailer=None):
+    """
+    Send an email ONLY to the given user's email (user.email). No hardcoded addresses.
+    Pass a BatchMailer to reuse its connection; otherwise a one-off connection is used.
+    Returns 1 if sent, 0 otherwise.
+    """
+    message = notification_message(user, subject, body_plain)
+    if message is None:
+        return 0
+    if mailer is not None:
+        return int(mailer.send(message))
+    with BatchMailer() as one_off:
+        return int(one_off.send(message))
@@ -0,0 +1,149 @@
+"""
+Management command: benchmark diet plan JSON extraction on large adversarial replies.
+
+Builds model replies of about --size characters that are hard to parse, then
+times tracker.plan_json.extract_plan and the three-strategy extraction it
+replaced. The old strategies were a code-fence regex, a first "{" / last "}"
+slice and a nested-brace regex. Results are written as JSON so releases can be
+compared:
+
+    python manage.py benchmark_plan_json --size 1000000 --output bench-plan-json.json
+
+Cases:
+- valid_large: a plan with thousands of slots in a code fence, plus prose.
+- string_braces: a valid plan whose strings contain braces, after prose with braces in it.
+- fence_storm: thousands of unclosed code fences. The old fence regex is quadratic here.
+- brace_storm: unbalanced "{" in the prose before a valid plan.
+- truncated: a large plan cut off mid-JSON, as when max_output_tokens runs out.
+
+The legacy timing can be skipped with --no-legacy on very large sizes.
+"""
+import json
+import platform
+import re
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tracker.plan_json import extract_plan, validate_plan
+
+
+def legacy_extract(reply_text):
+    """The extraction diet_plan_generate used before tracker.plan_json (kept for comparison only)."""
+    plan = None
+    json_str = None
+    json_block_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', reply_text, re.DOTALL)
+    if json_block_match:
+        json_str = json_block_match.group(1)
+        try:
+            plan = json.loads(json_str)
+        except json.JSONDecodeError:
+            json_str = None
+    if json_str is None:
+        try:
+            json_start = reply_text.index("{")
+            json_end = reply_text.rindex("}") + 1
+            json_str = reply_text[json_start:json_end]
+            plan = json.loads(json_str)
+        except (ValueError, json.JSONDecodeError):
+            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', reply_text, re.DOTALL)
+            if json_match:
+                try:
+                    plan = json.loads(json_match.group(0))
+                except json.JSONDecodeError:
+                    pass
+    if plan is None:
+        return None
+    return validate_plan(plan)[0]
+
+
+def sample_plan(slots):
+    return {
+        "day": "Monday",
+        "slots": [
+            {
+                "time": f"{7 + i % 14:02d}:00",
+                "label": f"Meal {i} {{light}}",
+                "description": 'Moong dal cheela with mint chutney, "no sugar" {swap: paneer}',
+                "protein_g": 12,
+                "carbs_g": 20,
+                "calories_kcal": 250,
+            }
+            for i in range(slots)
+        ],
+    }
+
+
+def adversarial_replies(size):
+    """{case: reply text} with each reply about `size` characters long."""
+    small = json.dumps(sample_plan(6))
+    slot_len = len(json.dumps(sample_plan(1)["slots"][0])) + 2
+    large = json.dumps(sample_plan(max(1, size // slot_len)))
+    prose = "Here is your plan {with love}. Swap {rice} for {millets} if you like! "
+    fence = "```json\n{ \"tip\": 1 } see above\n"
+    return {
+        "valid_large": "Sure! Here's your plan:\n```json\n" + large + "\n```\nEnjoy {and stay hydrated}.",
+        "string_braces": prose * max(1, (size - len(small)) // len(prose)) + small,
+        "fence_storm": fence * max(1, (size - len(small)) // len(fence)) + small,
+        "brace_storm": "{ " * max(1, (size - len(small)) // 2) + small,
+        "truncated": large[: max(1, len(large) - 40)],
+    }
+
+
+def timed(fn, text, repeat):
+    """(best seconds over `repeat` runs, whether a plan was found)."""
+    best = None
+    found = False
+    for _ in range(repeat):
+        started = time.perf_counter()
+        found = fn(text) is not None
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, found
+
+
+class Command(BaseCommand):
+    help = 'Benchmark diet plan JSON extraction on large adversarial replies; writes JSON results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=200000, help='Approximate reply size in characters (default: 200000).')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the best time is kept (default: 3).')
+        parser.add_argument('--no-legacy', action='store_true', help='Skip timing the old extraction (slow on large sizes).')
+        parser.add_argument('--output', default='benchmark-plan-json.json', help='JSON results file (default: benchmark-plan-json.json).')
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        cases = {}
+        for name, text in adversarial_replies(options['size']).items():
+            seconds, found = timed(lambda t: extract_plan(t)[0], text, repeat)
+            result = {
+                'chars': len(text),
+                'seconds': round(seconds, 4),
+                'chars_per_second': round(len(text) / seconds) if seconds else None,
+                'found_plan': found,
+            }
+            if not options['no_legacy']:
+                legacy_seconds, legacy_found = timed(legacy_extract, text, repeat)
+                result['legacy_seconds'] = round(legacy_seconds, 4)
+                result['legacy_found_plan'] = legacy_found
+            cases[name] = result
+            line = f"{name}: {len(text)} chars in {result['seconds']}s (plan found: {found})"
+            if 'legacy_seconds' in result:
+                line += f"; legacy {result['legacy_seconds']}s (plan found: {result['legacy_found_plan']})"
+            self.stdout.write(line)
+
+        results = {
+            'benchmark': 'plan_json',
+            'timestamp': timezone.now().isoformat(),
+            'size': options['size'],
+            'repeat': repeat,
+            'cases': cases,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(results, fh, indent=2)
+            fh.write('\n')
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
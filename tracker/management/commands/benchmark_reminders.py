@@ -0,0 +1,205 @@
+"""
+Management command: load-test the reminder pipeline.
+
+Seeds N synthetic users with a breakfast reminder due right now, points email
+delivery at an in-process SMTP sink on 127.0.0.1, runs send_reminders and writes
+emails/sec, DB queries per email and peak RSS as JSON so releases can be compared:
+
+    python manage.py benchmark_reminders --users 10000 --output bench-10k.json
+    python manage.py benchmark_reminders --users 100000 --workers 4
+
+Everything runs inside one transaction that is rolled back at the end, so the
+synthetic users, ReminderLog updates and next_due_at updates never persist. Real
+users who happen to be due are sent to the sink too (and counted), so prefer an
+empty or staging database for clean numbers.
+"""
+import json
+import os
+import platform
+import socketserver
+import sys
+import threading
+import time
+import uuid
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from tracker.management.commands.send_reminders import QueryCounter
+from tracker.models import NotificationPreference
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SEED_BATCH_SIZE = 5000
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages from smtplib and count them."""
+
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        self.reply(b'220 sink ESMTP ready')
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line.rstrip(b'\r\n') == b'.':
+                    in_data = False
+                    self.server.count_message()
+                    self.reply(b'250 OK: queued')
+                continue
+            command = line[:4].upper()
+            if command in (b'EHLO', b'HELO'):
+                self.reply(b'250-sink')
+                self.reply(b'250 8BITMIME')
+            elif command == b'DATA':
+                in_data = True
+                self.reply(b'354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply(b'221 Bye')
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply(b'250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Threaded SMTP server on an ephemeral localhost port that discards mail."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.thread = threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count_message(self):
+        with self.lock:
+            self.messages += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        self.server_close()
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark send_reminders against synthetic users and a local SMTP sink; writes JSON results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Synthetic opted-in users to seed (default: 10000).')
+        parser.add_argument('--workers', type=int, default=1, help='Passed to send_reminders --workers (default: 1).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Passed to send_reminders --batch-size.')
+        parser.add_argument('--output', default='benchmark-reminders.json', help='JSON results file (default: benchmark-reminders.json).')
+
+    def handle(self, *args, **options):
+        users = options['users']
+        with SMTPSink() as sink, transaction.atomic():
+            seed_seconds = self.seed(users)
+            self.stdout.write(f'Seeded {users} user(s) in {seed_seconds:.2f}s; running send_reminders...')
+
+            args = ['--rate', '0', '--workers', str(options['workers'])]
+            if options['batch_size']:
+                args += ['--batch-size', str(options['batch_size'])]
+            counter = QueryCounter()
+            smtp = override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST='127.0.0.1',
+                EMAIL_PORT=sink.port,
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+                EMAIL_HOST_USER='',
+                EMAIL_HOST_PASSWORD='',
+            )
+            with smtp, connection.execute_wrapper(counter), open(os.devnull, 'w') as devnull:
+                started = time.monotonic()
+                call_command('send_reminders', *args, stdout=devnull)
+                elapsed = time.monotonic() - started
+            emails = sink.messages
+            transaction.set_rollback(True)
+
+        results = {
+            'benchmark': 'send_reminders',
+            'timestamp': timezone.now().isoformat(),
+            'users': users,
+            'workers': options['workers'],
+            'batch_size': options['batch_size'],
+            'emails': emails,
+            'seconds': round(elapsed, 3),
+            'emails_per_second': round(emails / elapsed, 1) if elapsed else None,
+            'queries': counter.count,
+            'queries_per_email': round(counter.count / emails, 4) if emails else None,
+            'seed_seconds': round(seed_seconds, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(results, fh, indent=2)
+            fh.write('\n')
+        self.stdout.write(self.style.SUCCESS(
+            f"{emails} email(s) in {results['seconds']}s = {results['emails_per_second']} emails/s, "
+            f"{results['queries_per_email']} queries/email, peak RSS {results['peak_rss_mb']} MB. "
+            f"Results written to {options['output']}."
+        ))
+
+    def seed(self, count):
+        """Bulk-create `count` users whose breakfast reminder is due now. Returns seconds taken."""
+        started = time.monotonic()
+        User = get_user_model()
+        prefix = f'bench_{uuid.uuid4().hex[:8]}_'
+        now = timezone.now()
+        # now is UTC; a breakfast_time of this minute makes every seeded user due immediately
+        due_time = now.replace(second=0, microsecond=0).time()
+        for start in range(0, count, SEED_BATCH_SIZE):
+            stop = min(start + SEED_BATCH_SIZE, count)
+            User.objects.bulk_create([
+                # '!' marks an unusable password
+                User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password='!')
+                for i in range(start, stop)
+            ])
+        user_ids = User.objects.filter(username__startswith=prefix).values_list('pk', flat=True)
+        batch = []
+        for user_id in user_ids.iterator(chunk_size=SEED_BATCH_SIZE):
+            batch.append(NotificationPreference(
+                user_id=user_id,
+                time_zone='UTC',
+                breakfast_time=due_time,
+                water_reminder=False,
+                stretch_reminder=False,
+                daily_log_reminder=False,
+                next_due_at=now,
+            ))
+            if len(batch) >= SEED_BATCH_SIZE:
+                NotificationPreference.objects.bulk_create(batch)
+                batch = []
+        NotificationPreference.objects.bulk_create(batch)
+        return time.monotonic() - started
@@ -0,0 +1,169 @@
+"""
+Management command: send one notification (events & workshops, health tips or app
+updates) to every user who has that notification type enabled.
+
+    python manage.py broadcast_notification health_tips --dry-run
+    python manage.py broadcast_notification app_updates --subject "New in PCOD GirlCare" --body-file update.txt
+    python manage.py broadcast_notification app_updates --resume
+
+Eligible users come from a single NotificationPreference query that is streamed
+with .iterator() and sent in fixed-size chunks over one reused SMTP connection
+(tracker.mailer). After every chunk the last user id and counts are written to a
+checkpoint file, so a crashed broadcast continues where it stopped with --resume.
+"""
+import json
+import os
+from pathlib import Path
+
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracker.mailer import ParallelMailer, email_rate_limiter
+from tracker.models import NotificationPreference
+from tracker.notifications import SAMPLE_EMAIL_APP_UPDATES, SAMPLE_EMAIL_EVENTS_WORKSHOPS, SAMPLE_EMAIL_HEALTH_TIPS
+
+BROADCAST_DEFAULTS = {
+    'events_workshops': {
+        'subject': "Events & workshops, just for you 🌸",
+        'body': SAMPLE_EMAIL_EVENTS_WORKSHOPS,
+    },
+    'health_tips': {
+        'subject': "A little health tip 💗",
+        'body': SAMPLE_EMAIL_HEALTH_TIPS,
+    },
+    'app_updates': {
+        'subject': "Something new in PCOD GirlCare ✨",
+        'body': SAMPLE_EMAIL_APP_UPDATES,
+    },
+}
+
+CHUNK_SIZE = 500
+
+
+def eligible_recipients(notification_type, after_user_id=0):
+    """(user_id, email) of users with notification_type enabled and an email, by user id. One query."""
+    return (
+        NotificationPreference.objects.filter(**{notification_type: True}, user_id__gt=after_user_id)
+        .exclude(user__email='')
+        .order_by('user_id')
+        .values_list('user_id', 'user__email')
+    )
+
+
+class Checkpoint:
+    """Progress of one broadcast, persisted as JSON after every chunk."""
+
+    def __init__(self, path, notification_type):
+        self.path = Path(path)
+        self.notification_type = notification_type
+        self.last_user_id = 0
+        self.sent = 0
+        self.failed = 0
+        self.completed = False
+
+    def load(self):
+        data = json.loads(self.path.read_text())
+        if data.get('notification_type') != self.notification_type:
+            raise CommandError(
+                f"Checkpoint {self.path} belongs to a {data.get('notification_type')!r} broadcast, "
+                f"not {self.notification_type!r}."
+            )
+        self.last_user_id = data.get('last_user_id', 0)
+        self.sent = data.get('sent', 0)
+        self.failed = data.get('failed', 0)
+        self.completed = data.get('completed', False)
+
+    def save(self):
+        data = {
+            'notification_type': self.notification_type,
+            'last_user_id': self.last_user_id,
+            'sent': self.sent,
+            'failed': self.failed,
+            'completed': self.completed,
+            'updated_at': timezone.now().isoformat(),
+        }
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps(data) + '\n')
+        os.replace(tmp, self.path)
+
+
+class Command(BaseCommand):
+    help = 'Send an events/health-tips/app-updates email to every user who has it enabled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('notification_type', choices=sorted(BROADCAST_DEFAULTS))
+        parser.add_argument('--subject', default=None, help='Email subject (default: a per-type sample).')
+        parser.add_argument('--body-file', default=None, help='Plain-text file with the email body (default: a per-type sample).')
+        parser.add_argument('--dry-run', action='store_true', help='Only count eligible recipients.')
+        parser.add_argument(
+            '--checkpoint',
+            default=None,
+            help='Checkpoint file (default: broadcast-<notification_type>.checkpoint.json).',
+        )
+        parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint file.')
+        parser.add_argument('--workers', type=int, default=1, help='Sender threads, one SMTP connection each (default: 1).')
+
+    def handle(self, *args, **options):
+        notification_type = options['notification_type']
+        defaults = BROADCAST_DEFAULTS[notification_type]
+        subject = options['subject'] or defaults['subject']
+        body = Path(options['body_file']).read_text() if options['body_file'] else defaults['body']
+        checkpoint = Checkpoint(
+            options['checkpoint'] or f'broadcast-{notification_type}.checkpoint.json',
+            notification_type,
+        )
+        if options['resume']:
+            if not checkpoint.path.exists():
+                raise CommandError(f'No checkpoint at {checkpoint.path} to resume from.')
+            checkpoint.load()
+            if checkpoint.completed:
+                self.stdout.write(self.style.NOTICE(f'Broadcast in {checkpoint.path} already completed.'))
+                return
+            self.stdout.write(f'Resuming after user id {checkpoint.last_user_id} ({checkpoint.sent} already sent).')
+        elif checkpoint.path.exists() and not options['dry_run']:
+            checkpoint.load()
+            if not checkpoint.completed:
+                raise CommandError(
+                    f'An unfinished broadcast is recorded in {checkpoint.path}. '
+                    'Use --resume to continue it, or delete the file to start over.'
+                )
+            checkpoint = Checkpoint(checkpoint.path, notification_type)
+
+        recipients = eligible_recipients(notification_type, checkpoint.last_user_id)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'[dry-run] Would send {notification_type} to {recipients.count()} user(s).'
+            ))
+            return
+
+        mailer = ParallelMailer(workers=options['workers'], rate_limiter=email_rate_limiter())
+        with mailer:
+            chunk = []
+            for user_id, email in recipients.iterator(chunk_size=CHUNK_SIZE):
+                email = email.strip()
+                if email:
+                    chunk.append((user_id, EmailMessage(subject=subject, body=body, from_email=None, to=[email])))
+                if len(chunk) >= CHUNK_SIZE:
+                    self.send_chunk(chunk, mailer, checkpoint)
+                    chunk = []
+            self.send_chunk(chunk, mailer, checkpoint)
+        checkpoint.completed = True
+        checkpoint.save()
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. Sent {notification_type} to {checkpoint.sent} user(s), {checkpoint.failed} failed.'
+        ))
+
+    def send_chunk(self, chunk, mailer, checkpoint):
+        if not chunk:
+            return
+        results = mailer.send_many([message for _, message in chunk])
+        for (_, message), ok in zip(chunk, results):
+            if ok:
+                checkpoint.sent += 1
+            else:
+                checkpoint.failed += 1
+                self.stdout.write(self.style.ERROR(f'Failed to send to {message.to[0]}'))
+        checkpoint.last_user_id = chunk[-1][0]
+        checkpoint.save()
+        self.stdout.write(f'Progress: {checkpoint.sent} sent, {checkpoint.failed} failed, last user id {checkpoint.last_user_id}.')
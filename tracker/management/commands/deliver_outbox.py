@@ -0,0 +1,135 @@
+"""
+Management command: deliver queued emails from EmailOutbox (password reset, notifications).
+Run periodically via cron, or keep it running with --loop.
+
+Each worker claims a batch of due rows with a conditional UPDATE (only rows still
+pending, or whose claim has gone stale, are taken), so several workers can run at
+once without sending the same email twice. Sent rows are marked 'sent'; failed rows
+are rescheduled with exponential backoff and marked 'failed' after --max-attempts.
+"""
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from tracker.mailer import ParallelMailer, email_rate_limiter, outbox_message
+from tracker.models import EmailOutbox
+
+
+def claim_batch(limit, lease_seconds):
+    """
+    Claim up to `limit` due outbox rows for this worker and return them.
+    A row is due if it is pending and available, or stuck in 'sending' for longer
+    than lease_seconds (its worker died). The UPDATE re-checks that condition, so a
+    row claimed by another worker in the meantime is skipped.
+    """
+    now = timezone.now()
+    due = (
+        Q(status=EmailOutbox.STATUS_PENDING, available_at__lte=now)
+        | Q(status=EmailOutbox.STATUS_SENDING, claimed_at__lt=now - timedelta(seconds=lease_seconds))
+    )
+    ids = list(
+        EmailOutbox.objects.filter(due)
+        .order_by('available_at', 'pk')
+        .values_list('pk', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}'[:64]
+    EmailOutbox.objects.filter(due, pk__in=ids).update(
+        status=EmailOutbox.STATUS_SENDING, claimed_by=token, claimed_at=now,
+    )
+    return list(EmailOutbox.objects.filter(claimed_by=token, status=EmailOutbox.STATUS_SENDING))
+
+
+def mark_sent(entries):
+    if entries:
+        EmailOutbox.objects.filter(pk__in=[e.pk for e in entries]).update(
+            status=EmailOutbox.STATUS_SENT, sent_at=timezone.now(), last_error='',
+        )
+
+
+def mark_failed(entry, error, max_attempts, backoff):
+    """Reschedule a failed row with exponential backoff, or give up after max_attempts."""
+    attempts = entry.attempts + 1
+    if attempts >= max_attempts:
+        status = EmailOutbox.STATUS_FAILED
+        available_at = entry.available_at
+    else:
+        status = EmailOutbox.STATUS_PENDING
+        available_at = timezone.now() + timedelta(seconds=backoff * (2 ** (attempts - 1)))
+    EmailOutbox.objects.filter(pk=entry.pk).update(
+        status=status,
+        attempts=F('attempts') + 1,
+        available_at=available_at,
+        last_error=str(error or 'Not accepted by the mail server')[:1000],
+        claimed_by='',
+        claimed_at=None,
+    )
+    return status
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the EmailOutbox table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Rows claimed per batch (default: 100).')
+        parser.add_argument('--workers', type=int, default=1, help='Sender threads (default: 1).')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Give up on a row after this many failures (default: 5).')
+        parser.add_argument('--backoff', type=float, default=60, help='Base retry delay in seconds, doubled per failure (default: 60).')
+        parser.add_argument('--lease', type=int, default=600, help='Seconds before a claimed row from a dead worker is reclaimed (default: 600).')
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll for new rows.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop when idle (default: 5).')
+
+    def handle(self, *args, **options):
+        mailer = ParallelMailer(
+            workers=options['workers'],
+            rate_limiter=email_rate_limiter(),
+            retry_attempts=0,  # failures are rescheduled in the table instead
+        )
+        sent = failed = 0
+        with mailer:
+            while True:
+                if options['loop']:
+                    # Drop a DB connection the server has closed; otherwise keep it open between polls.
+                    close_old_connections()
+                batch = claim_batch(options['batch_size'], options['lease'])
+                if batch:
+                    s, f = self.deliver(batch, mailer, options['max_attempts'], options['backoff'])
+                    sent += s
+                    failed += f
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Done. Sent {sent} email(s), {failed} failed.'))
+
+    def deliver(self, batch, mailer, max_attempts, backoff):
+        """Send one claimed batch and record the outcome of every row. Returns (sent, failed)."""
+        messages = []
+        entries = []
+        failed = 0
+        for entry in batch:
+            try:
+                messages.append(outbox_message(entry))
+                entries.append(entry)
+            except Exception as e:
+                mark_failed(entry, e, max_attempts, backoff)
+                failed += 1
+        results = mailer.send_many(messages)
+        sent_entries = []
+        for entry, ok in zip(entries, results):
+            if ok:
+                sent_entries.append(entry)
+            else:
+                status = mark_failed(entry, None, max_attempts, backoff)
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Failed to send to {entry.to_email} ({status}).'))
+        mark_sent(sent_entries)
+        return len(sent_entries), failed
@@ -0,0 +1,168 @@
+"""
+Management command: generate tomorrow's AI diet plan for every active user overnight.
+Run once a night via cron or Task Scheduler (e.g. 02:00), when Gemini is quiet.
+
+Most users open the diet plan page in the morning, so "Generate my diet plan"
+load (and Gemini rate limiting) peaks then. This command makes those calls off
+peak: for every user with a DailyLog in the last --active-days days, it asks for
+a plan based on their latest log and stores it as DietDayLog.pending_plan for
+the target date. In the morning, diet_plan_generate returns that plan with one
+read instead of a model call.
+
+Users are read in chunks (keyset pagination on pk) and their plans are generated
+on --workers threads, so at most that many Gemini calls are in flight. Each plan
+is saved as soon as it arrives, and users who already have a plan or a pending
+plan for the date are skipped. A run that is stopped, crashes, or gives up after
+--max-failures failed plans therefore resumes where it left off when it is
+started again.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from tracker.models import DailyLog, DietDayLog
+from tracker.views import generate_diet_plan
+
+# Users read (and their plans submitted to the workers) per chunk.
+CHUNK_SIZE = 100
+
+
+def users_to_plan(day, since):
+    """
+    Active users (a DailyLog on or after `since`) with neither a plan nor a pending
+    plan for `day`, in pk order. This is the checkpoint: finished users drop out.
+    """
+    planned = DietDayLog.objects.filter(date=day).filter(
+        Q(plan__isnull=False) | Q(pending_plan__isnull=False)
+    ).values('user_id')
+    active = DailyLog.objects.filter(date__gte=since).values('user_id')
+    return (
+        get_user_model().objects.filter(is_active=True, pk__in=active)
+        .exclude(pk__in=planned)
+        .order_by('pk')
+    )
+
+
+def store_pending_plan(user_id, day, plan):
+    """Save plan as the user's pending plan for day, unless they have inserted a plan for it meanwhile."""
+    obj, _ = DietDayLog.objects.get_or_create(user_id=user_id, date=day)
+    DietDayLog.objects.filter(pk=obj.pk, plan__isnull=True).update(
+        pending_plan=plan, pending_generated_at=timezone.now(),
+    )
+
+
+def pregenerate(user, day):
+    """Worker-thread body: generate and store one user's plan. Returns an error message or None."""
+    try:
+        plan, err = generate_diet_plan(user, day=day)
+        if plan is None:
+            return err or 'No plan returned.'
+        store_pending_plan(user.pk, day, plan)
+        return None
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Pre-generate tomorrow's AI diet plan for active users (stored as a pending plan)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            default=None,
+            help='Date to generate plans for, YYYY-MM-DD (default: tomorrow).',
+        )
+        parser.add_argument(
+            '--active-days',
+            type=int,
+            default=7,
+            help='Only users with a daily log in this many recent days (default: 7).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Plans generated at the same time, i.e. concurrent Gemini calls (default: 4).',
+        )
+        parser.add_argument(
+            '--max-failures',
+            type=int,
+            default=20,
+            help='Stop after this many failed plans (e.g. the API quota is used up); a rerun resumes (default: 20).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the users who would get a plan without calling the model.',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid --date {options['date']!r}; expected YYYY-MM-DD.")
+        else:
+            day = today + timedelta(days=1)
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        if not options['dry_run'] and not getattr(settings, 'GEMINI_API_KEY', '').strip():
+            raise CommandError('GEMINI_API_KEY is not set.')
+        since = today - timedelta(days=max(options['active_days'], 1) - 1)
+
+        if not options['dry_run']:
+            # Pending plans for past days were never inserted; they are of no use any more
+            DietDayLog.objects.filter(date__lt=today, pending_plan__isnull=False).update(
+                pending_plan=None, pending_generated_at=None,
+            )
+
+        started = time.monotonic()
+        generated = failed = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='pregenerate') as pool:
+            while failed < options['max_failures']:
+                chunk = list(users_to_plan(day, since).filter(pk__gt=last_pk)[:CHUNK_SIZE])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+                if options['dry_run']:
+                    for user in chunk:
+                        self.stdout.write(f'[dry-run] Would generate the {day} plan for {user.username}')
+                    generated += len(chunk)
+                    continue
+                futures = {pool.submit(pregenerate, user, day): user for user in chunk}
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    user = futures[future]
+                    err = future.result()
+                    if err is None:
+                        generated += 1
+                        self.stdout.write(self.style.SUCCESS(f'Generated the {day} plan for {user.username}'))
+                    else:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(f'Failed for {user.username}: {err}'))
+                        if failed == options['max_failures']:
+                            # Plans not started yet are left for the next run
+                            for pending in futures:
+                                pending.cancel()
+        elapsed = time.monotonic() - started
+
+        if failed >= options['max_failures']:
+            self.stdout.write(self.style.WARNING(
+                f'Stopped after {failed} failed plan(s). Run the command again to resume.'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. {"Would generate" if options["dry_run"] else "Generated"} {generated} plan(s) for {day}, '
+            f'{failed} failed, in {elapsed:.1f}s with {options["workers"]} worker(s).'
+        ))
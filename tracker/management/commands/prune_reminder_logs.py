@@ -0,0 +1,56 @@
+"""
+Management command: delete old ReminderLog rows so the table stays bounded.
+Run once a day via cron or Task Scheduler.
+
+send_reminders only reads today's and yesterday's rows (users' local dates differ
+from the server date by at most a day), so anything older is kept just for the
+admin and can go after REMINDER_LOG_RETENTION_DAYS (default 30).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tracker.models import ReminderLog
+
+# Rows deleted per statement, to keep each delete's locks short on large tables.
+DELETE_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Delete ReminderLog rows older than the retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Keep this many days of logs (default: REMINDER_LOG_RETENTION_DAYS, 30).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows that would be deleted.',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'REMINDER_LOG_RETENTION_DAYS', 30)
+        # Never prune the two days send_reminders still needs
+        days = max(days, 2)
+        cutoff = timezone.localdate() - timedelta(days=days)
+        old = ReminderLog.objects.filter(date__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'[dry-run] Would delete {old.count()} reminder log row(s) before {cutoff}.')
+            return
+
+        deleted = 0
+        while True:
+            pks = list(old.order_by().values_list('pk', flat=True)[:DELETE_BATCH_SIZE])
+            if not pks:
+                break
+            deleted += ReminderLog.objects.filter(pk__in=pks).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} reminder log row(s) before {cutoff}.'))
@@ -0,0 +1,46 @@
+"""
+Management command: recompute every user's DailyLogStats from their daily logs.
+
+The stats are kept up to date by the DailyLog save and delete signals, so this is
+only needed after writes that skip them: QuerySet.update(), raw SQL, loaddata, or
+a restored database. Users without a stats row get one on their next page view
+anyway; this builds them all at once.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from tracker.models import DailyLog, DailyLogStats
+
+
+class Command(BaseCommand):
+    help = "Recompute users' rolling daily log stats (7/14/30-day averages and latest log)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=None,
+            help='Only rebuild the stats of this username.',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        user_ids = DailyLog.objects.order_by().values_list('user_id', flat=True).distinct()
+        if options['user']:
+            user_ids = user_ids.filter(user__username=options['user'])
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                stats = DailyLogStats.objects.select_for_update().filter(user_id=user_id).first()
+                stats = stats or DailyLogStats(user_id=user_id)
+                stats.fill(today)
+                stats.save()
+            rebuilt += 1
+        # Users whose logs are all gone keep no stats
+        stale = DailyLogStats.objects.exclude(user_id__in=DailyLog.objects.values('user_id'))
+        if options['user']:
+            stale = stale.filter(user__username=options['user'])
+        removed = stale.delete()[0]
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the daily log stats of {rebuilt} user(s) as of {today}; removed {removed} stale row(s).'
+        ))
@@ -2,20 +2,52 @@
 Management command: send scheduled reminder emails to users who have them enabled.
 Run periodically via cron or Task Scheduler (e.g. every 15 min).
 
-Schedule (hours in server timezone, default UTC):
-- 8:00  → breakfast_reminder
-- 10:00, 14:00, 16:00 → water_reminder
-- 11:00 → stretch_reminder
-- 20:00 → daily_log_reminder
+Every user has their own timezone and a local time per reminder type
+(NotificationPreference.time_zone, breakfast_time, water_time, stretch_time,
+daily_log_time; defaults 8:00, 10:00, 11:00 and 20:00). A reminder is sent once
+its local time has passed, for up to REMINDER_GRACE_MINUTES afterwards.
 
-Each reminder is sent at most once per user per day (ReminderLog).
+NotificationPreference.next_due_at (indexed, UTC) holds each user's next
+scheduled reminder, so a run only reads users who are due now: its cost grows
+with the mail it sends, not with the user base. Due users are processed in
+chunks: one query for the chunk, one for its ReminderLog rows, one bulk insert
+plus a few bitmask updates to record what was sent, and one bulk update of
+next_due_at.
+
+Each reminder is sent at most once per user per local day (ReminderLog keeps one
+row per user per day with a bitmask of the reminder types sent).
+Mail goes out over reused SMTP connections (tracker.mailer) and only messages
+the server accepted are logged; users with a failed send stay due and are
+retried by the next run. With --workers N, sends are spread over N threads
+sharing one EMAIL_RATE_LIMIT token bucket; transient failures are retried with
+exponential backoff.
+
+With --daemon the command stays running instead of being started by cron: it
+sleeps until the earliest next_due_at (or --interval seconds, whichever comes
+first), keeps its DB and SMTP connections open between runs, writes a heartbeat
+after every run and exits cleanly on SIGTERM / SIGINT.
+
+With --shard i/N (0 <= i < N) a run only handles users whose id % N == i, so a
+run can be split across N machines without a coordinator. Shards never share a
+user, and ReminderLog's per-day bitmask is the final guard against double
+sends (e.g. if two nodes are started with the same shard by mistake).
 """
-from django.core.management.base import BaseCommand
+import json
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.models import F, Min
 from django.utils import timezone
-from django.contrib.auth import get_user_model
 
-from tracker.models import NotificationPreference, ReminderLog
-from tracker.views import send_notification_email
+from tracker.mailer import ParallelMailer, email_rate_limiter, notification_message
+from tracker.models import NotificationPreference, ReminderLog, reminder_grace
 
 
 # Playful, Zomato-style content for each reminder type
@@ -58,15 +90,80 @@ REMINDER_CONTENT = {
     },
 }
 
-# Which hour(s) (in server timezone) trigger which reminder. One reminder type can have multiple hours.
-SCHEDULE = {
-    8: ['breakfast_reminder'],
-    10: ['water_reminder'],
-    11: ['stretch_reminder'],
-    14: ['water_reminder'],
-    16: ['water_reminder'],
-    20: ['daily_log_reminder'],
-}
+# Recipients are sent and logged in chunks of this size: one bulk insert per chunk.
+# Flushing periodically (not only at the end) keeps a crashed run from re-sending
+# everything it already delivered.
+CHUNK_SIZE = 500
+
+# Daemon mode never sleeps less than this between runs, so users left due by a
+# failed send are retried without busy-looping.
+MIN_SLEEP_SECONDS = 30
+
+
+class QueryCounter:
+    """Database execute wrapper that counts the queries issued while it is installed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def parse_shard(value):
+    """Parse '--shard i/N' into (i, N). Raises CommandError if it is malformed or out of range."""
+    try:
+        index, total = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise CommandError(f'Invalid --shard {value!r}; expected i/N, e.g. 0/4.')
+    if total < 1 or not 0 <= index < total:
+        raise CommandError(f'Invalid --shard {value!r}; need N >= 1 and 0 <= i < N.')
+    return index, total
+
+
+def shard_preferences(queryset, shard):
+    """Restrict a NotificationPreference queryset to one shard (user_id % N == i). shard=None keeps all."""
+    if shard is None:
+        return queryset
+    index, total = shard
+    return queryset.alias(shard_key=F('user_id') % total).filter(shard_key=index)
+
+
+def due_preferences(now, shard=None):
+    """Preferences whose next scheduled reminder is at or before now (uses the next_due_at index)."""
+    queryset = NotificationPreference.objects.filter(next_due_at__lte=now).select_related('user')
+    return shard_preferences(queryset, shard)
+
+
+def sent_masks(candidates):
+    """{(user_id, date): sent bitmask} of the ReminderLog rows for these candidates. One query."""
+    if not candidates:
+        return {}
+    rows = ReminderLog.objects.filter(
+        user_id__in={prefs.user_id for prefs, _, _ in candidates},
+        date__in={local_date for _, _, local_date in candidates},
+    ).values_list('user_id', 'date', 'sent')
+    return {(user_id, day): sent for user_id, day, sent in rows}
+
+
+def record_sent(sent):
+    """
+    Set sent bits from {(user_id, date): bitmask}: one insert for missing day rows
+    (existing ones are skipped via unique_user_reminder_day), then one OR-update per
+    distinct (date, bitmask). OR-ing makes concurrent runs and repeats harmless.
+    """
+    if not sent:
+        return
+    ReminderLog.objects.bulk_create(
+        [ReminderLog(user_id=user_id, date=day) for user_id, day in sent],
+        ignore_conflicts=True,
+    )
+    groups = defaultdict(list)
+    for (user_id, day), mask in sent.items():
+        groups[(day, mask)].append(user_id)
+    for (day, mask), user_ids in groups.items():
+        ReminderLog.objects.filter(user_id__in=user_ids, date=day).update(sent=F('sent').bitor(mask))
 
 
 class Command(BaseCommand):
@@ -78,55 +175,185 @@ class Command(BaseCommand):
             action='store_true',
             help='Print what would be sent without sending or logging.',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Messages per SMTP session before reconnecting (default: EMAIL_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of sender threads, each with its own SMTP connection (default: 1).',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=None,
+            help='Max messages per second across all workers (default: EMAIL_RATE_LIMIT; 0 = unlimited).',
+        )
+        parser.add_argument(
+            '--daemon',
+            action='store_true',
+            help='Keep running and wake up whenever reminders are due (instead of cron).',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=300,
+            help='Daemon mode: longest sleep between runs in seconds, i.e. the heartbeat period (default: 300).',
+        )
+        parser.add_argument(
+            '--heartbeat-file',
+            default=None,
+            help='Daemon mode: file rewritten with a JSON status line after every run.',
+        )
+        parser.add_argument(
+            '--shard',
+            default=None,
+            help='Only handle users with id %% N == i, given as i/N (e.g. 0/4). Run one process per shard.',
+        )
 
     def handle(self, *args, **options):
+        options['shard'] = parse_shard(options['shard']) if options['shard'] else None
+        mailer = ParallelMailer(
+            workers=options['workers'],
+            rate_limiter=email_rate_limiter(options['rate']),
+            batch_size=options['batch_size'],
+        )
+        with mailer:
+            if options['daemon']:
+                self.run_daemon(options, mailer)
+            else:
+                self.run_once(options, mailer)
+
+    def run_once(self, options, mailer):
+        """One pass over every due user. Returns (sent, due)."""
         dry_run = options['dry_run']
+        shard = options['shard']
+        now = timezone.now()
+        grace = reminder_grace()
+
+        started = time.monotonic()
+        counter = QueryCounter()
+        retried_before = mailer.retried
+        sent = due = 0
+        with connection.execute_wrapper(counter):
+            # Keyset pagination on pk: users left due by a failed send are not
+            # re-read in this run; the next run retries them.
+            last_pk = 0
+            while True:
+                chunk = list(due_preferences(now, shard).filter(pk__gt=last_pk).order_by('pk')[:CHUNK_SIZE])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+                due += len(chunk)
+                sent += self.process_chunk(chunk, now, grace, dry_run, mailer)
+        elapsed = time.monotonic() - started
+
+        label = f'Shard {shard[0]}/{shard[1]}: ' if shard else ''
+        self.stdout.write(self.style.SUCCESS(f'{label}Done. Sent (or would send) {sent} reminder(s) to {due} due user(s).'))
+        self.stdout.write(
+            f'{label}Run stats: {counter.count} quer{"y" if counter.count == 1 else "ies"}, {elapsed:.2f}s wall time, '
+            f'{sent / elapsed if elapsed else 0:.1f} email(s)/s, '
+            f'{mailer.workers} worker(s), {mailer.retried - retried_before} retried send(s).'
+        )
+        return sent, due
+
+    def run_daemon(self, options, mailer):
+        """Run, sleep until the next reminder is due (at most --interval), repeat until signalled."""
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write(self.style.NOTICE(f'Received signal {signum}; stopping after the current run.'))
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        self.stdout.write(self.style.SUCCESS(f'Reminder daemon started (pid {os.getpid()}).'))
+        runs = 0
+        while not stop.is_set():
+            # Drop a DB connection the server has closed; otherwise keep it open between runs.
+            close_old_connections()
+            sent, due = self.run_once(options, mailer)
+            runs += 1
+            wake_at = self.next_wake(options['interval'], options['shard'])
+            self.heartbeat(options['heartbeat_file'], runs, sent, due, wake_at, options['shard'])
+            stop.wait(max(0.0, (wake_at - timezone.now()).total_seconds()))
+        self.stdout.write(self.style.SUCCESS(f'Reminder daemon stopped after {runs} run(s).'))
+
+    def next_wake(self, interval, shard=None):
+        """Earliest next_due_at (one indexed MIN query), clamped to [MIN_SLEEP_SECONDS, interval] from now."""
         now = timezone.now()
-        today = timezone.localdate()
-        hour = now.hour
-
-        reminder_types = SCHEDULE.get(hour, [])
-        if not reminder_types:
-            if not dry_run:
-                self.stdout.write(self.style.NOTICE(f'No reminders scheduled for hour {hour} (server time).'))
-            return
-
-        User = get_user_model()
-        sent = 0
-        for reminder_type in reminder_types:
-            if reminder_type not in REMINDER_CONTENT:
+        earliest = shard_preferences(NotificationPreference.objects.all(), shard).aggregate(earliest=Min('next_due_at'))['earliest']
+        latest_wake = now + timedelta(seconds=max(interval, MIN_SLEEP_SECONDS))
+        wake_at = min(earliest, latest_wake) if earliest else latest_wake
+        return max(wake_at, now + timedelta(seconds=MIN_SLEEP_SECONDS))
+
+    def heartbeat(self, path, runs, sent, due, wake_at, shard=None):
+        """Log that the daemon is alive and, if configured, rewrite the heartbeat file atomically."""
+        status = {
+            'pid': os.getpid(),
+            'shard': f'{shard[0]}/{shard[1]}' if shard else None,
+            'at': timezone.now().isoformat(),
+            'runs': runs,
+            'last_sent': sent,
+            'last_due': due,
+            'next_wake': wake_at.isoformat(),
+        }
+        self.stdout.write(f'Heartbeat: run {runs}, next wake {wake_at:%Y-%m-%d %H:%M:%S %Z}.')
+        if path:
+            target = Path(path)
+            tmp = target.with_name(target.name + '.tmp')
+            tmp.write_text(json.dumps(status) + '\n')
+            os.replace(tmp, target)
+
+    def process_chunk(self, chunk, now, grace, dry_run, mailer):
+        """Send every due, not-yet-logged reminder for a chunk of preferences, then advance next_due_at."""
+        candidates = []
+        for prefs in chunk:
+            local_date, reminder_types = prefs.due_reminders(now, grace)
+            candidates.extend((prefs, reminder_type, local_date) for reminder_type in reminder_types)
+        already_sent = sent_masks(candidates)
+
+        outgoing = []
+        for prefs, reminder_type, local_date in candidates:
+            if already_sent.get((prefs.user_id, local_date), 0) & ReminderLog.REMINDER_BITS[reminder_type]:
                 continue
             content = REMINDER_CONTENT[reminder_type]
-            # Users who have this reminder enabled and have an email
-            prefs_qs = NotificationPreference.objects.filter(
-                **{reminder_type: True}
-            ).select_related('user')
-            for prefs in prefs_qs:
-                user = prefs.user
-                email = (getattr(user, 'email', None) or '').strip()
-                if not email:
-                    continue
-                # Already sent this reminder today?
-                if ReminderLog.objects.filter(user=user, date=today, reminder_type=reminder_type).exists():
-                    continue
-                if dry_run:
-                    self.stdout.write(
-                        self.style.SUCCESS(f'[dry-run] Would send {reminder_type} to {email}')
-                    )
-                    sent += 1
-                    continue
-                try:
-                    n = send_notification_email(
-                        user, reminder_type,
-                        content['subject'], content['body'],
-                    )
-                    if n:
-                        ReminderLog.objects.get_or_create(
-                            user=user, date=today, reminder_type=reminder_type,
-                        )
-                        sent += 1
-                        self.stdout.write(self.style.SUCCESS(f'Sent {reminder_type} to {email}'))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'Failed to send {reminder_type} to {email}: {e}'))
-
-        self.stdout.write(self.style.SUCCESS(f'Done. Sent (or would send) {sent} reminder(s).'))
+            message = notification_message(prefs.user, content['subject'], content['body'])
+            if message is None:
+                continue
+            outgoing.append((prefs, reminder_type, local_date, message))
+
+        if dry_run:
+            for _, reminder_type, _, message in outgoing:
+                self.stdout.write(
+                    self.style.SUCCESS(f'[dry-run] Would send {reminder_type} to {message.to[0]}')
+                )
+            return len(outgoing)
+
+        results = mailer.send_many([message for *_, message in outgoing])
+        sent = defaultdict(int)
+        sent_count = 0
+        failed_users = set()
+        for (prefs, reminder_type, local_date, message), ok in zip(outgoing, results):
+            if ok:
+                sent[(prefs.user_id, local_date)] |= ReminderLog.REMINDER_BITS[reminder_type]
+                sent_count += 1
+                self.stdout.write(self.style.SUCCESS(f'Sent {reminder_type} to {message.to[0]}'))
+            else:
+                failed_users.add(prefs.user_id)
+                self.stdout.write(self.style.ERROR(f'Failed to send {reminder_type} to {message.to[0]}'))
+        record_sent(sent)
+
+        # Users with a failed send keep their current next_due_at and are retried next run
+        # (until the grace period for that reminder runs out).
+        advanced = []
+        for prefs in chunk:
+            if prefs.user_id not in failed_users:
+                prefs.next_due_at = prefs.compute_next_due_at(now)
+                advanced.append(prefs)
+        NotificationPreference.objects.bulk_update(advanced, ['next_due_at'])
+        return sent_count
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:18
+
+import datetime
+import tracker.models
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_existing_due(apps, schema_editor):
+    # Make every existing preference due once; the next send_reminders run computes
+    # the real next_due_at from the new per-user schedule.
+    NotificationPreference = apps.get_model("tracker", "NotificationPreference")
+    NotificationPreference.objects.update(next_due_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0009_add_email_outbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notificationpreference",
+            name="breakfast_time",
+            field=models.TimeField(
+                default=datetime.time(8, 0),
+                help_text="Local time for the breakfast reminder",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationpreference",
+            name="daily_log_time",
+            field=models.TimeField(
+                default=datetime.time(20, 0),
+                help_text="Local time for the daily log reminder",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationpreference",
+            name="next_due_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="Next scheduled reminder (UTC). Kept up to date on save and by send_reminders.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationpreference",
+            name="stretch_time",
+            field=models.TimeField(
+                default=datetime.time(11, 0),
+                help_text="Local time for the stretch reminder",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationpreference",
+            name="time_zone",
+            field=models.CharField(
+                default=tracker.models.default_reminder_timezone,
+                help_text="IANA timezone for reminder times, e.g. Asia/Kolkata",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationpreference",
+            name="water_time",
+            field=models.TimeField(
+                default=datetime.time(10, 0),
+                help_text="Local time for the water reminder",
+            ),
+        ),
+        migrations.RunPython(mark_existing_due, migrations.RunPython.noop),
+    ]
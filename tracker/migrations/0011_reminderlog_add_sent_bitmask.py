@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0010_notificationpreference_add_reminder_schedule"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="reminderlog",
+            name="unique_user_date_reminder",
+        ),
+        migrations.AddField(
+            model_name="reminderlog",
+            name="sent",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="Bitmask of reminder types sent (REMINDER_BITS)"
+            ),
+        ),
+    ]
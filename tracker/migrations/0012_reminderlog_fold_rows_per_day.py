@@ -0,0 +1,69 @@
+# Fold the old one-row-per-reminder-type ReminderLog rows into one row per user per
+# day with a bitmask. Kept separate from the schema changes around it so each step
+# runs in its own transaction.
+
+from django.db import migrations
+
+# Same as ReminderLog.REMINDER_BITS at the time of this migration
+REMINDER_BITS = {
+    "breakfast_reminder": 1,
+    "water_reminder": 2,
+    "stretch_reminder": 4,
+    "daily_log_reminder": 8,
+}
+BATCH_SIZE = 1000
+
+
+def fold_rows(apps, schema_editor):
+    ReminderLog = apps.get_model("tracker", "ReminderLog")
+    rows = (
+        ReminderLog.objects.order_by("user_id", "date", "pk")
+        .values_list("pk", "user_id", "date", "reminder_type")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    keep = {}  # (user_id, date) -> [pk of the surviving row, mask]
+    duplicates = []
+    for pk, user_id, date, reminder_type in rows:
+        entry = keep.setdefault((user_id, date), [pk, 0])
+        entry[1] |= REMINDER_BITS.get(reminder_type, 0)
+        if entry[0] != pk:
+            duplicates.append(pk)
+    by_mask = {}
+    for pk, mask in keep.values():
+        by_mask.setdefault(mask, []).append(pk)
+    for mask, pks in by_mask.items():
+        for start in range(0, len(pks), BATCH_SIZE):
+            ReminderLog.objects.filter(pk__in=pks[start : start + BATCH_SIZE]).update(
+                sent=mask
+            )
+    for start in range(0, len(duplicates), BATCH_SIZE):
+        ReminderLog.objects.filter(
+            pk__in=duplicates[start : start + BATCH_SIZE]
+        ).delete()
+
+
+def unfold_rows(apps, schema_editor):
+    ReminderLog = apps.get_model("tracker", "ReminderLog")
+    extra = []
+    for row in ReminderLog.objects.order_by("pk").iterator(chunk_size=BATCH_SIZE):
+        types = [t for t, bit in REMINDER_BITS.items() if row.sent & bit]
+        if not types:
+            continue
+        row.reminder_type = types[0]
+        row.save(update_fields=["reminder_type"])
+        extra.extend(
+            ReminderLog(user_id=row.user_id, date=row.date, reminder_type=t, sent=0)
+            for t in types[1:]
+        )
+    ReminderLog.objects.bulk_create(extra, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0011_reminderlog_add_sent_bitmask"),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_rows, unfold_rows),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0012_reminderlog_fold_rows_per_day"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Give the column a default first so unapplying RemoveField can re-add it
+        migrations.AlterField(
+            model_name="reminderlog",
+            name="reminder_type",
+            field=models.CharField(db_index=True, default="", max_length=32),
+        ),
+        migrations.RemoveField(
+            model_name="reminderlog",
+            name="reminder_type",
+        ),
+        migrations.AddConstraint(
+            model_name="reminderlog",
+            constraint=models.UniqueConstraint(
+                fields=("user", "date"), name="unique_user_reminder_day"
+            ),
+        ),
+    ]
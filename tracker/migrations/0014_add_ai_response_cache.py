@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0013_reminderlog_remove_reminder_type"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AIResponseCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="SHA-256 of the endpoint and normalized request",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "endpoint",
+                    models.CharField(
+                        choices=[
+                            ("generate_recipe", "Recipe"),
+                            ("find_order_options", "Order options"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("dish_name", models.CharField(max_length=255)),
+                ("description", models.TextField(blank=True)),
+                ("price_range", models.CharField(blank=True, max_length=20)),
+                ("response", models.TextField()),
+                (
+                    "hits",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Requests answered from this entry"
+                    ),
+                ),
+                (
+                    "misses",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Times this entry was (re)generated by the model",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField()),
+                (
+                    "last_used_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "AI response cache entry",
+                "verbose_name_plural": "AI response cache",
+                "ordering": ["-last_used_at"],
+            },
+        ),
+    ]
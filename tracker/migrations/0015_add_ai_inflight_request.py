@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0014_add_ai_response_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AIInflightRequest",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "fingerprint",
+                    models.CharField(
+                        help_text="SHA-256 of the request payload",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                ("started_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                ("reply", models.TextField(blank=True)),
+                ("error", models.TextField(blank=True)),
+            ],
+            options={
+                "verbose_name": "AI in-flight request",
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0016_add_diet_plan_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dietdaylog",
+            name="pending_generated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="dietdaylog",
+            name="pending_plan",
+            field=models.JSONField(
+                blank=True, help_text="Pre-generated plan, not inserted yet", null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tracker", "0017_add_diet_day_log_pending_plan"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AIQuotaBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "endpoint",
+                    models.CharField(
+                        choices=[
+                            ("pcod_support_chat", "PCOD support chat"),
+                            ("diet_planner_chat", "Diet planner chat"),
+                            ("diet_plan_generate", "Generate diet plan"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("tokens", models.FloatField()),
+                ("updated_at", models.DateTimeField()),
+                ("day", models.DateField()),
+                (
+                    "allowed",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Requests let through today"
+                    ),
+                ),
+                (
+                    "denied",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Requests refused with 429 today"
+                    ),
+                ),
+                ("last_denied_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ai_quota_buckets",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "AI quota bucket",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "-allowed"], name="aiquotabucket_day_allowed"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "endpoint"),
+                        name="unique_user_ai_quota_endpoint",
+                    )
+                ],
+            },
+        ),
+    ]
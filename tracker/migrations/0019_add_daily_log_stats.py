@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("tracker", "0018_add_ai_quota_bucket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyLogStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="log_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("as_of", models.DateField()),
+                ("windows", models.JSONField(default=dict)),
+                (
+                    "latest",
+                    models.JSONField(
+                        blank=True,
+                        help_text="Most recent log (date and metrics)",
+                        null=True,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "daily log stats",
+                "verbose_name_plural": "daily log stats",
+            },
+        ),
+    ]
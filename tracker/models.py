@@ -1,5 +1,10 @@
-from django.db import models
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.utils import timezone
 
 
 class DailyLog(models.Model):
@@ -33,10 +38,195 @@ class DailyLog(models.Model):
     def __str__(self):
         return f"{self.user.username} – {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so a save only applies its change to DailyLogStats
+        if set(DailyLogStats.SNAPSHOT_FIELDS) <= set(field_names):
+            instance._stats_snapshot = instance.stats_snapshot()
+        return instance
+
+    def stats_snapshot(self):
+        """The values DailyLogStats keeps for this log: date plus SNAPSHOT_FIELDS."""
+        return {name: getattr(self, name) for name in DailyLogStats.SNAPSHOT_FIELDS}
+
+
+class DailyLogStats(models.Model):
+    """
+    Per-user rolling sums of DailyLog metrics, so insights, wellness and the AI context read
+    averages without loading logs. windows maps each window length in days ("7", "14", "30")
+    to {"logs": n, metric: [sum, count], ...} over the days as_of-N+1 .. as_of. latest holds
+    the most recent log's SNAPSHOT_FIELDS.
+
+    Every DailyLog save or delete applies its change (tracker.signals). When the date moves
+    past as_of, the windows are rolled forward by subtracting the logs that left them (one
+    query over at most 30 days). rebuild_log_stats recomputes everything from the logs.
+    """
+    WINDOWS = (7, 14, 30)
+    METRICS = ('mood', 'wellness_score', 'acne_level', 'fatigue_level', 'bloating_level', 'sleep_quality')
+    SNAPSHOT_FIELDS = ('date', *METRICS, 'steps', 'water_glasses', 'cycle_day')
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='log_stats',
+    )
+    as_of = models.DateField()
+    windows = models.JSONField(default=dict)
+    latest = models.JSONField(null=True, blank=True, help_text='Most recent log (date and metrics)')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'daily log stats'
+        verbose_name_plural = 'daily log stats'
+
+    def __str__(self):
+        return f"{self.user} stats as of {self.as_of}"
+
+    @staticmethod
+    def empty_windows():
+        return {
+            str(days): {'logs': 0, **{metric: [0, 0] for metric in DailyLogStats.METRICS}}
+            for days in DailyLogStats.WINDOWS
+        }
+
+    @staticmethod
+    def _latest(user_id):
+        log = DailyLog.objects.filter(user_id=user_id).order_by('-date').values(*DailyLogStats.SNAPSHOT_FIELDS).first()
+        return DailyLogStats._json_snapshot(log)
+
+    @staticmethod
+    def _json_snapshot(snapshot):
+        if snapshot is None:
+            return None
+        return {**snapshot, 'date': snapshot['date'].isoformat()}
+
+    def _add(self, snapshot, sign, days):
+        """Add (sign=1) or remove (sign=-1) one log's metrics in the `days` window."""
+        window = self.windows[str(days)]
+        window['logs'] += sign
+        for metric in self.METRICS:
+            value = snapshot.get(metric)
+            if value is not None:
+                window[metric][0] += sign * value
+                window[metric][1] += sign
+
+    def _in_window(self, day, days, as_of=None):
+        as_of = as_of or self.as_of
+        return as_of - timedelta(days=days) < day <= as_of
+
+    def fill(self, today):
+        """Recompute every window ending today and the latest log from the logs (two queries)."""
+        self.as_of = today
+        self.windows = self.empty_windows()
+        logs = DailyLog.objects.filter(
+            user_id=self.user_id, date__gt=today - timedelta(days=max(self.WINDOWS)), date__lte=today,
+        ).values(*self.SNAPSHOT_FIELDS)
+        for snapshot in logs:
+            for days in self.WINDOWS:
+                if self._in_window(snapshot['date'], days):
+                    self._add(snapshot, 1, days)
+        self.latest = self._latest(self.user_id)
+
+    def roll(self, today):
+        """Move the windows to end today: subtract logs that left them, add logs dated up to today that entered."""
+        if today == self.as_of:
+            return
+        if today < self.as_of or (today - self.as_of).days >= max(self.WINDOWS):
+            self.fill(today)
+            return
+        logs = DailyLog.objects.filter(
+            user_id=self.user_id, date__gt=self.as_of - timedelta(days=max(self.WINDOWS)), date__lte=today,
+        ).values(*self.SNAPSHOT_FIELDS)
+        for snapshot in logs:
+            for days in self.WINDOWS:
+                before = self._in_window(snapshot['date'], days)
+                after = self._in_window(snapshot['date'], days, as_of=today)
+                if before != after:
+                    self._add(snapshot, 1 if after else -1, days)
+        self.as_of = today
+
+    def apply(self, old, new):
+        """Apply one log changing from `old` to `new` (snapshots; None for created / deleted)."""
+        for snapshot, sign in ((old, -1), (new, 1)):
+            if snapshot is None:
+                continue
+            for days in self.WINDOWS:
+                if self._in_window(snapshot['date'], days):
+                    self._add(snapshot, sign, days)
+        latest_date = self.latest and self.latest['date']
+        if new is not None and (latest_date is None or new['date'].isoformat() >= latest_date):
+            self.latest = self._json_snapshot(new)
+        elif old is not None and old['date'].isoformat() == latest_date:
+            # The latest log was deleted or moved to an earlier date
+            self.latest = self._latest(self.user_id)
+
+    @classmethod
+    def for_user(cls, user_id, today=None):
+        """The user's stats with windows ending today: one read, plus a roll forward on the first read of a day."""
+        today = today or timezone.localdate()
+        stats = cls.objects.filter(user_id=user_id).first()
+        if stats is not None and stats.as_of == today:
+            return stats
+        with transaction.atomic():
+            stats = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if stats is None:
+                stats = cls(user_id=user_id)
+                stats.fill(today)
+                try:
+                    with transaction.atomic():
+                        stats.save(force_insert=True)
+                except IntegrityError:
+                    # Built by a concurrent request meanwhile
+                    return cls.objects.get(user_id=user_id)
+            elif stats.as_of != today:
+                stats.roll(today)
+                stats.save()
+        return stats
+
+    @classmethod
+    def record(cls, user_id, old, new, known=True):
+        """
+        Keep a user's stats in step with one DailyLog write. old / new are the log's snapshots
+        before and after (None when it was created / deleted). known=False means the old values
+        are unknown, so the stats are recomputed.
+        """
+        today = timezone.localdate()
+        with transaction.atomic():
+            stats = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if stats is None:
+                if new is not None:
+                    # Built lazily from the logs, which already include this write
+                    cls.for_user(user_id, today)
+                return
+            if not known:
+                stats.fill(today)
+            else:
+                stats.roll(today)
+                stats.apply(old, new)
+            stats.save()
+
+    def average(self, metric, days=7):
+        """Average of metric over the last `days` days (logs where it was set), or None."""
+        total, count = self.windows[str(days)][metric]
+        return total / count if count else None
+
+    def log_count(self, days=7):
+        return self.windows[str(days)]['logs']
+
+    def latest_log(self):
+        """The most recent log's snapshot (date as a date), or None if the user has no logs."""
+        if self.latest is None:
+            return None
+        return {**self.latest, 'date': date.fromisoformat(self.latest['date'])}
+
 
 class DietDayLog(models.Model):
     """
     One row per user per date. Stores only the AI-generated diet plan: plan JSON, note, and checked slots.
+    pending_plan is a plan pre-generated overnight (pregenerate_diet_plans) that the user has not
+    inserted yet; "Generate my diet plan" returns it without a model call.
     """
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -47,6 +237,8 @@ class DietDayLog(models.Model):
     plan = models.JSONField(null=True, blank=True, help_text='AI plan: { "day": str, "slots": [...] }')
     note = models.TextField(blank=True)
     checked = models.JSONField(default=list, help_text='List of bools, one per slot')
+    pending_plan = models.JSONField(null=True, blank=True, help_text='Pre-generated plan, not inserted yet')
+    pending_generated_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         constraints = [
@@ -58,8 +250,63 @@ class DietDayLog(models.Model):
         return f"{self.user.username} diet – {self.date}"
 
 
+class UserDataVersion(models.Model):
+    """
+    A counter bumped on every write to a user's DailyLog or DietDayLog rows (tracker.signals).
+    Cached pages (tracker.page_cache) are keyed on it, so any write invalidates them in every
+    process; changed_at is the time of the user's latest write.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='data_version',
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user} data v{self.version}"
+
+    @classmethod
+    def bump(cls, user_id):
+        now = timezone.now()
+        if cls.objects.filter(user_id=user_id).update(version=models.F('version') + 1, changed_at=now):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, version=1, changed_at=now)
+        except IntegrityError:
+            # Created by a concurrent write meanwhile
+            cls.objects.filter(user_id=user_id).update(version=models.F('version') + 1, changed_at=now)
+
+    @classmethod
+    def current(cls, user_id):
+        """(version, changed_at) for the user; (0, None) before their first write."""
+        row = cls.objects.filter(user_id=user_id).values_list('version', 'changed_at').first()
+        return row or (0, None)
+
+
+def default_reminder_timezone():
+    return settings.TIME_ZONE
+
+
+def reminder_grace():
+    """How long after its local time a scheduled reminder may still be sent."""
+    return timedelta(minutes=getattr(settings, 'REMINDER_GRACE_MINUTES', 60))
+
+
 class NotificationPreference(models.Model):
-    """Per-user email notification toggles. One row per user."""
+    """Per-user email notification toggles and reminder schedule. One row per user."""
+
+    # Scheduled reminder type -> field holding its local send time
+    REMINDER_TIME_FIELDS = {
+        'breakfast_reminder': 'breakfast_time',
+        'water_reminder': 'water_time',
+        'stretch_reminder': 'stretch_time',
+        'daily_log_reminder': 'daily_log_time',
+    }
+
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -93,6 +340,22 @@ class NotificationPreference(models.Model):
         default=True,
         help_text='Daily log reminder – remind to enter today\'s log',
     )
+    # Reminder schedule, in the user's own timezone
+    time_zone = models.CharField(
+        max_length=64,
+        default=default_reminder_timezone,
+        help_text='IANA timezone for reminder times, e.g. Asia/Kolkata',
+    )
+    breakfast_time = models.TimeField(default=time(8, 0), help_text='Local time for the breakfast reminder')
+    water_time = models.TimeField(default=time(10, 0), help_text='Local time for the water reminder')
+    stretch_time = models.TimeField(default=time(11, 0), help_text='Local time for the stretch reminder')
+    daily_log_time = models.TimeField(default=time(20, 0), help_text='Local time for the daily log reminder')
+    next_due_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Next scheduled reminder (UTC). Kept up to date on save and by send_reminders.',
+    )
 
     class Meta:
         verbose_name = 'Notification preference'
@@ -101,22 +364,277 @@ class NotificationPreference(models.Model):
     def __str__(self):
         return f"Notifications for {self.user.username}"
 
+    def get_zone(self):
+        """The user's ZoneInfo, falling back to the server TIME_ZONE for unknown names."""
+        try:
+            return ZoneInfo(self.time_zone)
+        except (ZoneInfoNotFoundError, ValueError):
+            return ZoneInfo(settings.TIME_ZONE)
+
+    def scheduled_reminders(self):
+        """(reminder_type, local time) for every enabled scheduled reminder."""
+        return [
+            (reminder_type, getattr(self, field))
+            for reminder_type, field in self.REMINDER_TIME_FIELDS.items()
+            if getattr(self, reminder_type)
+        ]
+
+    def due_reminders(self, now, grace):
+        """
+        Reminder types whose local time today has passed, by at most `grace`.
+        Returns (local_date, [reminder_type, ...]); local_date is the ReminderLog date.
+        """
+        zone = self.get_zone()
+        local_now = now.astimezone(zone)
+        local_date = local_now.date()
+        due = []
+        for reminder_type, at_time in self.scheduled_reminders():
+            at = datetime.combine(local_date, at_time, tzinfo=zone)
+            if at <= local_now < at + grace:
+                due.append(reminder_type)
+        return local_date, due
+
+    def compute_next_due_at(self, after):
+        """Earliest scheduled reminder strictly after `after`, in UTC, or None if none are enabled."""
+        zone = self.get_zone()
+        local_after = after.astimezone(zone)
+        candidates = []
+        for _, at_time in self.scheduled_reminders():
+            for day_offset in (0, 1):
+                at = datetime.combine(local_after.date() + timedelta(days=day_offset), at_time, tzinfo=zone)
+                if at > local_after:
+                    candidates.append(at)
+                    break
+        if not candidates:
+            return None
+        return min(candidates).astimezone(dt_timezone.utc)
+
+    def save(self, *args, **kwargs):
+        # Look back one grace period so a reminder whose time just passed is still picked
+        # up by the next run (ReminderLog prevents a second send if it already went out).
+        self.next_due_at = self.compute_next_due_at(timezone.now() - reminder_grace())
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'next_due_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'next_due_at']
+        super().save(*args, **kwargs)
+
 
 class ReminderLog(models.Model):
-    """Tracks which reminders were already sent today so we don't send twice."""
+    """
+    Which scheduled reminders were already sent to a user on a (local) day, so we don't send twice.
+    One row per user per day; `sent` is a bitmask of REMINDER_BITS. Old rows are removed by prune_reminder_logs.
+    """
+    REMINDER_BITS = {
+        'breakfast_reminder': 1,
+        'water_reminder': 2,
+        'stretch_reminder': 4,
+        'daily_log_reminder': 8,
+    }
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='reminder_logs',
     )
     date = models.DateField(db_index=True)
-    reminder_type = models.CharField(max_length=32, db_index=True)
+    sent = models.PositiveSmallIntegerField(default=0, help_text='Bitmask of reminder types sent (REMINDER_BITS)')
 
     class Meta:
         constraints = [
-            models.UniqueConstraint(fields=['user', 'date', 'reminder_type'], name='unique_user_date_reminder'),
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_user_reminder_day'),
         ]
         ordering = ['-date']
 
     def __str__(self):
-        return f"{self.user.username} – {self.date} – {self.reminder_type}"
+        return f"{self.user.username} – {self.date} – {', '.join(self.sent_types()) or 'none'}"
+
+    def sent_types(self):
+        """Reminder types whose bit is set, in REMINDER_BITS order."""
+        return [reminder_type for reminder_type, bit in self.REMINDER_BITS.items() if self.sent & bit]
+
+
+class EmailOutbox(models.Model):
+    """
+    Outgoing email queued by web code and delivered by `manage.py deliver_outbox`,
+    so SMTP latency never happens inside a request.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=254, blank=True, help_text='Empty = DEFAULT_FROM_EMAIL')
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now, help_text='Not delivered before this time (retry backoff)')
+    claimed_by = models.CharField(max_length=64, blank=True, help_text='Claim token of the worker sending this row')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available'),
+        ]
+        ordering = ['created_at']
+        verbose_name = 'Email outbox entry'
+        verbose_name_plural = 'Email outbox'
+
+    def __str__(self):
+        return f"{self.to_email} – {self.subject} ({self.status})"
+
+
+class AIResponseCache(models.Model):
+    """
+    Shared cache of AI replies for the recipe and order-options endpoints, keyed on the
+    normalized request (dish name, description, price range) so every user and every app
+    process reuses one generation. Entries expire after AI_CACHE_TTL seconds; beyond
+    AI_CACHE_MAX_ENTRIES the least recently used are evicted (tracker.ai_cache).
+    """
+    ENDPOINT_RECIPE = 'generate_recipe'
+    ENDPOINT_ORDER_OPTIONS = 'find_order_options'
+    ENDPOINT_CHOICES = [
+        (ENDPOINT_RECIPE, 'Recipe'),
+        (ENDPOINT_ORDER_OPTIONS, 'Order options'),
+    ]
+
+    key = models.CharField(max_length=64, unique=True, help_text='SHA-256 of the endpoint and normalized request')
+    endpoint = models.CharField(max_length=32, choices=ENDPOINT_CHOICES)
+    dish_name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    price_range = models.CharField(max_length=20, blank=True)
+    response = models.TextField()
+    hits = models.PositiveIntegerField(default=0, help_text='Requests answered from this entry')
+    misses = models.PositiveIntegerField(default=0, help_text='Times this entry was (re)generated by the model')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['-last_used_at']
+        verbose_name = 'AI response cache entry'
+        verbose_name_plural = 'AI response cache'
+
+    def __str__(self):
+        return f"{self.get_endpoint_display()}: {self.dish_name}"
+
+
+class AIInflightRequest(models.Model):
+    """
+    Cross-process single-flight record for identical Gemini requests (GEMINI_SINGLE_FLIGHT_SHARED).
+    The first process to insert a fingerprint makes the call and stores the outcome; other
+    processes asking the same thing meanwhile wait for it instead of generating it again.
+    """
+    fingerprint = models.CharField(max_length=64, unique=True, help_text='SHA-256 of the request payload')
+    started_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    reply = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'AI in-flight request'
+
+    def __str__(self):
+        return f"{self.fingerprint[:12]} ({'done' if self.completed_at else 'running'})"
+
+
+class DietPlanJob(models.Model):
+    """
+    One background "Generate my diet plan" request. The POST creates the row and returns
+    its id; a worker thread (tracker.jobs) runs the generation and stores the validated
+    plan or the error here, and the page polls diet_plan_job_status until it is done.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='diet_plan_jobs',
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    last_user_text = models.TextField(blank=True)
+    last_assistant_text = models.TextField(blank=True)
+    plan = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    imported_at = models.DateTimeField(null=True, blank=True, help_text='When the plan was inserted into the diet plan')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='dietplanjob_user_created'),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user.username} diet plan job – {self.status}"
+
+    def as_dict(self):
+        """Status payload for the polling endpoint."""
+        data = {'job_id': str(self.id), 'status': self.status}
+        if self.status == self.STATUS_DONE:
+            data['plan'] = self.plan
+        elif self.status == self.STATUS_FAILED:
+            data['error'] = self.error
+        return data
+
+
+class AIQuotaBucket(models.Model):
+    """
+    Token bucket limiting one user's calls to one AI endpoint (tracker.quotas). tokens is the
+    balance at updated_at; it refills continuously up to the endpoint's burst size. allowed and
+    denied count today's requests (reset when `day` changes) for the admin's top consumers.
+    """
+    ENDPOINT_CHOICES = [
+        ('pcod_support_chat', 'PCOD support chat'),
+        ('diet_planner_chat', 'Diet planner chat'),
+        ('diet_plan_generate', 'Generate diet plan'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='ai_quota_buckets',
+    )
+    endpoint = models.CharField(max_length=32, choices=ENDPOINT_CHOICES)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+    day = models.DateField()
+    allowed = models.PositiveIntegerField(default=0, help_text='Requests let through today')
+    denied = models.PositiveIntegerField(default=0, help_text='Requests refused with 429 today')
+    last_denied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint'], name='unique_user_ai_quota_endpoint'),
+        ]
+        indexes = [
+            models.Index(fields=['day', '-allowed'], name='aiquotabucket_day_allowed'),
+        ]
+        verbose_name = 'AI quota bucket'
+
+    def __str__(self):
+        return f"{self.user.username} – {self.endpoint}"
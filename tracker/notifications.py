@@ -0,0 +1,28 @@
+"""
+Sample email texts for the events & workshops, health tips and app updates
+notifications. Kept apart from the views so mail jobs such as
+`manage.py broadcast_notification` can import them without loading the web code.
+"""
+
+# Playful, Zomato-style email content for notifications (use as samples or override per type)
+SAMPLE_EMAIL_EVENTS_WORKSHOPS = (
+    "Hey you 👀\n\n"
+    "We've got something fun coming up — events & workshops just for you.\n\n"
+    "Your body was thinking about you today… Slow days are still progress 💗\n"
+    "Come say hi, learn something new, and don't forget — you're doing fine 🌸\n\n"
+    "— PCOD GirlCare"
+)
+SAMPLE_EMAIL_HEALTH_TIPS = (
+    "Hey you 👀\n\n"
+    "Your body was thinking about you today…\n\n"
+    "Slow days are still progress 💗 Drink some water, stretch a little, "
+    "and don't forget — you're doing fine 🌸\n\n"
+    "— PCOD GirlCare"
+)
+SAMPLE_EMAIL_APP_UPDATES = (
+    "Hey you 👀\n\n"
+    "We've been cooking something new for you — a little app update to make your journey smoother.\n\n"
+    "Check it out when you can. No rush — we'll be here 💗\n\n"
+    "— PCOD GirlCare"
+)
+
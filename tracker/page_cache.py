@@ -0,0 +1,65 @@
+"""
+Per-user cache of the data behind the dashboard, insights, wellness and cycle
+tracker pages.
+
+Each view splits its context into the part built from the user's logs (queries,
+averages, chart series) and the part that depends on the request: the session's
+motivation popup, the random motivation line, the daily myths and the bound
+form. The log part is cached under the user's UserDataVersion and today's date,
+so a reload without new data costs one version read instead of the log queries,
+and any DailyLog or DietDayLog write (which bumps the version) or a new day
+misses the old entries. Stale entries are never read again and expire after
+PAGE_CACHE_TTL seconds.
+
+Entries live in the PAGE_CACHE_ALIAS cache (default: "default", which is
+per-process memory unless CACHES is configured). Configure a shared backend
+such as Redis or Memcached so worker processes share entries.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import UserDataVersion
+
+DEFAULT_TTL = 3600
+
+
+class PageCacheStats:
+    """Hits and misses per page in this process, for the staff stats view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, page, hit):
+        with self.lock:
+            counts = self.counts.setdefault(page, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            pages = {page: dict(counts) for page, counts in self.counts.items()}
+        for counts in pages.values():
+            total = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = round(counts["hits"] / total, 3) if total else None
+        return pages
+
+
+page_stats = PageCacheStats()
+
+
+def page_context(page, user_id, today, build):
+    """
+    The cached result of build() for the user's page, rebuilt when their data version
+    or the date has changed since it was cached. build() must return a picklable dict.
+    """
+    version, _ = UserDataVersion.current(user_id)
+    key = f"page:{page}:{user_id}:{today.isoformat()}:{version}"
+    cache = caches[getattr(settings, "PAGE_CACHE_ALIAS", "default")]
+    context = cache.get(key)
+    page_stats.count(page, context is not None)
+    if context is None:
+        context = build()
+        cache.set(key, context, getattr(settings, "PAGE_CACHE_TTL", DEFAULT_TTL))
+    return context
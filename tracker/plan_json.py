@@ -0,0 +1,104 @@
+"""
+Diet plan JSON extraction and validation, shared by diet_planner_chat,
+diet_plan_generate and diet_plan_import.
+
+Model replies wrap the plan in prose, markdown fences or the
+---DIET_PLAN_JSON_START--- markers, and are sometimes cut off. extract_plan()
+makes one left-to-right pass over the reply. It matches braces while skipping
+braces inside JSON strings, and checks each balanced object as soon as it
+closes: the object is decoded and its slots validated, and the first valid plan
+is returned. Objects are only decoded when they close and never overlap, so the
+whole reply costs O(n) however malformed it is. There is no regex backtracking
+and no retry from every "{".
+"""
+import json
+import re
+
+REQUIRED_SLOT_FIELDS = ("time", "label", "description")
+MACRO_FIELDS = ("protein_g", "carbs_g", "calories_kcal")
+
+# The only characters the scan has to look at
+_TOKENS = re.compile(r'[{}"\\]')
+# A JSON object opens with a key or closes at once; "{curly}" prose is skipped without decoding
+_OBJECT_START = re.compile(r'\{\s*["}]')
+
+
+def object_spans(text, start=0, end=None):
+    """
+    Yield (start, end) of each outermost balanced {...} in text[start:end], in order.
+    Braces inside JSON strings are ignored, and so are quotes in prose outside any
+    object. Objects nested in a "{" that never closes (a stray brace in the prose, or
+    a reply cut off mid-JSON) are yielded at the end.
+    """
+    end = len(text) if end is None else end
+    opened = []
+    # Closed spans inside braces that are still open, outermost only
+    nested = []
+    in_string = False
+    skip_to = -1
+    for m in _TOKENS.finditer(text, start, end):
+        i = m.start()
+        if i < skip_to:
+            continue
+        ch = m.group()
+        if in_string:
+            if ch == "\\":
+                skip_to = i + 2
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = bool(opened)
+        elif ch == "{":
+            opened.append(i)
+        elif ch == "}" and opened:
+            span_start = opened.pop()
+            if not opened:
+                nested.clear()
+                yield span_start, i + 1
+                continue
+            while nested and nested[-1][0] > span_start:
+                nested.pop()
+            nested.append((span_start, i + 1))
+    yield from nested
+
+
+def validate_plan(plan):
+    """
+    Check a decoded plan against the slot schema: a dict with a non-empty 'slots' list
+    of objects, each with time, label and description. Missing macros default to 0.
+    Returns (plan, None) or (None, error_message).
+    """
+    if not isinstance(plan, dict):
+        return None, "Plan is not a JSON object."
+    slots = plan.get("slots")
+    if not isinstance(slots, list) or not slots:
+        return None, "Plan must contain a non-empty 'slots' list."
+    for idx, slot in enumerate(slots):
+        if not isinstance(slot, dict):
+            return None, f"Slot {idx} is not an object."
+        if any(field not in slot for field in REQUIRED_SLOT_FIELDS):
+            return None, f"Slot {idx} is missing required fields."
+        for field in MACRO_FIELDS:
+            slot.setdefault(field, 0)
+    return plan, None
+
+
+def extract_plan(text, start=0, end=None):
+    """
+    The first valid diet plan among the JSON objects in text[start:end].
+    Returns (plan, None); (None, error) if JSON objects were found but none is a valid
+    plan (the error is the first object's); or (None, None) if there is no JSON object.
+    """
+    first_error = None
+    for span_start, span_end in object_spans(text or "", start, end):
+        if not _OBJECT_START.match(text, span_start):
+            continue
+        try:
+            candidate = json.loads(text[span_start:span_end])
+        except ValueError:
+            continue
+        plan, err = validate_plan(candidate)
+        if plan is not None:
+            return plan, None
+        first_error = first_error or err
+    return None, first_error
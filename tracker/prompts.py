@@ -0,0 +1,141 @@
+"""
+Token-aware prompt building for the Gemini endpoints.
+
+The prompt is one string: system instruction, recent conversation, then the
+user message. Its size is estimated at ~4 characters per token and kept within
+a per-endpoint input budget (GEMINI_PROMPT_BUDGETS). The system instruction and
+the current message are always kept. When the prompt is over budget, the
+conversation is compacted in three steps, stopping as soon as it fits:
+1. Older turns are cut to short excerpts.
+2. The oldest turns are dropped.
+3. The newest turns are trimmed.
+Estimated token counts before and after compaction are logged for every call.
+"""
+import logging
+import math
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+HISTORY_TURNS = 6
+# Newest turns kept in full while older ones are cut to excerpts
+KEEP_FULL_TURNS = 2
+EXCERPT_CHARS = 240
+# last_user_text / last_assistant_text are excerpted to this length in the diet prompts
+PREFERENCE_CHARS = 600
+
+DEFAULT_BUDGET = 4000
+DEFAULT_PROMPT_BUDGETS = {
+    "pcod_support_chat": 3000,
+    "diet_planner_chat": 3500,
+    "diet_plan_generate": 3000,
+    "generate_recipe": 1000,
+    "find_order_options": 1000,
+}
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token); no API round-trip."""
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def prompt_budget(endpoint=None):
+    budgets = {**DEFAULT_PROMPT_BUDGETS, **getattr(settings, "GEMINI_PROMPT_BUDGETS", {})}
+    return budgets.get(endpoint, DEFAULT_BUDGET)
+
+
+def excerpt(text, max_chars):
+    """text cut to max_chars at a word boundary, with an ellipsis if anything was cut."""
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[: max(0, max_chars - 1)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip() + "…"
+
+
+def recent_turns(history):
+    """Last HISTORY_TURNS non-empty turns of a [{role, content}] history as [(speaker, text)]."""
+    turns = []
+    for h in (history or [])[-HISTORY_TURNS:]:
+        if not isinstance(h, dict):
+            continue
+        text = (h.get("content") or "").strip()
+        if text:
+            turns.append(("User" if h.get("role") == "user" else "Assistant", text))
+    return turns
+
+
+def render_prompt(system_instruction, turns, user_message):
+    # Use single-turn format: one user message with system context in the prompt (most reliable)
+    prompt_parts = []
+    if system_instruction:
+        prompt_parts.append(system_instruction)
+    if turns:
+        prompt_parts.append("\n\nRecent conversation:")
+        for who, text in turns:
+            prompt_parts.append(f"\n{who}: {text}")
+    prompt_parts.append("\n\nUser: " + user_message)
+    prompt_parts.append("\n\nAssistant:")
+    return "".join(prompt_parts)
+
+
+def _turns_tokens(turns):
+    return estimate_tokens(render_prompt("", turns, "")) - estimate_tokens(render_prompt("", [], ""))
+
+
+def compact_turns(turns, available):
+    """Shrink turns to fit `available` tokens: excerpt older turns, drop the oldest, then trim the newest."""
+    turns = list(turns)
+    if available <= 0:
+        return []
+    for i in range(max(0, len(turns) - KEEP_FULL_TURNS)):
+        if _turns_tokens(turns) <= available:
+            return turns
+        who, text = turns[i]
+        turns[i] = (who, excerpt(text, EXCERPT_CHARS))
+    while turns and _turns_tokens(turns) > available:
+        if len(turns) > 1:
+            turns.pop(0)
+            continue
+        # One turn left: trim it to what remains of the budget
+        who, text = turns[0]
+        room = available * CHARS_PER_TOKEN - len(f"\n\nRecent conversation:\n{who}: ")
+        turns = [(who, excerpt(text, room))] if room > EXCERPT_CHARS // 2 else []
+    return turns
+
+
+def build_prompt(user_message, system_instruction, history=None, endpoint=None):
+    """The full prompt for one call, with the conversation compacted to the endpoint's input budget."""
+    turns = recent_turns(history)
+    prompt = render_prompt(system_instruction, turns, user_message)
+    before = estimate_tokens(prompt)
+    budget = prompt_budget(endpoint)
+    if before > budget:
+        available = budget - estimate_tokens(render_prompt(system_instruction, [], user_message))
+        turns = compact_turns(turns, available)
+        prompt = render_prompt(system_instruction, turns, user_message)
+    logger.info(
+        "Prompt for %s: ~%s tokens before, ~%s after compaction (budget %s)",
+        endpoint or "gemini", before, estimate_tokens(prompt), budget,
+    )
+    return prompt
+
+
+def preference_context(last_user_text, last_assistant_text, history=None):
+    """
+    The "latest request / last reply" context appended to the diet prompts.
+    The assistant's last reply (which can be a whole previous plan) is left out when it is
+    already the last assistant turn in history, and excerpted otherwise.
+    """
+    preference_parts = []
+    if last_user_text:
+        preference_parts.append("User's latest request/preference: " + excerpt(last_user_text, PREFERENCE_CHARS))
+    if last_assistant_text:
+        last_in_history = next((text for who, text in reversed(recent_turns(history)) if who == "Assistant"), None)
+        if last_in_history != last_assistant_text.strip():
+            preference_parts.append("Assistant's last reply: " + excerpt(last_assistant_text, PREFERENCE_CHARS))
+    return " ".join(preference_parts) if preference_parts else ""
@@ -0,0 +1,132 @@
+"""
+Per-user AI quotas: a token bucket per user per AI endpoint.
+
+Each (user, endpoint) pair has a bucket holding up to `burst` tokens, refilled
+continuously at `per_hour` tokens an hour. A valid request takes one token just
+before the model call; malformed ones are refused without one. With the
+bucket empty the view answers 429 with Retry-After (seconds until the next
+token) and never reaches Gemini. Chat turns and plan generation draw on
+separate budgets (AI_QUOTAS), so a user who chats a lot can still generate a
+plan, and a stuck tab re-posting "Generate" cannot use up the chat budget.
+
+Buckets are AIQuotaBucket rows in the app database, so every worker process
+shares them. A token is taken with a compare-and-set UPDATE on updated_at, so
+concurrent requests from one user cannot spend the same token twice.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import AIQuotaBucket
+
+DEFAULT_QUOTAS = {
+    "chat": {"burst": 20, "per_hour": 60},
+    "plan": {"burst": 3, "per_hour": 6},
+}
+# The budget each endpoint draws on
+ENDPOINT_BUDGETS = {
+    "pcod_support_chat": "chat",
+    "diet_planner_chat": "chat",
+    "diet_plan_generate": "plan",
+}
+# Compare-and-set retries before a request racing the same user's other requests is refused
+CLAIM_ATTEMPTS = 5
+
+
+def quota(endpoint):
+    """(burst, tokens refilled per second) for endpoint. A burst of 0 turns the limit off."""
+    quotas = {**DEFAULT_QUOTAS, **getattr(settings, "AI_QUOTAS", {})}
+    budget = quotas[ENDPOINT_BUDGETS[endpoint]]
+    return budget["burst"], budget["per_hour"] / 3600
+
+
+def _count(field, today):
+    """UPDATE kwargs adding one to today's `field` (allowed or denied); a new day resets both."""
+    other = "denied" if field == "allowed" else "allowed"
+    return {
+        field: Case(When(day=today, then=F(field) + 1), default=Value(1)),
+        other: Case(When(day=today, then=F(other)), default=Value(0)),
+        # Last: MySQL applies SET clauses left to right
+        "day": today,
+    }
+
+
+def consume(user_id, endpoint):
+    """Take one token from the user's bucket. Returns 0 if allowed, else the seconds until a token is free."""
+    burst, rate = quota(endpoint)
+    if burst <= 0:
+        return 0
+    for _ in range(CLAIM_ATTEMPTS):
+        now = timezone.now()
+        today = timezone.localdate(now)
+        row = (
+            AIQuotaBucket.objects.filter(user_id=user_id, endpoint=endpoint)
+            .values("pk", "tokens", "updated_at")
+            .first()
+        )
+        if row is None:
+            try:
+                with transaction.atomic():
+                    AIQuotaBucket.objects.create(
+                        user_id=user_id, endpoint=endpoint, tokens=burst - 1, updated_at=now, day=today, allowed=1,
+                    )
+                return 0
+            except IntegrityError:
+                # The user's first request raced another one; read the new row
+                continue
+        elapsed = max(0.0, (now - row["updated_at"]).total_seconds())
+        tokens = min(float(burst), row["tokens"] + elapsed * rate)
+        if tokens < 1:
+            AIQuotaBucket.objects.filter(pk=row["pk"]).update(last_denied_at=now, **_count("denied", today))
+            return math.ceil((1 - tokens) / rate) if rate > 0 else 3600
+        if AIQuotaBucket.objects.filter(pk=row["pk"], updated_at=row["updated_at"]).update(
+            tokens=tokens - 1, updated_at=now, **_count("allowed", today),
+        ):
+            return 0
+    return 1
+
+
+def limit_message(endpoint, retry_after):
+    if retry_after < 90:
+        wait = f"{retry_after} second{'s' if retry_after != 1 else ''}"
+    else:
+        wait = f"{math.ceil(retry_after / 60)} minutes"
+    if ENDPOINT_BUDGETS[endpoint] == "plan":
+        return f"You've generated several diet plans recently. Please try again in about {wait}."
+    return f"You're sending messages faster than your AI quota allows. Please try again in about {wait}."
+
+
+async def quota_exceeded(user, endpoint):
+    """
+    Take a token from the user's bucket for endpoint. Returns None if allowed, else the 429
+    response (with Retry-After) to send instead of calling the model. AI views call it after
+    validating the request, just before the model call, so refused requests cost nothing.
+    """
+    retry_after = await sync_to_async(consume)(user.pk, endpoint)
+    if not retry_after:
+        return None
+    response = JsonResponse({"error": limit_message(endpoint, retry_after)}, status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def tokens_left(bucket, now=None):
+    """Current (refilled) balance of a bucket, for the admin."""
+    burst, rate = quota(bucket.endpoint)
+    elapsed = max(0.0, ((now or timezone.now()) - bucket.updated_at).total_seconds())
+    return min(float(burst), bucket.tokens + elapsed * rate)
+
+
+def top_consumers(limit=10):
+    """Today's heaviest users across all AI endpoints, most requests first: [{user__username, total_allowed, total_denied}]."""
+    return list(
+        AIQuotaBucket.objects.filter(day=timezone.localdate())
+        .values("user__username")
+        .annotate(total_allowed=Sum("allowed"), total_denied=Sum("denied"))
+        .order_by("-total_allowed", "-total_denied")[:limit]
+    )
@@ -0,0 +1,140 @@
+"""
+Per-day metric series for the charts, served as JSON by /api/series/.
+
+Daily log metrics come from DailyLog (None on days without a log or value). Diet
+metrics are the protein, carbs and energy of the meals ticked in that day's
+DietDayLog plan (None on days without a plan, so they do not pull bucket means
+towards 0; a plan with nothing ticked counts as 0). Every series has one point per
+calendar day from start to end, so several metrics share one x axis.
+
+Long ranges are downsampled to at most `points` points: the days are split into
+equal buckets ending on the last day (bucket_days = ceil(days / points), e.g.
+weekly for a year at the default 60 points), and each point is the mean of the
+bucket's values, dated by its first day. A year or five years of history thus
+cost the same payload and chart render time as two months. Buckets keep every
+metric on the same x axis, which per-series point picking (such as
+largest-triangle-three-buckets) would not.
+"""
+import math
+from datetime import timedelta
+
+from .models import DailyLog, DietDayLog
+
+# Series name -> DailyLog field
+LOG_METRICS = {
+    'weight': 'weight_kg',
+    'mood': 'mood',
+    'wellness': 'wellness_score',
+    'sleep': 'sleep_quality',
+    'acne': 'acne_level',
+    'fatigue': 'fatigue_level',
+    'bloating': 'bloating_level',
+    'steps': 'steps',
+    'water': 'water_glasses',
+    'cycle_day': 'cycle_day',
+}
+# Series name -> index in plan_totals()
+DIET_METRICS = {'protein': 0, 'carbs': 1, 'energy': 2}
+METRICS = (*LOG_METRICS, *DIET_METRICS)
+# Insights range choices: name -> days (None: since the first log)
+RANGES = {'30d': 30, '90d': 90, '1y': 365, 'all': None}
+# Points per series unless the request asks for fewer (or more, up to MAX_POINTS)
+DEFAULT_POINTS = 60
+MAX_POINTS = 366
+# Longest date range one request may ask for (ten years)
+MAX_DAYS = 3653
+
+
+def plan_totals(slots, checked):
+    """Compute protein, carbs, energy totals from plan slots using checked list."""
+    total_protein = total_carbs = total_energy = 0
+    if not slots or not isinstance(checked, list):
+        return 0, 0, 0
+    for idx, slot in enumerate(slots):
+        if idx < len(checked) and checked[idx] and isinstance(slot, dict):
+            total_protein += float(slot.get('protein_g', 0) or 0)
+            total_carbs += float(slot.get('carbs_g', 0) or 0)
+            total_energy += float(slot.get('calories_kcal', 0) or 0)
+    return total_protein, total_carbs, total_energy
+
+
+def first_date(user_id, metrics):
+    """The date of the user's first log (or plan, for diet metrics), or None."""
+    dates = []
+    if any(metric in LOG_METRICS for metric in metrics):
+        dates.append(DailyLog.objects.filter(user_id=user_id).order_by('date').values_list('date', flat=True).first())
+    if any(metric in DIET_METRICS for metric in metrics):
+        dates.append(
+            DietDayLog.objects.filter(user_id=user_id, plan__isnull=False)
+            .order_by('date').values_list('date', flat=True).first()
+        )
+    dates = [day for day in dates if day is not None]
+    return min(dates) if dates else None
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def downsample(days, series, points):
+    """(bucket start days, {metric: bucket means}, bucket_days) with at most `points` buckets."""
+    bucket_days = max(1, math.ceil(len(days) / max(1, points)))
+    if bucket_days == 1:
+        return days, series, 1
+    # Buckets end on the last day, so the latest point is a full bucket; the first may be short
+    edges = list(range(len(days) % bucket_days, len(days), bucket_days))
+    if edges[0] != 0:
+        edges.insert(0, 0)
+    bounds = list(zip(edges, edges[1:] + [len(days)]))
+    means = {
+        metric: [_mean(values[lo:hi]) for lo, hi in bounds]
+        for metric, values in series.items()
+    }
+    return [days[lo] for lo, _ in bounds], means, bucket_days
+
+
+def build_series(user_id, metrics, start, end, points=DEFAULT_POINTS):
+    """
+    {'dates': [...], 'labels': [...], 'bucket_days': n, 'series': {metric: [...]}} from start
+    to end inclusive, downsampled to at most `points` points. metrics must be names from
+    METRICS. At most one query per model.
+    """
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    series = {}
+
+    log_metrics = [metric for metric in metrics if metric in LOG_METRICS]
+    if log_metrics:
+        fields = [LOG_METRICS[metric] for metric in log_metrics]
+        by_date = {
+            row[0]: row[1:]
+            for row in DailyLog.objects.filter(user_id=user_id, date__gte=start, date__lte=end)
+            .values_list('date', *fields)
+        }
+        for idx, metric in enumerate(log_metrics):
+            values = [by_date[day][idx] if day in by_date else None for day in days]
+            if metric == 'weight':
+                values = [float(value) if value is not None else None for value in values]
+            series[metric] = values
+
+    diet_metrics = [metric for metric in metrics if metric in DIET_METRICS]
+    if diet_metrics:
+        totals = {}
+        plans = DietDayLog.objects.filter(
+            user_id=user_id, date__gte=start, date__lte=end, plan__isnull=False,
+        ).values_list('date', 'plan', 'checked')
+        for day, plan, checked in plans:
+            slots = plan.get('slots', []) if isinstance(plan, dict) else []
+            totals[day] = plan_totals(slots, checked if isinstance(checked, list) else [])
+        for metric in diet_metrics:
+            idx = DIET_METRICS[metric]
+            series[metric] = [totals[day][idx] if day in totals else None for day in days]
+
+    days, series, bucket_days = downsample(days, series, points)
+    label_format = '%b %Y' if (end - start).days >= MAX_POINTS else '%d %b'
+    return {
+        'dates': [day.isoformat() for day in days],
+        'labels': [day.strftime(label_format) for day in days],
+        'bucket_days': bucket_days,
+        'series': {metric: series[metric] for metric in metrics},
+    }
@@ -0,0 +1,51 @@
+"""
+Keep DailyLogStats in step with DailyLog writes: the dashboard form, quick water,
+the admin (including bulk delete) and anything else that saves or deletes a log.
+Every DailyLog and DietDayLog write also bumps the user's UserDataVersion, which
+invalidates their cached pages. QuerySet.update() bypasses signals; run
+rebuild_log_stats after bulk updates.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DailyLog, DailyLogStats, DietDayLog, UserDataVersion
+
+
+def deleting_user(origin):
+    """Whether a delete cascades from deleting users (user.delete() or a User queryset delete)."""
+    user_model = get_user_model()
+    return isinstance(origin, user_model) or (isinstance(origin, QuerySet) and issubclass(origin.model, user_model))
+
+
+@receiver(post_save, sender=DailyLog)
+def update_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # loaddata: the stats are rebuilt lazily or by rebuild_log_stats
+        return
+    old = getattr(instance, '_stats_snapshot', None)
+    new = instance.stats_snapshot()
+    if old != new:
+        DailyLogStats.record(instance.user_id, old, new, known=created or old is not None)
+    instance._stats_snapshot = new
+
+
+@receiver(post_delete, sender=DailyLog)
+def update_stats_on_delete(sender, instance, origin=None, **kwargs):
+    if deleting_user(origin):
+        # Deleting the user: their stats row goes with them
+        return
+    old = getattr(instance, '_stats_snapshot', None) or instance.stats_snapshot()
+    DailyLogStats.record(instance.user_id, old, None)
+
+
+@receiver(post_save, sender=DailyLog)
+@receiver(post_delete, sender=DailyLog)
+@receiver(post_save, sender=DietDayLog)
+@receiver(post_delete, sender=DietDayLog)
+def bump_data_version(sender, instance, raw=False, origin=None, **kwargs):
+    # Skip loaddata, and deleting the user (their version row goes with them)
+    if raw or deleting_user(origin):
+        return
+    UserDataVersion.bump(instance.user_id)
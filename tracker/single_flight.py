@@ -0,0 +1,211 @@
+"""
+Single-flight coalescing of identical Gemini requests.
+
+When several users ask for the same recipe within seconds, or "Generate my diet
+plan" is clicked twice, the identical calls wait on one upstream call and share
+its (reply_text, error) result instead of each generating it.
+
+In one process, SingleFlight keys a concurrent.futures.Future on the request
+fingerprint. The first caller (thread or coroutine, on any event loop) makes
+the call and the rest wait on the future. With GEMINI_SINGLE_FLIGHT_SHARED
+enabled, the leader also claims an AIInflightRequest row, so identical calls
+in other worker processes poll that row for the result instead of calling the
+model. If the leader disappears, a waiter takes over once the row is older
+than GEMINI_SINGLE_FLIGHT_STALE seconds.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AIInflightRequest
+
+DEFAULT_STALE_SECONDS = 300
+POLL_SECONDS = 0.25
+# Finished rows are kept this long, then deleted by the next leader
+ROW_RETENTION = timedelta(hours=1)
+
+
+class LeaderCancelled(Exception):
+    """The caller making the shared request was cancelled; waiters make the call themselves."""
+
+
+def request_fingerprint(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """In-process coalescing: one call per key at a time, shared by every concurrent caller."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """(future, is_leader) for key."""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self.calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def _done(self, key):
+        with self.lock:
+            self.calls.pop(key, None)
+
+    def do(self, key, fn):
+        """Call fn() unless an identical call is in flight; either way return its result."""
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return future.result()
+            except LeaderCancelled:
+                return fn()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            raise
+        finally:
+            self._done(key)
+        future.set_result(result)
+        return result
+
+    async def ado(self, key, afn):
+        """Async do(): await afn() unless an identical call is in flight."""
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                # shield: a cancelled waiter must not cancel the shared future
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except LeaderCancelled:
+                return await afn()
+        try:
+            result = await afn()
+        except BaseException as e:
+            future.set_exception(LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            raise
+        finally:
+            self._done(key)
+        future.set_result(result)
+        return result
+
+    def snapshot(self):
+        with self.lock:
+            return {"in_flight": len(self.calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+flights = SingleFlight()
+
+
+def _shared_enabled():
+    return getattr(settings, "GEMINI_SINGLE_FLIGHT_SHARED", False)
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, "GEMINI_SINGLE_FLIGHT_STALE", DEFAULT_STALE_SECONDS))
+
+
+def claim(fingerprint):
+    """True if this process should make the call, False if another process is making it now."""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            AIInflightRequest.objects.create(fingerprint=fingerprint, started_at=now)
+    except IntegrityError:
+        # Take over a finished row (single-flight covers in-flight calls only) or an abandoned one
+        return bool(
+            AIInflightRequest.objects.filter(fingerprint=fingerprint)
+            .filter(Q(completed_at__isnull=False) | Q(started_at__lt=now - _stale_after()))
+            .update(started_at=now, completed_at=None, reply="", error="")
+        )
+    AIInflightRequest.objects.filter(started_at__lt=now - ROW_RETENTION).delete()
+    return True
+
+
+def finish(fingerprint, result):
+    reply_text, err = result
+    AIInflightRequest.objects.filter(fingerprint=fingerprint).update(
+        completed_at=timezone.now(), reply=reply_text or "", error=err or "",
+    )
+
+
+def poll(fingerprint):
+    """The finished (reply_text, error) for fingerprint, False while it is still running, or None if the row is gone."""
+    row = (
+        AIInflightRequest.objects.filter(fingerprint=fingerprint)
+        .values("completed_at", "reply", "error")
+        .first()
+    )
+    if row is None:
+        return None
+    if row["completed_at"] is None:
+        return False
+    return row["reply"] or None, row["error"] or None
+
+
+def abandon(fingerprint):
+    """Drop the row of a call that raised or was cancelled, so waiters claim it instead of waiting."""
+    AIInflightRequest.objects.filter(fingerprint=fingerprint, completed_at__isnull=True).delete()
+
+
+def shared_call(fingerprint, fn):
+    """Make fn() the only call for fingerprint across processes (when enabled); return (reply_text, error)."""
+    if not _shared_enabled():
+        return fn()
+    deadline = time.monotonic() + _stale_after().total_seconds()
+    while not claim(fingerprint):
+        while time.monotonic() < deadline:
+            time.sleep(POLL_SECONDS)
+            result = poll(fingerprint)
+            if result is None:
+                break
+            if result is not False:
+                return result
+        if time.monotonic() >= deadline:
+            break
+    try:
+        result = fn()
+    except BaseException:
+        abandon(fingerprint)
+        raise
+    finish(fingerprint, result)
+    return result
+
+
+async def ashared_call(fingerprint, afn):
+    """Async shared_call()."""
+    if not _shared_enabled():
+        return await afn()
+    deadline = time.monotonic() + _stale_after().total_seconds()
+    while not await sync_to_async(claim)(fingerprint):
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+            result = await sync_to_async(poll)(fingerprint)
+            if result is None:
+                break
+            if result is not False:
+                return result
+        if time.monotonic() >= deadline:
+            break
+    try:
+        result = await afn()
+    except BaseException:
+        await asyncio.shield(sync_to_async(abandon)(fingerprint))
+        raise
+    await sync_to_async(finish)(fingerprint, result)
+    return result
@@ -0,0 +1,640 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import ai_cache, gemini, series, single_flight
+from .management.commands.deliver_outbox import claim_batch, mark_failed
+from .management.commands.send_reminders import REMINDER_CONTENT, record_sent
+from .models import AIInflightRequest, AIQuotaBucket, AIResponseCache, DailyLog, DailyLogStats, DietDayLog, DietPlanJob, EmailOutbox, NotificationPreference, ReminderLog
+from .views import DIET_PLAN_END_MARKER, DIET_PLAN_START_MARKER, _PlanBlockFilter, _split_plan_block
+
+
+class DashboardQueryCountTests(TestCase):
+    """The dashboard GET must stay at a fixed number of queries however many logs the user has."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('dash', password='pw')
+        today = timezone.localdate()
+        for offset in range(10):
+            DailyLog.objects.create(
+                user=self.user,
+                date=today - timedelta(days=offset),
+                mood=5,
+                weight_kg=60 + offset,
+                wellness_score=70,
+                sleep_quality=5,
+            )
+        self.client.force_login(self.user)
+        # The motivation popup was already shown, so the GETs do not write the session
+        session = self.client.session
+        session['motivation_shown'] = True
+        session.save()
+
+    def test_cold_dashboard(self):
+        # Session, user, data version, today's log
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('tracker:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['mood'], 5)
+
+    def test_warm_dashboard(self):
+        self.client.get(reverse('tracker:dashboard'))
+        # Session, user, data version; today's card comes from the page cache
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('tracker:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['wellness_score'], 70)
+
+    def test_write_invalidates_warm_dashboard(self):
+        self.client.get(reverse('tracker:dashboard'))
+        self.client.post(reverse('tracker:dashboard'), {'form_type': 'quick_water', 'water_glasses': '6'})
+        response = self.client.get(reverse('tracker:dashboard'))
+        self.assertEqual(response.context['water_glasses'], 6)
+
+
+class NotificationSettingsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('notify', email='notify@example.com', password='pw')
+        self.client.force_login(self.user)
+
+    def test_renders_reminder_fields(self):
+        response = self.client.get(reverse('tracker:notification_settings'))
+        self.assertEqual(response.status_code, 200)
+        for name in ('time_zone', 'breakfast_time', 'water_time', 'stretch_time', 'daily_log_time'):
+            self.assertContains(response, f'name="{name}"')
+
+    def test_saves_time_zone_and_times(self):
+        response = self.client.post(reverse('tracker:notification_settings'), {
+            'water_reminder': 'on',
+            'time_zone': 'Asia/Kolkata',
+            'breakfast_time': '08:00',
+            'water_time': '10:30',
+            'stretch_time': '17:00',
+            'daily_log_time': '21:00',
+        })
+        self.assertRedirects(response, reverse('tracker:notification_settings'))
+        prefs = NotificationPreference.objects.get(user=self.user)
+        self.assertEqual(prefs.time_zone, 'Asia/Kolkata')
+        self.assertEqual(prefs.water_time.strftime('%H:%M'), '10:30')
+        self.assertIsNotNone(prefs.next_due_at)
+
+    def test_rejects_unknown_time_zone(self):
+        response = self.client.post(reverse('tracker:notification_settings'), {
+            'time_zone': 'Mars/Olympus',
+            'breakfast_time': '08:00',
+            'water_time': '10:30',
+            'stretch_time': '17:00',
+            'daily_log_time': '21:00',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors.get('time_zone'))
+        self.assertFalse(NotificationPreference.objects.filter(user=self.user).exists())
+
+
+class PlanBlockSplitTests(SimpleTestCase):
+    PLAN = '{"slots": [{"time": "8:00", "label": "Breakfast", "description": "Oats"}]}'
+
+    def test_stored_reply_keeps_the_break_the_stream_showed(self):
+        reply = f'Here is your plan.\n{DIET_PLAN_START_MARKER}{self.PLAN}{DIET_PLAN_END_MARKER}\nEnjoy!'
+        plan_filter = _PlanBlockFilter()
+        streamed = ''.join(plan_filter.feed(reply[i:i + 7]) for i in range(0, len(reply), 7)) + plan_filter.flush()
+        display, plan = _split_plan_block(reply)
+        self.assertEqual(display, 'Here is your plan.\nEnjoy!')
+        self.assertEqual(display, streamed.replace('\n\n', '\n').strip())
+        self.assertEqual(plan['slots'][0]['label'], 'Breakfast')
+
+    def test_block_at_the_end(self):
+        display, plan = _split_plan_block(f'Plan below.\n{DIET_PLAN_START_MARKER}{self.PLAN}{DIET_PLAN_END_MARKER}')
+        self.assertEqual(display, 'Plan below.')
+        self.assertIsNotNone(plan)
+
+
+class ModelFallbackTests(SimpleTestCase):
+    REPLY = {'candidates': [{'content': {'parts': [{'text': 'Hello'}]}}]}
+
+    def setUp(self):
+        self.registry = gemini.ModelRegistry(('slow-model', 'fast-model'))
+        patcher = mock.patch.object(gemini, 'model_health', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handler(self, request):
+        if 'slow-model' in request.url.path:
+            raise httpx.ConnectTimeout('timed out', request=request)
+        return httpx.Response(200, json=self.REPLY)
+
+    def test_timeout_falls_through_to_next_model(self):
+        client = httpx.Client(transport=httpx.MockTransport(self.handler))
+        with mock.patch.object(gemini, 'sync_client', return_value=client):
+            reply, err = gemini._call_models('key', {})
+        self.assertEqual((reply, err), ('Hello', None))
+        self.assertEqual(self.registry.candidates(), ['fast-model'])
+
+    def test_async_timeout_falls_through_to_next_model(self):
+        async def call():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(self.handler)) as client:
+                with mock.patch.object(gemini, 'async_client', return_value=client):
+                    return await gemini._acall_models('key', {})
+        self.assertEqual(asyncio.run(call()), ('Hello', None))
+        self.assertEqual(self.registry.candidates(), ['fast-model'])
+
+    def test_async_client_is_reused_within_a_loop_and_closed_with_it(self):
+        async def clients():
+            return await gemini.async_client(), await gemini.async_client()
+        first, second = asyncio.run(clients())
+        self.assertIs(first, second)
+        self.assertTrue(first.is_closed)
+        # A new loop (async_to_sync under WSGI) gets its own client
+        third, _ = asyncio.run(clients())
+        self.assertIsNot(third, first)
+        self.assertTrue(third.is_closed)
+
+    def test_every_model_timing_out_reports_a_network_error(self):
+        def handler(request):
+            raise httpx.ReadTimeout('', request=request)
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        with mock.patch.object(gemini, 'sync_client', return_value=client):
+            reply, err = gemini._call_models('key', {})
+        self.assertIsNone(reply)
+        self.assertIn('ReadTimeout', err)
+
+
+@mock.patch('tracker.views.jobs.submit')
+class DietPlanGenerateQuotaTests(TestCase):
+    """Only a newly queued plan job may take a token from the plan quota."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('planner', password='pw')
+        self.client.force_login(self.user)
+
+    def generate(self, body='{}'):
+        return self.client.post(reverse('tracker:diet_plan_generate'), body, content_type='application/json')
+
+    def tokens_taken(self):
+        bucket = AIQuotaBucket.objects.filter(user=self.user, endpoint='diet_plan_generate').first()
+        return bucket.allowed if bucket else 0
+
+    def test_invalid_body_is_free(self, submit):
+        self.assertEqual(self.generate('not json').status_code, 400)
+        self.assertEqual(self.tokens_taken(), 0)
+        submit.assert_not_called()
+
+    def test_pregenerated_plan_is_free(self, submit):
+        DietDayLog.objects.create(user=self.user, date=timezone.localdate(), pending_plan={'slots': []})
+        response = self.generate()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], DietPlanJob.STATUS_DONE)
+        self.assertEqual(self.tokens_taken(), 0)
+
+    def test_new_job_takes_a_token_and_double_click_shares_it(self, submit):
+        first = self.generate()
+        second = self.generate()
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.json()['job_id'], first.json()['job_id'])
+        self.assertEqual(self.tokens_taken(), 1)
+        submit.assert_called_once()
+
+
+class BuildSeriesTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('series', password='pw')
+        self.today = timezone.localdate()
+
+    def test_zero_weight_is_a_value(self):
+        DailyLog.objects.create(user=self.user, date=self.today, weight_kg=0)
+        data = series.build_series(self.user.pk, ['weight'], self.today - timedelta(days=1), self.today)
+        self.assertEqual(data['series']['weight'], [None, 0.0])
+
+    def test_days_without_a_plan_do_not_drag_the_mean_down(self):
+        plan = {'slots': [{'time': '8:00', 'label': 'Breakfast', 'description': 'Oats', 'protein_g': 20}]}
+        DietDayLog.objects.create(user=self.user, date=self.today, plan=plan, checked=[True])
+        start = self.today - timedelta(days=3)
+        daily = series.build_series(self.user.pk, ['protein'], start, self.today)
+        self.assertEqual(daily['series']['protein'], [None, None, None, 20.0])
+        bucketed = series.build_series(self.user.pk, ['protein'], start, self.today, points=1)
+        self.assertEqual(bucketed['series']['protein'], [20.0])
+
+
+class SeriesApiRangeTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('ranges', password='pw'))
+
+    def get(self, **params):
+        return self.client.get(reverse('tracker:api_series'), {'metrics': 'weight', **params})
+
+    def test_out_of_range_days_is_a_bad_request(self):
+        for days in ('9999999999', str(series.MAX_DAYS + 1), '-5'):
+            with self.subTest(days=days):
+                self.assertEqual(self.get(days=days).status_code, 400)
+
+    def test_range_before_the_first_representable_date_is_a_bad_request(self):
+        self.assertEqual(self.get(end='0001-01-05', days='30').status_code, 400)
+        self.assertEqual(self.get(end='0001-01-05', range='90d').status_code, 400)
+        self.assertEqual(self.get(start='0001-01-01').status_code, 400)
+
+    def test_longest_range_is_served(self):
+        response = self.get(days=str(series.MAX_DAYS))
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.json()['dates']), series.DEFAULT_POINTS)
+
+
+class ChatQuotaTests(TestCase):
+    """Chat requests refused for their body must not take a token from the chat quota."""
+
+    ENDPOINTS = ('pcod_support_chat', 'diet_planner_chat')
+
+    def setUp(self):
+        self.user = User.objects.create_user('chatter', password='pw')
+        self.client.force_login(self.user)
+
+    def post(self, endpoint, body):
+        return self.client.post(reverse(f'tracker:{endpoint}'), body, content_type='application/json')
+
+    def tokens_taken(self, endpoint):
+        bucket = AIQuotaBucket.objects.filter(user=self.user, endpoint=endpoint).first()
+        return bucket.allowed if bucket else 0
+
+    def test_bad_requests_leave_the_bucket_unchanged(self):
+        for endpoint in self.ENDPOINTS:
+            for body in ('not json', '{"message": "   "}', json.dumps({'message': 'x' * 2001})):
+                with self.subTest(endpoint=endpoint, body=body[:20]):
+                    self.assertEqual(self.post(endpoint, body).status_code, 400)
+                    self.assertEqual(self.tokens_taken(endpoint), 0)
+
+    @override_settings(AI_QUOTAS={'chat': {'burst': 1, 'per_hour': 1}})
+    @mock.patch('tracker.views.acall_gemini', return_value=('Hi!', None))
+    def test_valid_request_takes_a_token(self, acall_gemini):
+        for endpoint in self.ENDPOINTS:
+            AIQuotaBucket.objects.all().delete()
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual(self.post(endpoint, '{"message": "Hello"}').status_code, 200)
+                self.assertEqual(self.tokens_taken(endpoint), 1)
+                response = self.post(endpoint, '{"message": "Hello again"}')
+                self.assertEqual(response.status_code, 429)
+                self.assertIn('Retry-After', response)
+
+
+class DailyLogStatsTests(TestCase):
+    """The incrementally kept windows must always equal the averages recomputed from the logs."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('stats', password='pw')
+        self.today = timezone.localdate()
+        for offset in range(0, 40, 3):
+            self.log(offset, mood=offset % 10 + 1, sleep_quality=offset % 4 + 1 if offset % 2 else None)
+
+    def log(self, offset, **values):
+        return DailyLog.objects.create(user=self.user, date=self.today - timedelta(days=offset), **values)
+
+    def recomputed(self):
+        windows = {}
+        for days in DailyLogStats.WINDOWS:
+            logs = DailyLog.objects.filter(
+                user=self.user, date__gt=self.today - timedelta(days=days), date__lte=self.today,
+            )
+            window = windows[str(days)] = {'logs': logs.count()}
+            for metric in DailyLogStats.METRICS:
+                values = [value for value in logs.values_list(metric, flat=True) if value is not None]
+                window[metric] = [sum(values), len(values)]
+        return windows
+
+    def assertStatsMatchLogs(self):
+        stats = DailyLogStats.objects.get(user=self.user)
+        self.assertEqual(stats.as_of, self.today)
+        self.assertEqual(stats.windows, self.recomputed())
+        latest = DailyLog.objects.filter(user=self.user).order_by('-date').first()
+        self.assertEqual(stats.latest_log(), latest.stats_snapshot() if latest else None)
+
+    def test_creates(self):
+        self.assertStatsMatchLogs()
+
+    def test_editing_an_existing_day(self):
+        log = DailyLog.objects.get(user=self.user, date=self.today - timedelta(days=3))
+        log.mood = 10
+        log.sleep_quality = None
+        log.save()
+        self.assertStatsMatchLogs()
+        # Moving a log to another date takes it out of the windows it left
+        log.date = self.today - timedelta(days=20)
+        log.save()
+        self.assertStatsMatchLogs()
+
+    def test_deleting_logs(self):
+        DailyLog.objects.get(user=self.user, date=self.today - timedelta(days=6)).delete()
+        self.assertStatsMatchLogs()
+        # The latest log goes: the next one takes its place
+        DailyLog.objects.get(user=self.user, date=self.today).delete()
+        self.assertStatsMatchLogs()
+        DailyLog.objects.filter(user=self.user).delete()
+        self.assertStatsMatchLogs()
+
+    def test_back_dated_inserts(self):
+        before = DailyLogStats.objects.get(user=self.user).windows
+        self.log(90, mood=1, sleep_quality=1)
+        self.assertEqual(DailyLogStats.objects.get(user=self.user).windows, before)
+        self.log(1, mood=7)
+        self.assertStatsMatchLogs()
+
+    def test_roll_forward_to_a_new_day(self):
+        stats = DailyLogStats.objects.get(user=self.user)
+        stats.fill(self.today - timedelta(days=5))
+        stats.save()
+        self.assertEqual(DailyLogStats.for_user(self.user.pk, self.today).as_of, self.today)
+        self.assertStatsMatchLogs()
+
+    def test_rebuild_log_stats_gives_the_same_result(self):
+        DailyLog.objects.get(user=self.user, date=self.today - timedelta(days=9)).delete()
+        self.log(2, mood=4, wellness_score=80)
+        incremental = DailyLogStats.objects.get(user=self.user)
+        call_command('rebuild_log_stats', stdout=io.StringIO())
+        rebuilt = DailyLogStats.objects.get(user=self.user)
+        self.assertEqual((rebuilt.as_of, rebuilt.windows, rebuilt.latest), (incremental.as_of, incremental.windows, incremental.latest))
+
+
+class ReminderLogTests(TestCase):
+    BITS = ReminderLog.REMINDER_BITS
+
+    def setUp(self):
+        self.users = [User.objects.create_user(f'remind{n}', email=f'remind{n}@example.com') for n in range(2)]
+        self.day = timezone.localdate()
+
+    def masks(self):
+        return dict(ReminderLog.objects.values_list('user__username', 'sent'))
+
+    def test_record_sent_is_idempotent_and_keeps_other_bits(self):
+        first, second = (user.pk for user in self.users)
+        # Another shard already recorded the daily log reminder for the first user
+        ReminderLog.objects.create(user_id=first, date=self.day, sent=self.BITS['daily_log_reminder'])
+        batch = {
+            (first, self.day): self.BITS['breakfast_reminder'] | self.BITS['water_reminder'],
+            (second, self.day): self.BITS['water_reminder'],
+        }
+        record_sent(batch)
+        record_sent(batch)
+        record_sent({(first, self.day): self.BITS['water_reminder'] | self.BITS['stretch_reminder']})
+        self.assertEqual(self.masks(), {'remind0': 15, 'remind1': self.BITS['water_reminder']})
+        self.assertEqual(ReminderLog.objects.count(), 2)
+
+    def test_repeated_runs_send_each_reminder_once(self):
+        noon = datetime.combine(self.day, dt_time(12, 0), tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=noon):
+            NotificationPreference.objects.create(
+                user=self.users[0], time_zone='UTC', breakfast_reminder=False, daily_log_reminder=False,
+                water_reminder=True, water_time=dt_time(11, 55), stretch_reminder=True, stretch_time=dt_time(11, 50),
+            )
+            call_command('send_reminders', '--rate', '0', stdout=io.StringIO())
+            # A second node (or a duplicate shard) finds the user due again
+            NotificationPreference.objects.update(next_due_at=noon - timedelta(minutes=30))
+            call_command('send_reminders', '--rate', '0', stdout=io.StringIO())
+        self.assertEqual(sorted(message.subject for message in mail.outbox), sorted(
+            content['subject'] for reminder_type, content in REMINDER_CONTENT.items()
+            if reminder_type in ('water_reminder', 'stretch_reminder')
+        ))
+        self.assertEqual(self.masks(), {'remind0': self.BITS['water_reminder'] | self.BITS['stretch_reminder']})
+
+
+class EmailOutboxTests(TestCase):
+
+    def queue(self, **fields):
+        return EmailOutbox.objects.create(to_email='outbox@example.com', subject='Hi', body='Hello', **fields)
+
+    def test_racing_claimers_never_share_a_row(self):
+        rows = [self.queue() for _ in range(3)]
+        claimed = {}
+
+        def other_worker_claims_first():
+            # Runs between this worker's SELECT of due ids and its conditional UPDATE
+            if 'other' not in claimed:
+                claimed['other'] = []
+                claimed['other'] = claim_batch(10, 600)
+            return 'host'
+
+        with mock.patch('tracker.management.commands.deliver_outbox.socket.gethostname', other_worker_claims_first):
+            mine = claim_batch(10, 600)
+        self.assertEqual(mine, [])
+        self.assertEqual(sorted(row.pk for row in claimed['other']), [row.pk for row in rows])
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.STATUS_SENDING).values('claimed_by').distinct().count(), 1)
+
+    def test_stale_claims_are_taken_over(self):
+        now = timezone.now()
+        stale = self.queue(status=EmailOutbox.STATUS_SENDING, claimed_by='dead', claimed_at=now - timedelta(seconds=700))
+        self.queue(status=EmailOutbox.STATUS_SENDING, claimed_by='alive', claimed_at=now - timedelta(seconds=60))
+        self.queue(available_at=now + timedelta(minutes=5))
+        self.assertEqual([row.pk for row in claim_batch(10, 600)], [stale.pk])
+
+    def test_delivery_marks_rows_sent(self):
+        row = self.queue()
+        call_command('deliver_outbox', stdout=io.StringIO())
+        row.refresh_from_db()
+        self.assertEqual(row.status, EmailOutbox.STATUS_SENT)
+        self.assertEqual([message.to for message in mail.outbox], [['outbox@example.com']])
+
+    @mock.patch('tracker.mailer.ParallelMailer.send_many', side_effect=lambda messages: [False] * len(messages))
+    def test_failures_back_off_then_give_up(self, send_many):
+        row = self.queue()
+        call_command('deliver_outbox', '--backoff', '60', stdout=io.StringIO())
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts, row.claimed_by), (EmailOutbox.STATUS_PENDING, 1, ''))
+        self.assertAlmostEqual((row.available_at - timezone.now()).total_seconds(), 60, delta=5)
+        # Not due again until the backoff has passed
+        call_command('deliver_outbox', stdout=io.StringIO())
+        self.assertEqual(send_many.call_count, 1)
+        row.refresh_from_db()
+        self.assertEqual(mark_failed(row, 'timeout', max_attempts=5, backoff=60), EmailOutbox.STATUS_PENDING)
+        row.refresh_from_db()
+        self.assertAlmostEqual((row.available_at - timezone.now()).total_seconds(), 120, delta=5)
+        row.attempts = 4
+        self.assertEqual(mark_failed(row, 'timeout', max_attempts=5, backoff=60), EmailOutbox.STATUS_FAILED)
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        self.flight = single_flight.SingleFlight()
+
+    def run_followers(self, leader_fn, count=3):
+        """Start a leader blocked on an event, then `count` followers; return (release, threads, outcomes)."""
+        release = threading.Event()
+        outcomes = []
+
+        def call(fn):
+            try:
+                outcomes.append(('ok', self.flight.do('key', fn)))
+            except BaseException as e:
+                outcomes.append(('error', e))
+
+        def leader():
+            release.wait(5)
+            return leader_fn()
+
+        threads = [threading.Thread(target=call, args=(leader,))]
+        threads[0].start()
+        while 'key' not in self.flight.calls:
+            time.sleep(0.001)
+        for _ in range(count):
+            threads.append(threading.Thread(target=call, args=(lambda: ('own', None),)))
+            threads[-1].start()
+        while self.flight.coalesced < count:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_followers_get_the_leaders_result(self):
+        outcomes = self.run_followers(lambda: ('shared', None))
+        self.assertEqual(outcomes, [('ok', ('shared', None))] * 4)
+        self.assertEqual(self.flight.snapshot(), {'in_flight': 0, 'leaders': 1, 'coalesced': 3})
+
+    def test_leader_failure_reaches_followers(self):
+        def fail():
+            raise ValueError('boom')
+        outcomes = self.run_followers(fail)
+        self.assertEqual([kind for kind, _ in outcomes], ['error'] * 4)
+        self.assertTrue(all(str(e) == 'boom' for _, e in outcomes))
+
+    def test_cancelled_leader_lets_followers_call_themselves(self):
+        def cancelled():
+            raise asyncio.CancelledError
+        outcomes = self.run_followers(cancelled)
+        # The leader's own caller sees the CancelledError; every follower made its own call
+        errors = [e for kind, e in outcomes if kind == 'error']
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], asyncio.CancelledError)
+        self.assertEqual([outcome for outcome in outcomes if outcome[0] == 'ok'], [('ok', ('own', None))] * 3)
+
+    def test_async_followers_share_the_result_and_survive_a_cancelled_leader(self):
+        calls = []
+
+        async def slow(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return value, None
+
+        async def scenario():
+            shared = await asyncio.gather(*(self.flight.ado('a', lambda: slow('shared')) for _ in range(3)))
+            leader = asyncio.ensure_future(self.flight.ado('b', lambda: slow('leader')))
+            await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(self.flight.ado('b', lambda: slow('follower')))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return shared, await follower
+
+        shared, follower = asyncio.run(scenario())
+        self.assertEqual(shared, [('shared', None)] * 3)
+        self.assertEqual(follower, ('follower', None))
+        self.assertEqual(calls, ['shared', 'leader', 'follower'])
+
+
+@override_settings(GEMINI_SINGLE_FLIGHT_SHARED=True, GEMINI_SINGLE_FLIGHT_STALE=60)
+class SharedFlightTests(TestCase):
+    FINGERPRINT = 'f' * 64
+
+    def test_claim_poll_finish_abandon(self):
+        self.assertTrue(single_flight.claim(self.FINGERPRINT))
+        self.assertFalse(single_flight.claim(self.FINGERPRINT))
+        self.assertIs(single_flight.poll(self.FINGERPRINT), False)
+        single_flight.finish(self.FINGERPRINT, ('reply', None))
+        self.assertEqual(single_flight.poll(self.FINGERPRINT), ('reply', None))
+        # A finished row is claimed again by the next identical call
+        self.assertTrue(single_flight.claim(self.FINGERPRINT))
+        single_flight.abandon(self.FINGERPRINT)
+        self.assertIsNone(single_flight.poll(self.FINGERPRINT))
+
+    def test_stale_row_is_taken_over(self):
+        AIInflightRequest.objects.create(fingerprint=self.FINGERPRINT, started_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(single_flight.shared_call(self.FINGERPRINT, lambda: ('mine', None)), ('mine', None))
+        self.assertEqual(single_flight.poll(self.FINGERPRINT), ('mine', None))
+
+    @mock.patch.object(single_flight, 'POLL_SECONDS', 0.01)
+    def test_waiter_gets_the_other_process_result(self):
+        AIInflightRequest.objects.create(fingerprint=self.FINGERPRINT)
+        with mock.patch.object(single_flight, 'poll', side_effect=[False, ('theirs', None)]):
+            result = single_flight.shared_call(self.FINGERPRINT, lambda: ('mine', None))
+        self.assertEqual(result, ('theirs', None))
+
+    @override_settings(GEMINI_SINGLE_FLIGHT_STALE=0.1)
+    @mock.patch.object(single_flight, 'POLL_SECONDS', 0.01)
+    def test_waiter_calls_itself_once_the_leader_is_stale(self):
+        AIInflightRequest.objects.create(fingerprint=self.FINGERPRINT)
+        self.assertEqual(single_flight.shared_call(self.FINGERPRINT, lambda: ('mine', None)), ('mine', None))
+
+
+class AIResponseCacheTests(TestCase):
+    RECIPE = AIResponseCache.ENDPOINT_RECIPE
+
+    def reply(self, dish, context='', reply='Recipe', err=None):
+        calls = []
+
+        async def generate():
+            calls.append(dish)
+            return reply, err
+        # async_to_sync runs the cache's database calls on this thread, inside the test transaction
+        text, error = async_to_sync(ai_cache.cached_reply)(self.RECIPE, dish, '', '', generate, context=context)
+        return text, error, bool(calls)
+
+    def test_key_normalisation(self):
+        self.assertEqual(
+            ai_cache.cache_key(self.RECIPE, 'Moong dal cheela', 'With  Mint'),
+            ai_cache.cache_key(self.RECIPE, '  moong DAL\tcheela ', 'with mint'),
+        )
+        base = ai_cache.cache_key(self.RECIPE, 'Poha')
+        for other in (
+            ai_cache.cache_key(AIResponseCache.ENDPOINT_ORDER_OPTIONS, 'Poha'),
+            ai_cache.cache_key(self.RECIPE, 'Poha', 'no onion'),
+            ai_cache.cache_key(self.RECIPE, 'Poha', price_range='budget'),
+            ai_cache.cache_key(self.RECIPE, 'Poha', context='vegan'),
+        ):
+            self.assertNotEqual(other, base)
+
+    def test_lookup_counts_hits_and_misses_and_never_caches_errors(self):
+        self.assertEqual(self.reply('Poha', reply=None, err='quota'), (None, 'quota', True))
+        self.assertEqual(self.reply('Poha'), ('Recipe', None, True))
+        self.assertEqual(self.reply(' POHA ', reply='Other'), ('Recipe', None, False))
+        entry = AIResponseCache.objects.get()
+        self.assertEqual((entry.hits, entry.misses), (1, 1))
+
+    def test_expired_entries_are_regenerated(self):
+        self.reply('Poha')
+        AIResponseCache.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.reply('Poha', reply='Fresh'), ('Fresh', None, True))
+
+    @override_settings(AI_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entry_is_evicted(self):
+        start = timezone.now()
+        for minute, dish in enumerate(('Poha', 'Upma', 'Poha', 'Idli')):
+            with mock.patch('django.utils.timezone.now', return_value=start + timedelta(minutes=minute)):
+                self.reply(dish)
+        self.assertEqual(sorted(AIResponseCache.objects.values_list('dish_name', flat=True)), ['Idli', 'Poha'])
+
+    def test_different_contexts_do_not_share_replies(self):
+        # A prompt personalised per user passes the user's preferences as context
+        self.reply('Poha', context='User A: vegan', reply='Vegan poha')
+        self.assertEqual(self.reply('Poha', context='User B: no peanuts', reply='Peanut-free poha'), ('Peanut-free poha', None, True))
+        self.assertEqual(self.reply('Poha', context='User A: vegan', reply='-'), ('Vegan poha', None, False))
+
+    @mock.patch('tracker.views.acall_gemini', return_value=('Soak the poha...', None))
+    def test_recipe_view_shares_the_unpersonalised_reply_across_users(self, acall_gemini):
+        for name in ('cook1', 'cook2'):
+            self.client.force_login(User.objects.create_user(name, password='pw'))
+            response = self.client.post(reverse('tracker:generate_recipe'), {'dish_name': 'Poha'}, content_type='application/json')
+            self.assertEqual(response.json(), {'recipe': 'Soak the poha...'})
+        self.assertEqual(acall_gemini.call_count, 1)
@@ -1,6 +1,7 @@
 from django.urls import path, reverse_lazy
 from django.contrib.auth import views as auth_views
 from . import views
+from .forms import OutboxPasswordResetForm
 
 app_name = 'tracker'
 
@@ -10,19 +11,25 @@ urlpatterns = [
     path('cycle-tracker/', views.cycle_tracker, name='cycle_tracker'),
     path('wellness/', views.wellness, name='wellness'),
     path('insights/', views.insights, name='insights'),
+    path('api/series/', views.api_series, name='api_series'),
     path('diet-plan/', views.diet_plan, name='diet_plan'),
     path('diet-plan/import/', views.diet_plan_import, name='diet_plan_import'),
     path('diet-plan/generate/', views.diet_plan_generate, name='diet_plan_generate'),
+    path('diet-plan/jobs/<uuid:job_id>/', views.diet_plan_job_status, name='diet_plan_job_status'),
     path('diet-plan/generate-recipe/', views.generate_recipe, name='generate_recipe'),
     path('diet-plan/find-order-options/', views.find_order_options, name='find_order_options'),
     path('ai-diet-agent/', views.ai_diet_agent, name='ai_diet_agent'),
     path('ai/support/chat/', views.pcod_support_chat, name='pcod_support_chat'),
     path('ai/diet/chat/', views.diet_planner_chat, name='diet_planner_chat'),
+    path('notifications/', views.notification_settings, name='notification_settings'),
+    path('ai/models/health/', views.ai_model_health, name='ai_model_health'),
+    path('pages/cache/stats/', views.page_cache_stats, name='page_cache_stats'),
     path('signup/', views.signup, name='signup'),
     path('login/', auth_views.LoginView.as_view(template_name='tracker/login.html', redirect_authenticated_user=True), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('password-reset/', auth_views.PasswordResetView.as_view(
         template_name='tracker/password_reset_form.html',
+        form_class=OutboxPasswordResetForm,
         success_url=reverse_lazy('tracker:password_reset_done'),
         email_template_name='tracker/password_reset_email.html',
     ), name='password_reset'),
@@ -1,20 +1,34 @@
+import asyncio
 import json
 import random
-import re
-import urllib.request
-import urllib.error
 import logging
-from datetime import timedelta
+import time
+from datetime import date, datetime, timedelta
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
-from django.core.mail import send_mail
+from django.contrib import messages
+from django.core.exceptions import ValidationError
+from asgiref.sync import sync_to_async
 from .forms import SignUpForm, DailyLogForm, NotificationPreferenceForm
-from .models import DailyLog, DietDayLog, NotificationPreference
+from .models import AIResponseCache, DailyLog, DailyLogStats, DietDayLog, DietPlanJob, NotificationPreference, UserDataVersion
+from .mailer import enqueue_notification, send_notification_email
+from . import jobs, series
+from .gemini import GeminiError, acall_gemini, astream_gemini, call_gemini, model_health
+from .ai_cache import cached_reply
+from .prompts import preference_context
+from .page_cache import page_context, page_stats
+from .plan_json import extract_plan, validate_plan
+from .notifications import SAMPLE_EMAIL_APP_UPDATES, SAMPLE_EMAIL_EVENTS_WORKSHOPS, SAMPLE_EMAIL_HEALTH_TIPS
+from .quotas import quota_exceeded
+from .single_flight import flights
 
 logger = logging.getLogger(__name__)
 
@@ -147,27 +161,6 @@ def get_daily_myth_questions():
     basic_index = day_of_year % len(DAILY_MYTH_QUESTIONS_BASIC)
     hard_index = day_of_year % len(DAILY_MYTH_QUESTIONS_HARD)
     return DAILY_MYTH_QUESTIONS_BASIC[basic_index], DAILY_MYTH_QUESTIONS_HARD[hard_index]
-# Playful, Zomato-style email content for notifications (use as samples or override per type)
-SAMPLE_EMAIL_EVENTS_WORKSHOPS = (
-    "Hey you 👀\n\n"
-    "We've got something fun coming up — events & workshops just for you.\n\n"
-    "Your body was thinking about you today… Slow days are still progress 💗\n"
-    "Come say hi, learn something new, and don't forget — you're doing fine 🌸\n\n"
-    "— PCOD GirlCare"
-)
-SAMPLE_EMAIL_HEALTH_TIPS = (
-    "Hey you 👀\n\n"
-    "Your body was thinking about you today…\n\n"
-    "Slow days are still progress 💗 Drink some water, stretch a little, "
-    "and don't forget — you're doing fine 🌸\n\n"
-    "— PCOD GirlCare"
-)
-SAMPLE_EMAIL_APP_UPDATES = (
-    "Hey you 👀\n\n"
-    "We've been cooking something new for you — a little app update to make your journey smoother.\n\n"
-    "Check it out when you can. No rush — we'll be here 💗\n\n"
-    "— PCOD GirlCare"
-)
 
 
 def home(request):
@@ -188,6 +181,79 @@ def signup(request):
     return render(request, 'tracker/signup.html', {'form': form})
 
 
+@login_required
+def notification_settings(request):
+    """Notification settings page – email toggles, timezone and local reminder times."""
+    user = request.user
+    prefs = NotificationPreference.objects.filter(user=user).first() or NotificationPreference(user=user)
+    if request.method == 'POST':
+        form = NotificationPreferenceForm(request.POST, instance=prefs)
+        if form.is_valid():
+            # save() recomputes next_due_at from the new timezone and times
+            form.save()
+            messages.success(request, 'Your notification settings were saved.')
+            return redirect('tracker:notification_settings')
+    else:
+        form = NotificationPreferenceForm(instance=prefs)
+    return render(request, 'tracker/notification_settings.html', {'username': user.username, 'form': form})
+
+
+def symptom_display(val):
+    """Map symptom/mood number (1–10) to Low / Mid / High for display."""
+    if val is None:
+        return "–"
+    if val <= 3:
+        return "Low"
+    if val <= 7:
+        return "Mid"
+    return "High"
+
+
+def wellness_display(val):
+    """Map wellness 0–100 to Good / Average / Bad for display."""
+    if val is None:
+        return "–"
+    if val <= 33:
+        return "Bad"
+    if val <= 66:
+        return "Average"
+    return "Good"
+
+
+def _dashboard_data(user, today):
+    """The dashboard's log-derived context: today's card (cached per user, see page_cache)."""
+    # Only this user's data – secured. Charts are fetched from /api/series/, so only today's row is read.
+    today_log = DailyLog.objects.filter(user=user, date=today).first()
+
+    # Today's card. Without a log today every metric is empty; with one, unset cycle day,
+    # steps and water show as 0.
+    log = today_log or DailyLog(steps=None, water_glasses=None)
+    unset = 0 if today_log else None
+    symptoms = [log.acne_level, log.fatigue_level, log.bloating_level, log.sleep_quality]
+    symptoms_count = sum(1 for x in symptoms if x is not None)
+    if today_log and symptoms_count == 0:
+        symptoms_count = 1
+    return {
+        'today_log': today_log,
+        'symptoms_count': symptoms_count,
+        'acne_level': log.acne_level,
+        'fatigue_level': log.fatigue_level,
+        'bloating_level': log.bloating_level,
+        'sleep_quality': log.sleep_quality,
+        'mood': log.mood,
+        'acne_level_display': symptom_display(log.acne_level),
+        'fatigue_level_display': symptom_display(log.fatigue_level),
+        'bloating_level_display': symptom_display(log.bloating_level),
+        'sleep_quality_display': symptom_display(log.sleep_quality),
+        'mood_display': symptom_display(log.mood),
+        'cycle_day': log.cycle_day if log.cycle_day is not None else unset,
+        'steps': log.steps if log.steps is not None else unset,
+        'water_glasses': log.water_glasses if log.water_glasses is not None else unset,
+        'wellness_score': log.wellness_score,
+        'wellness_score_display': wellness_display(log.wellness_score),
+    }
+
+
 @login_required
 @ensure_csrf_cookie
 def dashboard(request):
@@ -197,51 +263,8 @@ def dashboard(request):
     # Daily myth questions (same for everyone on a given day)
     daily_basic_myth, daily_hard_myth = get_daily_myth_questions()
 
-    # Only this user's data – secured
-    today_log = DailyLog.objects.filter(user=user, date=today).first()
-    last_7 = (
-        DailyLog.objects.filter(user=user)
-        .filter(date__lte=today)
-        .order_by('-date')[:7]
-    )
-    last_7_list = list(last_7)
-    last_7_list.reverse()  # oldest first for chart
-
-    # Build chart data from current user only (for JS)
-    chart_labels = []
-    chart_weight = []
-    chart_mood = []
-    for log in last_7_list:
-        chart_labels.append(log.date.strftime('%a'))
-        chart_weight.append(float(log.weight_kg) if log.weight_kg is not None else None)
-        chart_mood.append(log.mood if log.mood is not None else None)
-    chart_labels_json = json.dumps(chart_labels)
-    chart_weight_json = json.dumps(chart_weight)
-    chart_mood_json = json.dumps(chart_mood)
-
-    # Defaults when no log today
-    def default(val, d):
-        return val if val is not None else d
-
-    def symptom_display(val):
-        """Map symptom/mood number (1–10) to Low / Mid / High for display."""
-        if val is None:
-            return "–"
-        if val <= 3:
-            return "Low"
-        if val <= 7:
-            return "Mid"
-        return "High"
-
-    def wellness_display(val):
-        """Map wellness 0–100 to Good / Average / Bad for display."""
-        if val is None:
-            return "–"
-        if val <= 33:
-            return "Bad"
-        if val <= 66:
-            return "Average"
-        return "Good"
+    data = page_context('dashboard', user.pk, today, lambda: _dashboard_data(user, today))
+    today_log = data['today_log']
 
     # Show the motivation popup only once per login/session.
     # We store a flag in the Django session so that after the first
@@ -251,79 +274,7 @@ def dashboard(request):
     if show_motivation:
         request.session['motivation_shown'] = True
 
-    if today_log:
-        symptoms_count = sum(1 for x in [
-            today_log.acne_level, today_log.fatigue_level,
-            today_log.bloating_level, today_log.sleep_quality
-        ] if x is not None)
-        if symptoms_count == 0:
-            symptoms_count = 1
-        context = {
-            'username': user.username,
-            'show_motivation': show_motivation,
-            'daily_motivation': random.choice(MOTIVATIONS),
-            'daily_basic_myth': daily_basic_myth,
-            'daily_hard_myth': daily_hard_myth,
-            'today_log': today_log,
-            'log_form': DailyLogForm(instance=today_log),
-            'symptoms_count': symptoms_count,
-            'acne_level': today_log.acne_level,
-            'fatigue_level': today_log.fatigue_level,
-            'bloating_level': today_log.bloating_level,
-            'sleep_quality': today_log.sleep_quality,
-            'mood': today_log.mood,
-            'acne_level_display': symptom_display(today_log.acne_level),
-            'fatigue_level_display': symptom_display(today_log.fatigue_level),
-            'bloating_level_display': symptom_display(today_log.bloating_level),
-            'sleep_quality_display': symptom_display(today_log.sleep_quality),
-            'mood_display': symptom_display(today_log.mood),
-            'cycle_day': default(today_log.cycle_day, 0),
-            'steps': default(today_log.steps, 0),
-            'water_glasses': default(today_log.water_glasses, 0),
-            'wellness_score': today_log.wellness_score,
-            'wellness_score_display': wellness_display(today_log.wellness_score),
-            'chart_labels': chart_labels,
-            'chart_weight': chart_weight,
-            'chart_mood': chart_mood,
-            'chart_labels_json': chart_labels_json,
-            'chart_weight_json': chart_weight_json,
-            'chart_mood_json': chart_mood_json,
-            'has_chart_data': any(w is not None for w in chart_weight) or any(m is not None for m in chart_mood),
-        }
-    else:
-        context = {
-            'username': user.username,
-            'show_motivation': show_motivation,
-            'daily_motivation': random.choice(MOTIVATIONS),
-            'daily_basic_myth': daily_basic_myth,
-            'daily_hard_myth': daily_hard_myth,
-            'today_log': None,
-            'log_form': DailyLogForm(),
-            'symptoms_count': 0,
-            'acne_level': None,
-            'fatigue_level': None,
-            'bloating_level': None,
-            'sleep_quality': None,
-            'mood': None,
-            'acne_level_display': '–',
-            'fatigue_level_display': '–',
-            'bloating_level_display': '–',
-            'sleep_quality_display': '–',
-            'mood_display': '–',
-            'cycle_day': None,
-            'steps': None,
-            'water_glasses': None,
-            'wellness_score': None,
-            'wellness_score_display': '–',
-            'chart_labels': chart_labels,
-            'chart_weight': chart_weight,
-            'chart_mood': chart_mood,
-            'chart_labels_json': chart_labels_json,
-            'chart_weight_json': chart_weight_json,
-            'chart_mood_json': chart_mood_json,
-            'has_chart_data': any(w is not None for w in chart_weight) or any(m is not None for m in chart_mood),
-        }
-
+    log_form = None
     if request.method == 'POST':
         form_type = request.POST.get('form_type')
         if form_type == 'daily_log':
@@ -334,7 +285,7 @@ def dashboard(request):
                 log.date = today
                 log.save()
                 return redirect('tracker:dashboard')
-            context['log_form'] = form
+            log_form = form
         elif form_type == 'quick_water':
             glasses = request.POST.get('water_glasses')
             try:
@@ -348,18 +299,23 @@ def dashboard(request):
             except (ValueError, TypeError):
                 pass
 
+    context = {
+        **data,
+        'username': user.username,
+        'show_motivation': show_motivation,
+        'daily_motivation': random.choice(MOTIVATIONS),
+        'daily_basic_myth': daily_basic_myth,
+        'daily_hard_myth': daily_hard_myth,
+        'log_form': log_form if log_form is not None else DailyLogForm(instance=today_log),
+    }
     return render(request, 'tracker/dashboard.html', context)
 
 
-@login_required
-def cycle_tracker(request):
-    """Cycle tracker page – cycle day, phase, recent logs."""
-    user = request.user
-    today = timezone.localdate()
+def _cycle_tracker_data(user, today):
     today_log = DailyLog.objects.filter(user=user, date=today).first()
     cycle_day = today_log.cycle_day if today_log else None
     # Last 30 days with cycle_day for trend
-    recent = (
+    recent = list(
         DailyLog.objects.filter(user=user, cycle_day__isnull=False)
         .exclude(cycle_day=0)
         .order_by('-date')[:30]
@@ -375,26 +331,36 @@ def cycle_tracker(request):
             phase = ('Ovulatory', 'Peak energy; focus on strength and social connection.')
         else:
             phase = ('Luteal', 'Listen to your body; prioritize sleep and nourishment.')
-    context = {
-        'username': user.username,
+    return {
         'cycle_day': cycle_day,
         'phase': phase,
         'recent_logs': recent,
         'today_log': today_log,
     }
-    return render(request, 'tracker/cycle_tracker.html', context)
 
 
 @login_required
-def wellness(request):
-    """Wellness page – score, sleep, mood, tips."""
+def cycle_tracker(request):
+    """Cycle tracker page – cycle day, phase, recent logs."""
     user = request.user
     today = timezone.localdate()
-    today_log = DailyLog.objects.filter(user=user, date=today).first()
-    last_7 = (
+    context = {
+        **page_context('cycle_tracker', user.pk, today, lambda: _cycle_tracker_data(user, today)),
+        'username': user.username,
+    }
+    return render(request, 'tracker/cycle_tracker.html', context)
+
+
+def _rounded(value):
+    return round(value, 1) if value is not None else None
+
+
+def _wellness_data(user, today):
+    last_7 = list(
         DailyLog.objects.filter(user=user, date__lte=today)
         .order_by('-date')[:7]
     )
+    today_log = last_7[0] if last_7 and last_7[0].date == today else None
     wellness_score = today_log.wellness_score if today_log else None
     sleep_quality = today_log.sleep_quality if today_log else None
     mood = today_log.mood if today_log else None
@@ -403,61 +369,150 @@ def wellness(request):
         {'date': log.date, 'wellness': log.wellness_score, 'mood': log.mood, 'sleep': log.sleep_quality}
         for log in last_7
     ]
-    context = {
-        'username': user.username,
+    stats = DailyLogStats.for_user(user.pk, today)
+    return {
         'wellness_score': wellness_score,
         'sleep_quality': sleep_quality,
         'mood': mood,
         'mood_label': mood_label,
         'wellness_days': wellness_days,
+        'avg_wellness': _rounded(stats.average('wellness_score')),
+        'avg_sleep': _rounded(stats.average('sleep_quality')),
+        'avg_mood': _rounded(stats.average('mood')),
+    }
+
+
+@login_required
+def wellness(request):
+    """Wellness page – score, sleep, mood, tips."""
+    user = request.user
+    today = timezone.localdate()
+    context = {
+        **page_context('wellness', user.pk, today, lambda: _wellness_data(user, today)),
+        'username': user.username,
         'gemini_configured': bool(getattr(settings, 'GEMINI_API_KEY', '').strip()),
     }
     return render(request, 'tracker/wellness.html', context)
 
 
+def _insights_data(user, today):
+    # Averages over the last 7 days and the log count over 14, kept up to date by DailyLogStats.
+    # The weight & mood chart is fetched from /api/series/.
+    stats = DailyLogStats.for_user(user.pk, today)
+    return {
+        'avg_mood': _rounded(stats.average('mood')),
+        'avg_wellness': _rounded(stats.average('wellness_score')),
+        'avg_acne': _rounded(stats.average('acne_level')),
+        'avg_fatigue': _rounded(stats.average('fatigue_level')),
+        'log_count': stats.log_count(14),
+    }
+
+
+# Chart range choices on the insights page: (key of tracker.series.RANGES, button, chart title)
+INSIGHTS_RANGES = [
+    ('30d', '30 days', 'last 30 days'),
+    ('90d', '90 days', 'last 90 days'),
+    ('1y', '1 year', 'last year'),
+    ('all', 'All', 'all time'),
+]
+
+
 @login_required
 def insights(request):
     """Insights page – trends, symptom summary, charts."""
     user = request.user
     today = timezone.localdate()
-    last_14 = (
-        DailyLog.objects.filter(user=user, date__lte=today)
-        .order_by('-date')[:14]
-    )
-    last_14_list = list(last_14)
-    last_14_list.reverse()
-    # Chart data
-    chart_labels = [log.date.strftime('%d %b') for log in last_14_list]
-    chart_weight = [float(log.weight_kg) if log.weight_kg else None for log in last_14_list]
-    chart_mood = [log.mood if log.mood is not None else None for log in last_14_list]
-    chart_wellness = [log.wellness_score if log.wellness_score is not None else None for log in last_14_list]
-    # Averages (last 7 with data)
-    last_7 = last_14_list[-7:] if len(last_14_list) >= 7 else last_14_list
-    def avg(values): v = [x for x in values if x is not None]; return sum(v) / len(v) if v else None
-    avg_mood = avg([log.mood for log in last_7])
-    avg_wellness = avg([log.wellness_score for log in last_7])
-    avg_acne = avg([log.acne_level for log in last_7])
-    avg_fatigue = avg([log.fatigue_level for log in last_7])
-    log_count = len(last_14_list)
+    chart_range = request.GET.get('range', '30d')
+    if chart_range not in series.RANGES:
+        chart_range = '30d'
     context = {
+        **page_context('insights', user.pk, today, lambda: _insights_data(user, today)),
         'username': user.username,
-        'chart_labels': chart_labels,
-        'chart_weight': chart_weight,
-        'chart_mood': chart_mood,
-        'chart_wellness': chart_wellness,
-        'chart_labels_json': json.dumps(chart_labels),
-        'chart_weight_json': json.dumps(chart_weight),
-        'chart_mood_json': json.dumps(chart_mood),
-        'chart_wellness_json': json.dumps(chart_wellness),
-        'avg_mood': round(avg_mood, 1) if avg_mood is not None else None,
-        'avg_wellness': round(avg_wellness, 1) if avg_wellness is not None else None,
-        'avg_acne': round(avg_acne, 1) if avg_acne is not None else None,
-        'avg_fatigue': round(avg_fatigue, 1) if avg_fatigue is not None else None,
-        'log_count': log_count,
+        'chart_range': chart_range,
+        'chart_range_title': next(title for key, _, title in INSIGHTS_RANGES if key == chart_range),
+        'chart_ranges': INSIGHTS_RANGES,
     }
     return render(request, 'tracker/insights.html', context)
 
 
+def _series_version(request):
+    """The user's (data version, last write time), read once per request."""
+    if not hasattr(request, '_series_version'):
+        request._series_version = UserDataVersion.current(request.user.pk)
+    return request._series_version
+
+
+def _series_etag(request):
+    # The default range ends today, so the date is part of the validator
+    version, _ = _series_version(request)
+    return f'{request.user.pk}-{version}-{timezone.localdate().isoformat()}'
+
+
+def _series_last_modified(request):
+    _, changed_at = _series_version(request)
+    midnight = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    return max(changed_at, midnight) if changed_at else midnight
+
+
+@login_required
+@require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_series_etag, last_modified_func=_series_last_modified)
+def api_series(request):
+    """
+    Chart data as JSON: GET /api/series/?metrics=weight,mood plus range=30d|90d|1y|all,
+    days=N, or start=YYYY-MM-DD&end=YYYY-MM-DD (default: the last 14 days), and optionally points=N.
+    Returns {start, end, dates, labels, bucket_days, series: {metric: [...]}}, downsampled to at
+    most `points` points (see tracker.series).
+    ETag and Last-Modified come from the user's UserDataVersion, so a client revalidating unchanged
+    data gets a 304 without the series being rebuilt.
+    """
+    metrics = [m.strip() for m in request.GET.get('metrics', 'weight,mood').split(',') if m.strip()]
+    unknown = [m for m in metrics if m not in series.METRICS]
+    if not metrics or unknown:
+        return JsonResponse(
+            {'error': f"Unknown metric(s): {', '.join(unknown) or '(none)'}. Choose from {', '.join(series.METRICS)}."},
+            status=400,
+        )
+    range_name = request.GET.get('range')
+    if range_name is not None and range_name not in series.RANGES:
+        return JsonResponse({'error': f"Unknown range; choose from {', '.join(series.RANGES)}."}, status=400)
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        if range_name == 'all':
+            first = series.first_date(request.user.pk, metrics) or end
+            start = max(min(first, end), end - timedelta(days=series.MAX_DAYS - 1))
+        elif range_name:
+            start = end - timedelta(days=series.RANGES[range_name] - 1)
+        elif request.GET.get('start'):
+            start = date.fromisoformat(request.GET['start'])
+        else:
+            # Anything past MAX_DAYS is refused below; clamping keeps huge values out of timedelta
+            days = min(int(request.GET.get('days', 14)), series.MAX_DAYS + 1)
+            start = end - timedelta(days=days - 1)
+        points = min(int(request.GET.get('points', series.DEFAULT_POINTS)), series.MAX_POINTS)
+    except OverflowError:
+        # The range reaches back before date.min
+        return JsonResponse({'error': f'The range must be 1 to {series.MAX_DAYS} days.'}, status=400)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates, and days and points numbers.'}, status=400)
+    if start > end or (end - start).days >= series.MAX_DAYS:
+        return JsonResponse({'error': f'The range must be 1 to {series.MAX_DAYS} days.'}, status=400)
+    if points < 1:
+        return JsonResponse({'error': 'points must be at least 1.'}, status=400)
+    data = series.build_series(request.user.pk, metrics, start, end, points)
+    return JsonResponse({'start': start.isoformat(), 'end': end.isoformat(), **data})
+
+
+@staff_member_required
+def page_cache_stats(request):
+    """Staff-only debug view: this process's page cache hits, misses and hit rate per page."""
+    return JsonResponse({
+        'cache': getattr(settings, 'PAGE_CACHE_ALIAS', 'default'),
+        'pages': page_stats.snapshot(),
+    })
+
+
 # Diet plan: 7 days (Monday=Day1 .. Sunday=Day7). Each day has 7 slots.
 # Approximate macros per slot (protein_g, carbs_g, kcal) for chart.
 DIET_SLOT_MACROS = {
@@ -546,29 +601,10 @@ DIET_PLAN = [
 WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
 
-def send_notification_email(user, notification_type, subject, body_plain):
-    """
-    Send an email ONLY to the given user's email (user.email). No hardcoded addresses.
-    Use send_notification_if_enabled() to respect user preferences.
-    """
-    email = getattr(user, 'email', None) or ''
-    if not email or not email.strip():
-        return 0
-    try:
-        return send_mail(
-            subject=subject,
-            message=body_plain,
-            from_email=None,  # uses DEFAULT_FROM_EMAIL
-            recipient_list=[email.strip()],
-            fail_silently=False,
-        )
-    except Exception:
-        return 0
-
-
 def send_notification_if_enabled(user, notification_type, subject, body_plain):
     """
-    Send email to user only if they have enabled this notification type.
+    Queue an email to user only if they have enabled this notification type.
+    Delivery happens outside the request (manage.py deliver_outbox).
     notification_type: one of 'events_workshops', 'health_tips', 'app_updates',
     'breakfast_reminder', 'water_reminder', 'stretch_reminder', 'daily_log_reminder'
     """
@@ -589,7 +625,7 @@ def send_notification_if_enabled(user, notification_type, subject, body_plain):
         return 0
     if notification_type == 'daily_log_reminder' and not prefs.daily_log_reminder:
         return 0
-    return send_notification_email(user, notification_type, subject, body_plain)
+    return enqueue_notification(user, subject, body_plain)
 
 
 # --- AI Diet Agent (Gemini API) ---
@@ -657,24 +693,22 @@ SYSTEM_DIET_PROMPT_BASE = (
 def _build_wellness_ctx(user, for_support=False):
     """Build a bullet-format wellness context string from today's or latest DailyLog.
     When for_support=True, use a header that tells the model not to over-prioritize wellness data."""
-    today = timezone.localdate()
-    log = DailyLog.objects.filter(user=user, date=today).first()
-    if not log:
-        log = DailyLog.objects.filter(user=user).order_by("-date").first()
+    # Today's log, or else the latest one: kept on the user's DailyLogStats row
+    log = DailyLogStats.for_user(user.pk).latest_log()
     bullets = []
     if log:
-        mood_label = _mood_label_for_agent(log.mood)
+        mood_label = _mood_label_for_agent(log["mood"])
         bullets.append("Mood: " + mood_label)
-        if log.wellness_score is not None:
-            bullets.append("Wellness score: " + str(log.wellness_score) + "%")
-        if log.sleep_quality is not None:
-            bullets.append("Sleep: " + str(log.sleep_quality) + "/10")
-        if getattr(log, "steps", None) is not None:
-            bullets.append("Steps: " + str(log.steps))
-        if getattr(log, "water_glasses", None) is not None:
-            bullets.append("Water: " + str(log.water_glasses) + " glasses")
-        if getattr(log, "cycle_day", None) is not None:
-            bullets.append("Cycle day: " + str(log.cycle_day))
+        if log["wellness_score"] is not None:
+            bullets.append("Wellness score: " + str(log["wellness_score"]) + "%")
+        if log["sleep_quality"] is not None:
+            bullets.append("Sleep: " + str(log["sleep_quality"]) + "/10")
+        if log["steps"] is not None:
+            bullets.append("Steps: " + str(log["steps"]))
+        if log["water_glasses"] is not None:
+            bullets.append("Water: " + str(log["water_glasses"]) + " glasses")
+        if log["cycle_day"] is not None:
+            bullets.append("Cycle day: " + str(log["cycle_day"]))
     else:
         bullets.append("Mood: not logged today")
     header = (
@@ -698,72 +732,114 @@ def _mood_label_for_agent(mood_value):
     return "calm / moderate"
 
 
-def _call_gemini(user_message, system_instruction, api_key, history=None, max_output_tokens=1024):
-    """Call Gemini generateContent API. Returns (reply_text, error_message)."""
-    if not api_key or not api_key.strip():
-        logger.error("Gemini API key is missing or empty. Check GEMINI_API_KEY in environment/.env.")
-        return None, "AI is not configured. Add GEMINI_API_KEY to your .env file."
-    key = api_key.strip()
-    # Use single-turn format: one user message with system context in the prompt (most reliable)
-    prompt_parts = []
-    if system_instruction:
-        prompt_parts.append(system_instruction)
-    if history:
-        prompt_parts.append("\n\nRecent conversation:")
-        for h in history[-6:]:
-            who = "User" if h.get("role") == "user" else "Assistant"
-            text = (h.get("content") or "").strip()
+DIET_PLAN_START_MARKER = "---DIET_PLAN_JSON_START---"
+DIET_PLAN_END_MARKER = "---DIET_PLAN_JSON_END---"
+
+
+def _split_plan_block(reply_text):
+    """
+    If the reply contains a valid diet plan JSON block, return (reply without the block, plan);
+    otherwise (reply_text, None).
+    """
+    start_idx = reply_text.find(DIET_PLAN_START_MARKER)
+    end_idx = reply_text.find(DIET_PLAN_END_MARKER, start_idx + 1) if start_idx != -1 else -1
+    if end_idx == -1:
+        return reply_text, None
+    plan, _ = extract_plan(reply_text, start_idx + len(DIET_PLAN_START_MARKER), end_idx)
+    if plan is None:
+        return reply_text, None
+    # Strip the JSON block from display, keeping a line break between the text around it
+    # as the streamed deltas (_PlanBlockFilter) showed it
+    parts = (reply_text[:start_idx].strip(), reply_text[end_idx + len(DIET_PLAN_END_MARKER) :].strip())
+    return "\n".join(part for part in parts if part), plan
+
+
+class _PlanBlockFilter:
+    """
+    Pass streamed reply text through for display, holding back the diet plan JSON block.
+    Text that might be the beginning of a marker split across chunks is kept until the
+    next chunk decides it.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.in_block = False
+
+    def feed(self, chunk):
+        self.pending += chunk
+        shown = []
+        while True:
+            marker = DIET_PLAN_END_MARKER if self.in_block else DIET_PLAN_START_MARKER
+            idx = self.pending.find(marker)
+            if idx == -1:
+                keep = _partial_marker_len(self.pending, marker)
+                if not self.in_block:
+                    shown.append(self.pending[: len(self.pending) - keep])
+                self.pending = self.pending[len(self.pending) - keep :]
+                return "".join(shown)
+            if not self.in_block:
+                shown.append(self.pending[:idx])
+            self.pending = self.pending[idx + len(marker) :]
+            self.in_block = not self.in_block
+
+    def flush(self):
+        text = "" if self.in_block else self.pending
+        self.pending = ""
+        return text
+
+
+def _partial_marker_len(text, marker):
+    """Length of the longest suffix of text that is a proper prefix of marker."""
+    for n in range(min(len(text), len(marker) - 1), 0, -1):
+        if marker.startswith(text[-n:]):
+            return n
+    return 0
+
+
+def _wants_event_stream(request):
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _chat_events(message, system_instruction, api_key, history, endpoint, extract_plan=False):
+    """
+    Server-sent events for one streamed chat reply: a 'delta' event per chunk of display text,
+    then 'done' with the full { reply, plan? } (same shape as the JSON response) or 'error'.
+    """
+    plan_filter = _PlanBlockFilter() if extract_plan else None
+    chunks = []
+    try:
+        async for chunk in astream_gemini(message, system_instruction, api_key, history, endpoint=endpoint):
+            chunks.append(chunk)
+            text = plan_filter.feed(chunk) if plan_filter else chunk
             if text:
-                prompt_parts.append(f"\n{who}: {text}")
-    prompt_parts.append("\n\nUser: " + user_message)
-    prompt_parts.append("\n\nAssistant:")
-    full_prompt = "".join(prompt_parts)
-    payload = {
-        "contents": [{"parts": [{"text": full_prompt}]}],
-        "generationConfig": {"temperature": 0.7, "maxOutputTokens": max_output_tokens},
-    }
-    body = json.dumps(payload).encode("utf-8")
-    # Prefer Gemma 3 12B; fallback to Gemini Flash models (all v1beta)
-    for model in (      "gemini-2.5-flash", "gemini-3-flash-preview", "gemini-2.5-flash", "gemini-2.0-flash", "gemini-1.5-flash"):
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
-        req = urllib.request.Request(url, data=body, method="POST")
-        req.add_header("Content-Type", "application/json")
-        try:
-            logger.debug("Calling Gemini model %s", model)
-            with urllib.request.urlopen(req, timeout=90) as resp:
-                data = json.loads(resp.read().decode("utf-8"))
-            logger.debug("Gemini model %s responded successfully", model)
-            for c in data.get("candidates", []):
-                for p in c.get("content", {}).get("parts", []):
-                    if "text" in p:
-                        return p["text"].strip(), None
-            logger.error("Gemini model %s returned no text candidates.", model)
-            return None, "No reply from the model."
-        except urllib.error.HTTPError as e:
-            err_body = ""
-            try:
-                if e.fp:
-                    err_body = e.read().decode("utf-8", errors="replace")
-            except Exception:
-                pass
-            err_snippet = (err_body[:400] if err_body else str(e))
-            logger.error(
-                "Gemini HTTPError for model %s (status %s): %s",
-                model,
-                e.code,
-                err_snippet,
-            )
-            if e.code == 404:
-                continue
-            return None, f"API error ({e.code}): {err_snippet}"
-        except Exception as e:
-            logger.exception("Error calling Gemini model %s: %s", model, e)
-            return None, str(e)
-    logger.error(
-        "API error: no supported Gemini model responded successfully. "
-        "Tried models: gemma-3-12b-it, gemini-3-flash-preview, gemini-2.5-flash, gemini-2.0-flash, gemini-1.5-flash."
-    )
-    return None, "API error: no supported model found. Try gemini-2.0-flash or gemini-1.5-flash in Google AI Studio."
+                yield _sse("delta", {"text": text})
+    except GeminiError as e:
+        yield _sse("error", {"error": str(e)})
+        return
+    if plan_filter:
+        tail = plan_filter.flush()
+        if tail:
+            yield _sse("delta", {"text": tail})
+    reply_text = "".join(chunks).strip()
+    payload = {"reply": reply_text}
+    if extract_plan:
+        reply_display, plan = _split_plan_block(reply_text)
+        payload["reply"] = reply_display
+        if plan is not None:
+            payload["plan"] = plan
+    yield _sse("done", payload)
+
+
+def _event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Tell nginx not to buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 @login_required
@@ -782,19 +858,45 @@ def ai_diet_agent(request):
         mood_val = latest.mood if latest else None
         mood_label = _mood_label_for_agent(mood_val)
         has_log_today = False
+    # Resume a running "Generate my diet plan" job, or re-offer today's finished plan after a reload
+    _fail_stale_diet_plan_jobs(user)
+    job = (
+        DietPlanJob.objects.filter(user=user, created_at__date=today, imported_at__isnull=True)
+        .exclude(status=DietPlanJob.STATUS_FAILED)
+        .first()
+    )
+    diet_plan_job = None
+    if job is not None:
+        diet_plan_job = job.as_dict()
+        diet_plan_job["status_url"] = reverse("tracker:diet_plan_job_status", args=[job.pk])
     return render(request, "tracker/ai_diet_agent.html", {
         "username": user.username,
         "mood": mood_val,
         "mood_label": mood_label,
         "has_log_today": has_log_today,
         "gemini_configured": bool(getattr(settings, "GEMINI_API_KEY", "").strip()),
+        "diet_plan_job": diet_plan_job,
     })
 
 
+@staff_member_required
+def ai_model_health(request):
+    """
+    Staff-only debug view: this process's Gemini model registry (cooldowns, latency EWMA, try order)
+    and single-flight counters.
+    """
+    state = model_health.snapshot()
+    state["single_flight"] = flights.snapshot()
+    return JsonResponse(state)
+
+
 @login_required
 @require_http_methods(["POST"])
-def pcod_support_chat(request):
-    """POST: JSON { message: string, history?: [{role, content}] }. Returns { reply: string } or { error: string }."""
+async def pcod_support_chat(request):
+    """
+    POST: JSON { message: string, history?: [{role, content}] }. Returns { reply: string } or { error: string }.
+    With Accept: text/event-stream the reply is streamed as server-sent events (see _chat_events).
+    """
     try:
         body = json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -807,11 +909,19 @@ def pcod_support_chat(request):
     history = body.get("history")
     if history is not None and not isinstance(history, list):
         history = None
-    user = request.user
-    wellness_ctx = _build_wellness_ctx(user, for_support=True)
+    user = await request.auser()
+    # Invalid requests are refused above without spending the user's quota
+    limited = await quota_exceeded(user, "pcod_support_chat")
+    if limited:
+        return limited
+    wellness_ctx = await sync_to_async(_build_wellness_ctx)(user, for_support=True)
     system_instruction = SYSTEM_SUPPORT_PROMPT_BASE + "\n\n" + wellness_ctx
     api_key = getattr(settings, "GEMINI_API_KEY", "") or ""
-    reply_text, err = _call_gemini(message, system_instruction, api_key, history)
+    if _wants_event_stream(request):
+        return _event_stream_response(
+            _chat_events(message, system_instruction, api_key, history, "pcod_support_chat")
+        )
+    reply_text, err = await acall_gemini(message, system_instruction, api_key, history, endpoint="pcod_support_chat")
     if err:
         return JsonResponse({"error": err}, status=503)
     return JsonResponse({"reply": reply_text})
@@ -819,8 +929,12 @@ def pcod_support_chat(request):
 
 @login_required
 @require_http_methods(["POST"])
-def diet_planner_chat(request):
-    """POST: JSON { message: string, history?: [{role, content}] }. Returns { reply: string } or { error: string }."""
+async def diet_planner_chat(request):
+    """
+    POST: JSON { message: string, history?: [{role, content}] }. Returns { reply: string, plan? } or { error: string }.
+    With Accept: text/event-stream the reply is streamed as server-sent events; the plan JSON block
+    is kept out of the streamed text and sent in the final 'done' event.
+    """
     try:
         body = json.loads(request.body.decode("utf-8"))
     except Exception:
@@ -833,16 +947,16 @@ def diet_planner_chat(request):
     history = body.get("history")
     if history is not None and not isinstance(history, list):
         history = None
-    user = request.user
-    wellness_ctx = _build_wellness_ctx(user)
-    preference_parts = []
+    user = await request.auser()
+    # Invalid requests are refused above without spending the user's quota
+    limited = await quota_exceeded(user, "diet_planner_chat")
+    if limited:
+        return limited
+    wellness_ctx = await sync_to_async(_build_wellness_ctx)(user)
     last_user_text = (body.get("last_user_text") or "").strip()
     last_assistant_text = (body.get("last_assistant_text") or "").strip()
-    if last_user_text:
-        preference_parts.append("User's latest request/preference: " + last_user_text)
-    if last_assistant_text:
-        preference_parts.append("Assistant's last reply: " + last_assistant_text)
-    preference_ctx = " ".join(preference_parts) if preference_parts else ""
+    # The last reply is usually already the last history turn; don't send it twice
+    preference_ctx = preference_context(last_user_text, last_assistant_text, history)
     system_instruction = (
         SYSTEM_DIET_PROMPT_BASE + "\n\n" + wellness_ctx +
         " Consider mood, sleep and wellness when suggesting foods or habits. "
@@ -850,36 +964,15 @@ def diet_planner_chat(request):
     if preference_ctx:
         system_instruction += "\n\nStrictly respect when shaping the plan: " + preference_ctx
     api_key = getattr(settings, "GEMINI_API_KEY", "") or ""
-    reply_text, err = _call_gemini(message, system_instruction, api_key, history)
+    if _wants_event_stream(request):
+        return _event_stream_response(
+            _chat_events(message, system_instruction, api_key, history, "diet_planner_chat", extract_plan=True)
+        )
+    reply_text, err = await acall_gemini(message, system_instruction, api_key, history, endpoint="diet_planner_chat")
     if err:
         return JsonResponse({"error": err}, status=503)
     # If reply contains a diet plan JSON block, extract it and return for "Insert to my plan"
-    reply_display = reply_text
-    plan = None
-    start_marker = "---DIET_PLAN_JSON_START---"
-    end_marker = "---DIET_PLAN_JSON_END---"
-    if start_marker in reply_text and end_marker in reply_text:
-        try:
-            start_idx = reply_text.index(start_marker) + len(start_marker)
-            end_idx = reply_text.index(end_marker)
-            json_str = reply_text[start_idx:end_idx].strip()
-            plan = json.loads(json_str)
-            if isinstance(plan, dict) and isinstance(plan.get("slots"), list) and plan["slots"]:
-                for slot in plan["slots"]:
-                    if isinstance(slot, dict):
-                        slot.setdefault("protein_g", 0)
-                        slot.setdefault("carbs_g", 0)
-                        slot.setdefault("calories_kcal", 0)
-                # Strip the JSON block from display
-                reply_display = (
-                    reply_text[: reply_text.index(start_marker)].strip() +
-                    reply_text[reply_text.index(end_marker) + len(end_marker) :].strip()
-                )
-                reply_display = reply_display.strip()
-            else:
-                plan = None
-        except (json.JSONDecodeError, ValueError):
-            plan = None
+    reply_display, plan = _split_plan_block(reply_text)
     payload = {"reply": reply_display}
     if plan is not None:
         payload["plan"] = plan
@@ -900,50 +993,41 @@ def diet_plan_import(request):
     plan = body.get("plan")
     if not isinstance(plan, dict):
         return JsonResponse({"error": "Missing or invalid 'plan' object."}, status=400)
-    slots = plan.get("slots")
-    if not isinstance(slots, list) or not slots:
-        return JsonResponse({"error": "Plan must contain a non-empty 'slots' list."}, status=400)
-    # Minimal per-slot validation
-    for idx, slot in enumerate(slots):
-        if not isinstance(slot, dict):
-            return JsonResponse({"error": f"Slot {idx} is not an object."}, status=400)
-        if "time" not in slot or "label" not in slot or "description" not in slot:
-            return JsonResponse({"error": f"Slot {idx} is missing required fields."}, status=400)
-        slot.setdefault("protein_g", 0)
-        slot.setdefault("carbs_g", 0)
-        slot.setdefault("calories_kcal", 0)
+    plan, err = validate_plan(plan)
+    if err:
+        return JsonResponse({"error": err}, status=400)
+    slots = plan["slots"]
     note = (body.get("note") or "").strip() if isinstance(body.get("note"), str) else ""
     today = timezone.localdate()
     checked = [False] * len(slots)
     DietDayLog.objects.update_or_create(
         user=request.user,
         date=today,
-        defaults={"plan": plan, "note": note, "checked": checked},
+        defaults={"plan": plan, "note": note, "checked": checked, "pending_plan": None, "pending_generated_at": None},
     )
+    # A plan from a background job is no longer offered on the AI Diet Agent page once inserted
+    job_id = body.get("job_id")
+    if isinstance(job_id, str) and job_id:
+        try:
+            DietPlanJob.objects.filter(pk=job_id, user=request.user).update(imported_at=timezone.now())
+        except ValidationError:
+            pass
     return JsonResponse({"ok": True})
 
 
-@login_required
-@require_http_methods(["POST"])
-def diet_plan_generate(request):
+# Long-poll limits for diet_plan_job_status
+DIET_PLAN_JOB_MAX_WAIT = 30
+DIET_PLAN_JOB_POLL_SECONDS = 0.5
+
+
+def generate_diet_plan(user, last_user_text="", last_assistant_text="", day=None):
     """
-    Generate a fresh AI diet plan (JSON only) and return it. Does not store in session;
-    user must click "Insert this to my plan" in the chat to save. Returns { "ok": True, "plan": plan }.
+    Generate a fresh full-day AI diet plan (JSON only) for user, from their wellness context.
+    day defaults to today (pregenerate_diet_plans asks for tomorrow's plan).
+    Blocking; runs in a background job. Returns (plan, None) or (None, error_message).
     """
-    user = request.user
-    try:
-        body = json.loads(request.body.decode("utf-8"))
-    except Exception:
-        body = {}
-    last_user_text = (body.get("last_user_text") or "").strip()
-    last_assistant_text = (body.get("last_assistant_text") or "").strip()
     wellness_ctx = _build_wellness_ctx(user)
-    preference_parts = []
-    if last_user_text:
-        preference_parts.append("User's latest request/preference: " + last_user_text)
-    if last_assistant_text:
-        preference_parts.append("Assistant's last reply: " + last_assistant_text)
-    preference_ctx = " ".join(preference_parts) if preference_parts else ""
+    preference_ctx = preference_context(last_user_text, last_assistant_text)
 
     api_key = getattr(settings, "GEMINI_API_KEY", "") or ""
     system_instruction = (
@@ -959,82 +1043,148 @@ def diet_plan_generate(request):
         "CRITICAL: Return ONLY valid JSON starting with { and ending with }. "
         "Do not wrap in markdown code blocks. Do not add any text before or after the JSON."
     )
-    # Simple message; full prompt is built inside _call_gemini
+    # Simple message; full prompt is built inside call_gemini
     # Use higher token limit so full diet plan JSON is not truncated
-    message = "Generate today's full-day diet plan as JSON."
-    reply_text, err = _call_gemini(
-        message, system_instruction, api_key, history=None, max_output_tokens=8192
+    today = timezone.localdate()
+    if day is None or day == today:
+        message = "Generate today's full-day diet plan as JSON."
+    elif day == today + timedelta(days=1):
+        message = "Generate tomorrow's full-day diet plan as JSON."
+    else:
+        message = f"Generate the full-day diet plan for {day:%A, %d %B} as JSON."
+    reply_text, err = call_gemini(
+        message, system_instruction, api_key, history=None, max_output_tokens=8192, endpoint="diet_plan_generate"
     )
     if err:
-        return JsonResponse({"error": err}, status=503)
-    # Try to extract the JSON object from the reply (model may add extra text or markdown)
-    plan = None
-    json_str = None
-    
-    # First, try to extract JSON from markdown code blocks (```json ... ```)
-    json_block_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', reply_text, re.DOTALL)
-    if json_block_match:
-        json_str = json_block_match.group(1)
-        try:
-            plan = json.loads(json_str)
-        except json.JSONDecodeError:
-            json_str = None
-    
-    # If no code block found, try to find JSON between first { and last }
-    if json_str is None:
-        try:
-            json_start = reply_text.index("{")
-            json_end = reply_text.rindex("}") + 1
-            json_str = reply_text[json_start:json_end]
-            plan = json.loads(json_str)
-        except (ValueError, json.JSONDecodeError):
-            # Try to find any JSON-like structure
-            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', reply_text, re.DOTALL)
-            if json_match:
-                try:
-                    json_str = json_match.group(0)
-                    plan = json.loads(json_str)
-                except json.JSONDecodeError:
-                    pass
-    
+        return None, err
+    # The model may still wrap the JSON in prose or a code fence
+    plan, plan_err = extract_plan(reply_text)
     if plan is None:
-        return JsonResponse({
-            "error": "Model did not return valid JSON. Response: " + reply_text[:200]
-        }, status=502)
-    # Reuse the same validation/storage logic as import
-    if not isinstance(plan, dict):
-        return JsonResponse({"error": "Returned plan is not a JSON object."}, status=502)
-    slots = plan.get("slots")
-    if not isinstance(slots, list) or not slots:
-        return JsonResponse({"error": "Returned plan must contain a non-empty 'slots' list."}, status=502)
-    for idx, slot in enumerate(slots):
-        if not isinstance(slot, dict):
-            return JsonResponse({"error": f"Slot {idx} is not an object."}, status=502)
-        if "time" not in slot or "label" not in slot or "description" not in slot:
-            return JsonResponse({"error": f"Slot {idx} is missing required fields."}, status=502)
-        slot.setdefault("protein_g", 0)
-        slot.setdefault("carbs_g", 0)
-        slot.setdefault("calories_kcal", 0)
-    # Return plan to frontend; do not store until user clicks "Insert this to my plan"
-    return JsonResponse({"ok": True, "plan": plan})
-
-
-def _totals_from_plan_slots(slots, checked):
-    """Compute protein, carbs, energy totals from plan slots using checked list."""
-    total_protein = total_carbs = total_energy = 0
-    if not slots or not isinstance(checked, list):
-        return 0, 0, 0
-    for idx, slot in enumerate(slots):
-        if idx < len(checked) and checked[idx] and isinstance(slot, dict):
-            total_protein += float(slot.get("protein_g", 0) or 0)
-            total_carbs += float(slot.get("carbs_g", 0) or 0)
-            total_energy += float(slot.get("calories_kcal", 0) or 0)
-    return total_protein, total_carbs, total_energy
+        return None, plan_err or "Model did not return valid JSON. Response: " + reply_text[:200]
+    return plan, None
+
+
+def _run_diet_plan_job(job_id):
+    """Worker-thread body of a DietPlanJob: generate the plan and store the outcome on the row."""
+    now = timezone.now()
+    claimed = DietPlanJob.objects.filter(pk=job_id, status=DietPlanJob.STATUS_QUEUED).update(
+        status=DietPlanJob.STATUS_RUNNING, started_at=now,
+    )
+    if not claimed:
+        return
+    job = DietPlanJob.objects.select_related("user").get(pk=job_id)
+    try:
+        plan, err = generate_diet_plan(job.user, job.last_user_text, job.last_assistant_text)
+    except Exception as e:
+        logger.exception("Diet plan job %s failed", job_id)
+        plan, err = None, "Could not generate a diet plan: " + str(e)
+    DietPlanJob.objects.filter(pk=job_id).update(
+        status=DietPlanJob.STATUS_DONE if plan is not None else DietPlanJob.STATUS_FAILED,
+        plan=plan,
+        error=err or "",
+        finished_at=timezone.now(),
+    )
+
+
+def _fail_stale_diet_plan_jobs(user):
+    """Mark the user's jobs that have been active longer than DIET_PLAN_JOB_TIMEOUT as failed (worker died)."""
+    DietPlanJob.objects.filter(
+        user=user,
+        status__in=DietPlanJob.ACTIVE_STATUSES,
+        created_at__lt=timezone.now() - timedelta(seconds=jobs.job_timeout()),
+    ).update(status=DietPlanJob.STATUS_FAILED, error="The plan took too long. Please try again.", finished_at=timezone.now())
+
+
+def _active_diet_plan_job(user):
+    """The user's queued or running job, or None (stale jobs are failed first)."""
+    _fail_stale_diet_plan_jobs(user)
+    return DietPlanJob.objects.filter(user=user, status__in=DietPlanJob.ACTIVE_STATUSES).first()
+
+
+def _start_diet_plan_job(user, last_user_text, last_assistant_text):
+    """Return the user's active job (double clicks share it) or queue a new one."""
+    job = _active_diet_plan_job(user)
+    if job is None:
+        job = DietPlanJob.objects.create(
+            user=user, last_user_text=last_user_text, last_assistant_text=last_assistant_text,
+        )
+        jobs.submit(_run_diet_plan_job, job.pk)
+    return job
 
 
 @login_required
 @require_http_methods(["POST"])
-def find_order_options(request):
+async def diet_plan_generate(request):
+    """
+    Start generating a fresh AI diet plan in the background and return at once with
+    202 { "ok": True, "job_id", "status", "status_url" }. Poll status_url (diet_plan_job_status)
+    for the plan. If today's plan was pre-generated overnight and the user has not asked for
+    anything specific, return it straight away: 200 { "ok": True, "status": "done", "plan" }. Nothing is stored in the diet plan until the user clicks "Insert this to my plan".
+    Only a newly queued job takes a token from the plan quota; invalid bodies, the pre-generated
+    plan and a job that is already running are free.
+    """
+    user = await request.auser()
+    try:
+        body = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    last_user_text = (body.get("last_user_text") or "").strip()
+    last_assistant_text = (body.get("last_assistant_text") or "").strip()
+    if len(last_user_text) > 2000:
+        return JsonResponse({"error": "Message too long."}, status=400)
+    if not last_user_text:
+        # Plan pre-generated overnight (pregenerate_diet_plans): one read, no model call.
+        # A specific request from the chat always gets a fresh plan.
+        pending = await (
+            DietDayLog.objects.filter(user=user, date=timezone.localdate(), pending_plan__isnull=False)
+            .values_list("pending_plan", flat=True)
+            .afirst()
+        )
+        if pending:
+            return JsonResponse({"ok": True, "job_id": None, "status": DietPlanJob.STATUS_DONE, "plan": pending})
+    job = await sync_to_async(_active_diet_plan_job)(user)
+    if job is None:
+        limited = await quota_exceeded(user, "diet_plan_generate")
+        if limited:
+            return limited
+        job = await sync_to_async(_start_diet_plan_job)(user, last_user_text, last_assistant_text)
+    payload = job.as_dict()
+    payload["ok"] = True
+    payload["status_url"] = reverse("tracker:diet_plan_job_status", args=[job.pk])
+    return JsonResponse(payload, status=202)
+
+
+@login_required
+@require_http_methods(["GET"])
+async def diet_plan_job_status(request, job_id):
+    """
+    GET: { job_id, status: queued|running|done|failed, plan? , error? } for one of the user's jobs.
+    ?wait=N long-polls: holds the request up to N seconds (max 30) until the job finishes.
+    """
+    user = await request.auser()
+    try:
+        wait = min(max(float(request.GET.get("wait", 0)), 0), DIET_PLAN_JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    deadline = time.monotonic() + wait
+    while True:
+        job = await DietPlanJob.objects.filter(pk=job_id, user=user).afirst()
+        if job is None:
+            return JsonResponse({"error": "Job not found."}, status=404)
+        if job.status not in DietPlanJob.ACTIVE_STATUSES or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(DIET_PLAN_JOB_POLL_SECONDS)
+    if job.status in DietPlanJob.ACTIVE_STATUSES:
+        await sync_to_async(_fail_stale_diet_plan_jobs)(user)
+        job = await DietPlanJob.objects.aget(pk=job_id)
+    return JsonResponse(job.as_dict())
+
+
+@login_required
+@require_http_methods(["POST"])
+async def find_order_options(request):
     """
     Find online ordering options for a dish within a price range.
     Expects JSON: { "dish_name": str, "description": str (optional), "price_range": str }
@@ -1056,7 +1206,9 @@ def find_order_options(request):
         "mid-range": "₹200 - ₹500 (good quality, mid-range options)",
         "premium": "₹500+ (high-quality, premium options)",
     }
-    price_desc = price_descriptions.get(price_range, price_descriptions["mid-range"])
+    if price_range not in price_descriptions:
+        price_range = "mid-range"
+    price_desc = price_descriptions[price_range]
     
     # Build prompt for ordering information
     prompt = f"Where can I order '{dish_name}'"
@@ -1073,7 +1225,12 @@ def find_order_options(request):
     )
     
     api_key = getattr(settings, "GEMINI_API_KEY", "") or ""
-    options_text, err = _call_gemini(prompt, system_instruction, api_key, history=None)
+    # Same dish + price range for any user -> served from the shared cache (the prompt holds no user data)
+    options_text, err = await cached_reply(
+        AIResponseCache.ENDPOINT_ORDER_OPTIONS, dish_name, description, price_range,
+        lambda: acall_gemini(prompt, system_instruction, api_key, history=None, endpoint="find_order_options"),
+        context=system_instruction,
+    )
     
     if err:
         return JsonResponse({"error": err}, status=503)
@@ -1082,7 +1239,7 @@ def find_order_options(request):
 
 @login_required
 @require_http_methods(["POST"])
-def generate_recipe(request):
+async def generate_recipe(request):
     """
     Generate a recipe for a specific dish.
     Expects JSON: { "dish_name": str, "description": str (optional) }
@@ -1110,7 +1267,12 @@ def generate_recipe(request):
     )
     
     api_key = getattr(settings, "GEMINI_API_KEY", "") or ""
-    recipe_text, err = _call_gemini(prompt, system_instruction, api_key, history=None)
+    # Same dish for any user -> served from the shared cache (the prompt holds no user data)
+    recipe_text, err = await cached_reply(
+        AIResponseCache.ENDPOINT_RECIPE, dish_name, description, "",
+        lambda: acall_gemini(prompt, system_instruction, api_key, history=None, endpoint="generate_recipe"),
+        context=system_instruction,
+    )
     
     if err:
         return JsonResponse({"error": err}, status=503)
@@ -1120,8 +1282,8 @@ def generate_recipe(request):
 @login_required
 def diet_plan(request):
     """
-    Diet plan page: shows the AI-generated plan from the database,
-    with tickable slots and Protein/Carbs/Energy charts. Data is loaded from DietDayLog (plan/note/checked).
+    Diet plan page: shows the AI-generated plan from the database, with tickable slots.
+    Data is loaded from DietDayLog (plan/note/checked); the Protein/Carbs/Energy charts fetch /api/series/.
     """
     user = request.user
     today = timezone.localdate()
@@ -1161,37 +1323,6 @@ def diet_plan(request):
         obj.save(update_fields=["checked"])
         return redirect("tracker:diet_plan")
 
-    # Totals for the displayed plan (for pie chart / today bar)
-    total_protein, total_carbs, total_energy = _totals_from_plan_slots(slots, checked)
-
-    # 7-day bar chart from database: for each of last 7 days, get DietDayLog with plan and compute totals
-    labels = []
-    protein_series = []
-    carbs_series = []
-    energy_series = []
-    plan_by_date = {}
-    for p in DietDayLog.objects.filter(user=user, date__gte=today - timedelta(days=6), date__lte=today).exclude(plan__isnull=True):
-        slots_p = p.plan.get("slots", []) if isinstance(p.plan, dict) else []
-        checked_p = p.checked if isinstance(p.checked, list) else []
-        plan_by_date[p.date] = _totals_from_plan_slots(slots_p, checked_p)
-    for offset in range(6, -1, -1):
-        day = today - timedelta(days=offset)
-        labels.append(day.strftime("%d %b"))
-        totals = plan_by_date.get(day, (0, 0, 0))
-        protein_series.append(totals[0])
-        carbs_series.append(totals[1])
-        energy_series.append(totals[2])
-    # Ensure today's bar uses current page totals (in case we just loaded and haven't re-queried)
-    if obj.date == today:
-        protein_series[6] = total_protein
-        carbs_series[6] = total_carbs
-        energy_series[6] = total_energy
-
-    chart_labels_json = json.dumps(labels)
-    chart_protein_json = json.dumps(protein_series)
-    chart_carbs_json = json.dumps(carbs_series)
-    chart_energy_json = json.dumps(energy_series)
-
     slots_with_state = list(zip(slots, checked))
     context = {
         "username": user.username,
@@ -1200,9 +1331,5 @@ def diet_plan(request):
         "plan": plan,
         "plan_note": plan_note,
         "slots_with_state": slots_with_state,
-        "chart_labels_json": chart_labels_json,
-        "chart_protein_json": chart_protein_json,
-        "chart_carbs_json": chart_carbs_json,
-        "chart_energy_json": chart_energy_json,
     }
     return render(request, "tracker/diet_plan.html", context)